@@ -0,0 +1,339 @@
+"""
+Per-round aggregates (round_summary, round_payouts) and the study-wide
+queries built on them.
+
+round_summary is written once per (session, round), in the transaction that
+settles the round: one row for the whole group (ptype 0) and one per player
+type present. Besides the A/B counts it stores sums and sums of squares of
+the payouts and of the decision times, so means and variances can be pooled
+across sessions with plain SUM()s. round_payouts holds the payout histogram
+of the round per player type. Readers never scan decisions.
+
+Decision time is measured from the moment the round opened for the group
+(round_progress.opened_at: the last join for round 1, the last "ready" of
+the previous round after that; see open_round) to decisions.created_at.
+Rounds without an opening time (settled before it was recorded) have no
+decision times, and a decision stamped before its round opened (clock
+skew) is left out rather than counted as zero.
+
+The admin analytics API (VIEWS) is served through AggregateCache, which the
+app clears whenever a round is settled or a session archived, reset or
+deleted.
+"""
+import collections
+import datetime
+import threading
+
+ALL_TYPES = 0   # ptype value of the whole-group row
+
+SUMMARY_COLUMNS = ("session_id", "round_number", "ptype", "group_size", "n", "a_count", "b_count",
+                   "payout_sum", "payout_sumsq", "payout_mean", "payout_var",
+                   "decide_n", "decide_sum", "decide_sumsq", "decide_max", "created_at")
+
+
+def _moments(values):
+    n = len(values)
+    total = sum(values)
+    sumsq = sum(x * x for x in values)
+    mean = total / n if n else None
+    var = max(sumsq / n - mean * mean, 0.0) if n else None
+    return total, sumsq, mean, var
+
+
+def _ts(s):
+    try:
+        return datetime.datetime.fromisoformat((s or "").replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def open_round(cursor, sid, r, at):
+    """Record that round `r` became available to the whole group at `at` (first call wins)."""
+    cursor.execute(
+        "INSERT INTO round_progress (session_id, round_number, decided, opened_at) VALUES (%s,%s,0,%s) "
+        "ON DUPLICATE KEY UPDATE opened_at = COALESCE(opened_at, VALUES(opened_at))",
+        (sid, r, at)
+    )
+
+
+def _round_start(cursor, sid, r):
+    cursor.execute(
+        "SELECT opened_at AS t FROM round_progress WHERE session_id=%s AND round_number=%s",
+        (sid, r)
+    )
+    row = cursor.fetchone()
+    return _ts(row["t"]) if row else None
+
+
+def write_round_summary(cursor, sid, r, at):
+    """Materialize the aggregates of settled round `r` (idempotent)."""
+    cursor.execute(
+        """SELECT d.choice, d.payout, d.created_at, p.ptype, s.group_size
+           FROM decisions d
+           JOIN participants p ON p.id=d.participant_id
+           JOIN sessions s ON s.id=d.session_id
+           WHERE d.session_id=%s AND d.round_number=%s""",
+        (sid, r)
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return
+    groups = {ALL_TYPES: rows}
+    for row in rows:
+        groups.setdefault(row["ptype"] or 1, []).append(row)
+    group_size = rows[0]["group_size"]
+    start = _round_start(cursor, sid, r)
+
+    values, histogram = [], []
+    for ptype, members in sorted(groups.items()):
+        payouts = [float(m["payout"]) for m in members if m["payout"] is not None]
+        total, sumsq, mean, var = _moments(payouts)
+        secs = []
+        if start:
+            for m in members:
+                t = _ts(m["created_at"])
+                if t and t >= start:
+                    secs.append((t - start).total_seconds())
+        d_total, d_sumsq, _, _ = _moments(secs)
+        a = sum(1 for m in members if m["choice"] == "A")
+        values.append((sid, r, ptype, group_size, len(members), a, len(members) - a,
+                       total, sumsq, mean, var,
+                       len(secs), d_total, d_sumsq, max(secs, default=None), at))
+        if ptype != ALL_TYPES:
+            for payout in sorted(set(payouts)):
+                histogram.append((sid, r, ptype, group_size, payout, payouts.count(payout)))
+    cursor.executemany(
+        f"REPLACE INTO round_summary ({','.join(SUMMARY_COLUMNS)}) "
+        f"VALUES ({','.join(['%s'] * len(SUMMARY_COLUMNS))})",
+        values
+    )
+    cursor.execute("DELETE FROM round_payouts WHERE session_id=%s AND round_number=%s", (sid, r))
+    cursor.executemany(
+        "INSERT INTO round_payouts (session_id, round_number, ptype, group_size, payout, n) "
+        "VALUES (%s,%s,%s,%s,%s,%s)",
+        histogram
+    )
+
+
+def backfill_round_summary(cursor):
+    """Summarize settled rounds missing from round_summary or older than its
+    decision-time columns."""
+    cursor.execute(
+        """SELECT rp.session_id, rp.round_number, rp.created_at
+           FROM round_phases rp
+           JOIN sessions s ON s.id=rp.session_id
+           LEFT JOIN round_summary rs
+             ON rs.session_id=rp.session_id AND rs.round_number=rp.round_number AND rs.ptype=%s
+           WHERE rs.session_id IS NULL OR rs.decide_n IS NULL""",
+        (ALL_TYPES,)
+    )
+    for row in cursor.fetchall():
+        write_round_summary(cursor, row["session_id"], row["round_number"], row["created_at"])
+
+
+def round_summary(con, sid, r):
+    """Whole-group aggregates of one settled round, or None."""
+    return con.execute(
+        "SELECT * FROM round_summary WHERE session_id=%s AND round_number=%s AND ptype=%s",
+        (sid, r, ALL_TYPES)
+    ).fetchone()
+
+
+# Whole-group aggregates shown with the reveal table
+REVEAL_FIELDS = ("a_count", "b_count", "payout_mean")
+
+
+def reveal_summary(decisions):
+    """REVEAL_FIELDS from (choice, payout) pairs, computed as round_summary stores them."""
+    decisions = list(decisions)
+    a = sum(1 for choice, _ in decisions if choice == "A")
+    payouts = [float(payout) for _, payout in decisions if payout is not None]
+    return {"a_count": a, "b_count": len(decisions) - a, "payout_mean": _moments(payouts)[2]}
+
+
+def session_summary(con, sid):
+    """Whole-group aggregates of every settled round of a session."""
+    return con.execute(
+        "SELECT * FROM round_summary WHERE session_id=%s AND ptype=%s ORDER BY round_number",
+        (sid, ALL_TYPES)
+    ).fetchall()
+
+
+def _pooled(row):
+    # MySQL returns SUM(INT) as Decimal
+    n, a = int(row["n"] or 0), int(row["a_count"] or 0)
+    mean = float(row["payout_sum"] or 0) / n if n else None
+    var = max(float(row["payout_sumsq"] or 0) / n - mean * mean, 0.0) if n else None
+    return {
+        "sessions": int(row["sessions"]),
+        "n": n,
+        "a_count": a,
+        "b_count": int(row["b_count"] or 0),
+        "a_rate": round(a / n, 4) if n else None,
+        "payout_mean": round(mean, 4) if mean is not None else None,
+        "payout_var": round(var, 4) if var is not None else None,
+    }
+
+
+def _filters(args, table="round_summary"):
+    """WHERE clause for the common query parameters (group_size, since, until)."""
+    where, params = [], []
+    if args.get("group_size"):
+        where.append(f"{table}.group_size=%s")
+        params.append(int(args["group_size"]))
+    if args.get("since"):
+        where.append("round_summary.created_at >= %s")
+        params.append(args["since"])
+    if args.get("until"):
+        where.append("round_summary.created_at < %s")
+        params.append(args["until"])
+    return where, params
+
+
+_GROUPINGS = {"round": "round_number", "ptype": "ptype", "group_size": "group_size"}
+
+
+def study_curves(con, args):
+    """Per-round curves pooled over all sessions: overall and by player type."""
+    where, params = _filters(args)
+    rows = con.execute(
+        f"""SELECT round_number, ptype, COUNT(*) AS sessions, SUM(n) AS n,
+                   SUM(a_count) AS a_count, SUM(b_count) AS b_count,
+                   SUM(payout_sum) AS payout_sum, SUM(payout_sumsq) AS payout_sumsq
+            FROM round_summary {"WHERE " + " AND ".join(where) if where else ""}
+            GROUP BY round_number, ptype ORDER BY round_number, ptype""",
+        tuple(params)
+    ).fetchall()
+    rounds = {}
+    for row in rows:
+        entry = rounds.setdefault(row["round_number"], {"round": row["round_number"], "by_ptype": {}})
+        if row["ptype"] == ALL_TYPES:
+            entry.update(_pooled(row))
+        else:
+            entry["by_ptype"][str(row["ptype"])] = _pooled(row)
+    return {"rounds": [rounds[r] for r in sorted(rounds)]}
+
+
+def choice_rates(con, args):
+    """A-choice rate and payout moments grouped by round, ptype or group_size."""
+    by = args.get("by", "round")
+    if by not in _GROUPINGS:
+        raise ValueError(f"by must be one of {sorted(_GROUPINGS)}")
+    col = _GROUPINGS[by]
+    where, params = _filters(args)
+    where.append("ptype != %s" if by == "ptype" else "ptype = %s")
+    params.append(ALL_TYPES)
+    rows = con.execute(
+        f"""SELECT {col} AS k, COUNT(*) AS sessions, SUM(n) AS n,
+                   SUM(a_count) AS a_count, SUM(b_count) AS b_count,
+                   SUM(payout_sum) AS payout_sum, SUM(payout_sumsq) AS payout_sumsq
+            FROM round_summary WHERE {" AND ".join(where)}
+            GROUP BY {col} ORDER BY {col}""",
+        tuple(params)
+    ).fetchall()
+    return {"by": by, "groups": [{by: row["k"], **_pooled(row)} for row in rows]}
+
+
+def decision_times(con, args):
+    """Mean, standard deviation and maximum seconds to decide, grouped like choice_rates."""
+    by = args.get("by", "round")
+    if by not in _GROUPINGS:
+        raise ValueError(f"by must be one of {sorted(_GROUPINGS)}")
+    col = _GROUPINGS[by]
+    where, params = _filters(args)
+    where.append("ptype != %s" if by == "ptype" else "ptype = %s")
+    params.append(ALL_TYPES)
+    rows = con.execute(
+        f"""SELECT {col} AS k, SUM(decide_n) AS n, SUM(decide_sum) AS total,
+                   SUM(decide_sumsq) AS sumsq, MAX(decide_max) AS longest
+            FROM round_summary WHERE {" AND ".join(where)}
+            GROUP BY {col} ORDER BY {col}""",
+        tuple(params)
+    ).fetchall()
+    groups = []
+    for row in rows:
+        n = int(row["n"] or 0)
+        mean = float(row["total"] or 0) / n if n else None
+        var = max(float(row["sumsq"] or 0) / n - mean * mean, 0.0) if n else None
+        groups.append({
+            by: row["k"],
+            "n": n,
+            "mean_s": round(mean, 2) if mean is not None else None,
+            "sd_s": round(var ** 0.5, 2) if var is not None else None,
+            "max_s": round(float(row["longest"]), 2) if row["longest"] is not None else None,
+        })
+    return {"by": by, "groups": groups}
+
+
+def payout_distribution(con, args):
+    """Histogram of round payouts (optionally for one ptype) across sessions."""
+    where, params = _filters(args, table="round_payouts")
+    if args.get("ptype"):
+        where.append("round_payouts.ptype=%s")
+        params.append(int(args["ptype"]))
+    rows = con.execute(
+        f"""SELECT round_payouts.payout AS payout, SUM(round_payouts.n) AS n
+            FROM round_payouts
+            JOIN round_summary ON round_summary.session_id=round_payouts.session_id
+             AND round_summary.round_number=round_payouts.round_number
+             AND round_summary.ptype=round_payouts.ptype
+            {"WHERE " + " AND ".join(where) if where else ""}
+            GROUP BY round_payouts.payout ORDER BY round_payouts.payout""",
+        tuple(params)
+    ).fetchall()
+    return {"buckets": [{"payout": float(row["payout"]), "n": int(row["n"])} for row in rows]}
+
+
+VIEWS = {
+    "rounds": study_curves,
+    "choice_rates": choice_rates,
+    "decision_times": decision_times,
+    "payouts": payout_distribution,
+}
+
+
+class AggregateCache:
+    """Results of the analytics views, valid until the next invalidate().
+
+    A result computed while invalidate() ran is not stored, so a reader that
+    started before a round was settled cannot pin the old numbers. Keys carry
+    the caller's query arguments, so at most `max_entries` results are kept,
+    least recently used first out.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._data = collections.OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            generation = self._generation
+        value = compute()
+        with self._lock:
+            if generation == self._generation:
+                self._data[key] = value
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._data)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def after_fork(self):
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
@@ -1,17 +1,24 @@
-import os, uuid, random, string, datetime, io
+import os, uuid, random, string, datetime, io, time, heapq, threading, collections
+import concurrent.futures
+import gzip, hashlib, json, mimetypes
 from datetime import timedelta, timezone
-from functools import wraps
+from functools import partial, wraps
 from flask import (
     Flask, request, redirect, render_template, session as flask_session,
-    url_for, jsonify, g, send_file, has_app_context
+    url_for, jsonify, g, send_file, has_app_context, has_request_context, make_response, abort
 )
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
-from openpyxl.utils import get_column_letter
-import pymysql
-from pymysql.cursors import DictCursor
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.security import safe_join
 from contextlib import contextmanager
 
+import analytics
+import coordination
+import engine
+import journal
+import profiling
+import status
+import storage
+
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 
 def must_get_env(name: str) -> str:
@@ -23,12 +30,38 @@ def must_get_env(name: str) -> str:
 
 ADMIN_PASSWORD = must_get_env("ADMIN_PASSWORD")
 
-# MySQL Configuration
-DB_HOST = os.environ.get("DB_HOST", "localhost")
-DB_USER = must_get_env("DB_USER")
-DB_PASSWORD = must_get_env("DB_PASSWORD")
-DB_NAME = must_get_env("DB_NAME")
-DB_PORT = int(os.environ.get("DB_PORT", "3306"))
+# Storage: "mysql" (production) or "sqlite" (single node, no DB server)
+DB_BACKEND = os.environ.get("DB_BACKEND", "mysql").lower()
+
+if DB_BACKEND == "sqlite":
+    SQLITE_PATH = os.environ.get("SQLITE_PATH", os.path.join(APP_DIR, "game.db"))
+    storage_backend = storage.SQLiteBackend(
+        SQLITE_PATH, busy_timeout_ms=int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    )
+else:
+    # MySQL Configuration
+    DB_HOST = os.environ.get("DB_HOST", "localhost")
+    DB_USER = must_get_env("DB_USER")
+    DB_PASSWORD = must_get_env("DB_PASSWORD")
+    DB_NAME = must_get_env("DB_NAME")
+    DB_PORT = int(os.environ.get("DB_PORT", "3306"))
+    storage_backend = storage.MySQLBackend(
+        host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME, port=DB_PORT
+    )
+
+# Optional read-only database (replica) for status polls, dashboards and exports
+read_backend = None
+if DB_BACKEND == "sqlite":
+    if os.environ.get("SQLITE_READ_PATH"):
+        read_backend = storage.SQLiteBackend(os.environ["SQLITE_READ_PATH"])
+elif os.environ.get("DB_READ_HOST"):
+    read_backend = storage.MySQLBackend(
+        host=os.environ["DB_READ_HOST"],
+        user=os.environ.get("DB_READ_USER", DB_USER),
+        password=os.environ.get("DB_READ_PASSWORD", DB_PASSWORD),
+        database=os.environ.get("DB_READ_NAME", DB_NAME),
+        port=int(os.environ.get("DB_READ_PORT", str(DB_PORT))),
+    )
 
 app = Flask(
     __name__,
@@ -43,6 +76,30 @@ app.config["SESSION_PERMANENT"] = False
 DEBUG_MODE = os.environ.get("FLASK_DEBUG", "0") == "1"
 app.config["TEMPLATES_AUTO_RELOAD"] = DEBUG_MODE
 
+# JSON responses: orjson when installed (FAST_JSON=0 forces the stdlib encoder)
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider with the encoding done by orjson.
+
+    Output matches the default provider apart from whitespace and non-ASCII
+    escaping: sorted keys, Decimal as string, dates as HTTP dates.
+    """
+
+    OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.OPTIONS).decode()
+
+if orjson is not None and os.environ.get("FAST_JSON", "1") == "1":
+    app.json = FastJSONProvider(app)
+
+# Cross-process channel for in-memory state (LocalBus unless serve_multi.py set COORD_SOCKET)
+bus = coordination.from_env()
+
 
 # -------------------- Vaccination: Cost types --------------------
 TYPE_COST = {
@@ -74,61 +131,178 @@ def b_cost_adapt(ptype: int, others_A: int, N: int) -> float:
 
 
 # -------------------- DB helpers --------------------
-def _connect_mysql():
-    """Create a new MySQL connection."""
-    conn = pymysql.connect(
-        host=DB_HOST,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        database=DB_NAME,
-        port=DB_PORT,
-        cursorclass=DictCursor,
-        charset='utf8mb4',
-        autocommit=False,
-        connect_timeout=10,
-        read_timeout=30,
-        write_timeout=30
-    )
-    return conn
+def _connect_db():
+    """Create a new connection (SQLite: this thread's connection)."""
+    return storage_backend.connect()
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "4"))
+DB_POOL_PING_AFTER = 60  # seconds idle before a pooled connection is pinged
+
+class ConnectionPool:
+    """Per-process pool of idle connections reused across requests."""
+
+    def __init__(self, connect, size):
+        self._connect = connect
+        self._size = size
+        self._idle = []            # (connection, returned_at)
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            con, since = self._idle.pop() if self._idle else (None, 0)
+        if con is None:
+            return self._connect()
+        if time.monotonic() - since > DB_POOL_PING_AFTER:
+            con.ping()
+        return con
+
+    def put(self, con):
+        try:
+            con.rollback()  # never hand out a connection with an open snapshot
+        except Exception:
+            self._discard(con)
+            return
+        with self._lock:
+            if len(self._idle) < self._size:
+                self._idle.append((con, time.monotonic()))
+                return
+        self._discard(con)
+
+    def reset(self):
+        """Forget inherited connections after fork (their sockets belong to the parent)."""
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _discard(con):
+        try:
+            con.close()
+        except Exception:
+            pass
 
-def db():
+# SQLite keeps one connection per thread itself; only MySQL connections are pooled.
+pool = ConnectionPool(_connect_db, DB_POOL_SIZE if storage_backend.pooled else 0)
+read_pool = None
+if read_backend is not None:
+    read_pool = ConnectionPool(
+        read_backend.connect,
+        int(os.environ.get("DB_READ_POOL_SIZE", str(DB_POOL_SIZE))) if read_backend.pooled else 0,
+    )
 
+# Read-your-writes: every journaled write bumps session_versions.version and
+# hands the new value to the writer as a token in its cookie, one per session
+# (the last VERSION_TOKEN_SESSIONS written to). A replica read of a session
+# is only used once the replica has replicated at least that version.
+VERSION_TOKEN = "dbv"
+VERSION_TOKEN_SESSIONS = 4
+_replica_endpoints = set()
+_replica_versions = {}        # session_id -> highest version seen on the replica
+db_routing = {"replica": 0, "primary": 0, "stale_fallback": 0}
+_routing_lock = threading.Lock()
+
+def _count_route(name: str):
+    with _routing_lock:
+        db_routing[name] += 1
+
+def _routing_snapshot() -> dict:
+    with _routing_lock:
+        return dict(db_routing)
+
+def replica_reads(fn):
+    """Route GET requests of this endpoint to the read pool (if configured)."""
+    _replica_endpoints.add(fn.__name__)
+    return fn
+
+def note_write(sid: str, version: int):
+    """Remember the caller's latest committed write for read-your-writes."""
+    if version and has_request_context():
+        tokens = {k: v for k, v in _version_tokens().items() if k != sid}
+        tokens[sid] = version
+        flask_session[VERSION_TOKEN] = dict(list(tokens.items())[-VERSION_TOKEN_SESSIONS:])
+
+def _version_tokens() -> dict:
+    token = flask_session.get(VERSION_TOKEN)
+    if isinstance(token, list):       # cookie from before per-session tokens
+        return {token[0]: token[1]}
+    return token or {}
+
+def _replica_ok() -> bool:
+    if not has_request_context() or request.method not in ("GET", "HEAD"):
+        return False
+    if request.endpoint not in _replica_endpoints:
+        return False
+    tokens = _version_tokens()
+    sid = request.args.get("session_id")
+    if sid:
+        # Writes to other sessions do not hold back reads of this one.
+        tokens = {sid: tokens[sid]} if sid in tokens else {}
+    for sid, version in tokens.items():
+        if _replica_versions.get(sid, 0) >= version:
+            continue
+        if "db_read" not in g:
+            g.db_read = read_pool.get()
+        row = g.db_read.execute("SELECT version FROM session_versions WHERE session_id=%s", (sid,)).fetchone()
+        g.db_read.rollback()   # a stale snapshot must not outlive this check
+        seen = row["version"] if row else 0
+        with _routing_lock:
+            if seen > _replica_versions.get(sid, 0):
+                _replica_versions[sid] = seen
+        if seen < version:
+            _count_route("stale_fallback")
+            return False
+    return True
+
+def db(primary=False):
+    """This request's connection.
+
+    GET requests to @replica_reads endpoints get a read-pool connection,
+    unless the caller's version token is not on the replica yet; primary=True
+    forces the primary (e.g. to read back a write made in this request).
+    """
     if not has_app_context():
-        return _connect_mysql()
+        return _connect_db()
+
+    if not primary and read_pool is not None:
+        route = g.get("db_route")
+        if route is None:
+            route = g.db_route = "replica" if _replica_ok() else "primary"
+            _count_route(route)
+        if route == "replica":
+            if "db_read" not in g:
+                g.db_read = read_pool.get()
+            return g.db_read
 
     if "db" not in g:
-        g.db = _connect_mysql()
+        g.db = pool.get()
     return g.db
 
 @app.teardown_appcontext
 def close_db(exception=None):
     con = g.pop("db", None)
     if con is not None:
-        try:
-            con.close()
-        except Exception:
-            pass
+        pool.put(con)
+    con = g.pop("db_read", None)
+    if con is not None:
+        read_pool.put(con)
 
 
-def ensure_column(con, table, column, definition):
-    cursor = con.cursor()
-    cursor.execute(f"SHOW COLUMNS FROM {table} LIKE %s", (column,))
-    if not cursor.fetchone():
-        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
-        con.commit()
-    cursor.close()
+def ensure_column(con, table, column, definition) -> bool:
+    """Add the column if it is missing; True if it was added."""
+    if any(col["Field"] == column for col in con.columns(table)):
+        return False
+    con.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    con.commit()
+    return True
 
 def ensure_archive_schema(con, base_table):
     arch_table = f"archived_{base_table}"
     cursor = con.cursor()
 
     # Get base table columns
-    cursor.execute(f"SHOW COLUMNS FROM {base_table}")
-    base_cols = {row['Field']: row for row in cursor.fetchall()}
+    base_cols = {row['Field']: row for row in con.columns(base_table)}
 
     # Get archive table columns
-    cursor.execute(f"SHOW COLUMNS FROM {arch_table}")
-    arch_cols = {row['Field'] for row in cursor.fetchall()}
+    arch_cols = {row['Field'] for row in con.columns(arch_table)}
 
     # Add missing columns
     for name, col_info in base_cols.items():
@@ -155,9 +329,33 @@ def iso_utc(dt: datetime.datetime) -> str:
 def parse_iso_utc(s: str) -> datetime.datetime:
     return datetime.datetime.fromisoformat((s or "").replace("Z", "+00:00"))
 
+def touch_session(con, sid):
+    """Record a change of `sid` in session_changes; the caller commits."""
+    con.execute(
+        "INSERT INTO session_changes (session_id, changed_at) VALUES (%s,%s) "
+        "ON DUPLICATE KEY UPDATE changed_at=VALUES(changed_at)",
+        (sid, iso_utc(utc_now()))
+    )
+
 
-def init_db():
+# Bump whenever init_db() changes the schema; workers starting against a
+# database that already carries this version skip all DDL.
+SCHEMA_VERSION = 5
+
+def schema_current(con) -> bool:
+    try:
+        row = con.execute("SELECT value FROM schema_meta WHERE name='schema_version'").fetchone()
+    except Exception:   # first start: no schema_meta yet
+        con.rollback()
+        return False
+    con.rollback()
+    return bool(row) and row["value"] == str(SCHEMA_VERSION)
+
+def init_db(force=False):
     con = db()
+    if not force and schema_current(con):
+        con.close()
+        return
     cursor = con.cursor()
 
     cursor.execute(
@@ -177,9 +375,16 @@ def init_db():
         archived TINYINT DEFAULT 0,
         reveal_window INT DEFAULT 5,
         watch_time INT DEFAULT 15,
-        cost_mode VARCHAR(50) DEFAULT 'type_table'
+        cost_mode VARCHAR(50) DEFAULT 'type_table',
+        status VARCHAR(12) DEFAULT NULL,
+        status_done INT DEFAULT 0,
+        status_total INT DEFAULT 0
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
     )
+    # Background reset/delete (session janitor): NULL = live, else 'resetting' / 'deleting'
+    ensure_column(con, "sessions", "status", "VARCHAR(12) DEFAULT NULL")
+    ensure_column(con, "sessions", "status_done", "INT DEFAULT 0")
+    ensure_column(con, "sessions", "status_total", "INT DEFAULT 0")
 
     cursor.execute(
         """CREATE TABLE IF NOT EXISTS participants (
@@ -230,9 +435,117 @@ def init_db():
             decision_ends_at VARCHAR(30),
             watch_ends_at VARCHAR(30),
             created_at VARCHAR(30),
+            phase VARCHAR(10) DEFAULT 'watch',
+            PRIMARY KEY (session_id, round_number)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    if ensure_column(con, "round_phases", "phase", "VARCHAR(10) DEFAULT 'watch'"):
+        # Rows from before the column are settled rounds, not pending deadlines
+        con.execute("UPDATE round_phases SET phase='done'")
+        con.commit()
+
+    # Per-round decision counter, bumped by /choose in the same statement batch,
+    # and when the round became available to the group (analytics.open_round)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS round_progress (
+            session_id VARCHAR(36),
+            round_number INT,
+            decided INT DEFAULT 0,
+            opened_at VARCHAR(30),
             PRIMARY KEY (session_id, round_number)
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
     """)
+    # Decision times stored before rounds had an opening time used the wrong
+    # baseline; the backfill below recomputes them (none for such rounds).
+    redo_decision_times = ensure_column(con, "round_progress", "opened_at", "VARCHAR(30)")
+
+    # Per-session join counter: the last join_number handed out (bumped by /join)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS join_counters (
+            session_id VARCHAR(36) PRIMARY KEY,
+            last_join INT DEFAULT 0
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    cursor.execute(
+        "INSERT IGNORE INTO join_counters (session_id, last_join) "
+        "SELECT session_id, MAX(join_number) FROM participants "
+        "WHERE joined=1 AND join_number IS NOT NULL GROUP BY session_id"
+    )
+
+    # Aggregates of each settled round; ptype 0 = whole group (see analytics.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS round_summary (
+            session_id VARCHAR(36),
+            round_number INT,
+            ptype INT,
+            group_size INT,
+            n INT,
+            a_count INT,
+            b_count INT,
+            payout_sum DOUBLE,
+            payout_sumsq DOUBLE,
+            payout_mean DOUBLE,
+            payout_var DOUBLE,
+            decide_n INT,
+            decide_sum DOUBLE,
+            decide_sumsq DOUBLE,
+            decide_max DOUBLE,
+            created_at VARCHAR(30),
+            PRIMARY KEY (session_id, round_number, ptype),
+            INDEX idx_round_ptype (round_number, ptype),
+            INDEX idx_group_ptype (group_size, ptype)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    for col, definition in (("decide_n", "INT"), ("decide_sum", "DOUBLE"),
+                            ("decide_sumsq", "DOUBLE"), ("decide_max", "DOUBLE")):
+        ensure_column(con, "round_summary", col, definition)
+    if redo_decision_times:
+        cursor.execute("UPDATE round_summary SET decide_n=NULL")
+
+    # Payout histogram of each settled round per player type
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS round_payouts (
+            session_id VARCHAR(36),
+            round_number INT,
+            ptype INT,
+            group_size INT,
+            payout DECIMAL(10,2),
+            n INT,
+            PRIMARY KEY (session_id, round_number, ptype, payout),
+            INDEX idx_group_payout (group_size, payout)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+
+    # Per-session write counter; the version tokens for read-your-writes
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS session_versions (
+            session_id VARCHAR(36) PRIMARY KEY,
+            version BIGINT DEFAULT 0
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+
+    # Last change per session that leaves no created_at behind (phase
+    # transitions, reveals, archive, reset/delete); backup_db.py reads it for
+    # incremental snapshots. Kept when a session is deleted, as its tombstone.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS session_changes (
+            session_id VARCHAR(36) PRIMARY KEY,
+            changed_at VARCHAR(30)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+
+    # Append-only journal of participant writes (see journal.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS game_events (
+            id BIGINT PRIMARY KEY AUTO_INCREMENT,
+            session_id VARCHAR(36),
+            participant_id VARCHAR(36),
+            kind VARCHAR(20),
+            payload TEXT,
+            created_at VARCHAR(30),
+            INDEX idx_session_event (session_id, id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
 
     # Create archived tables with same structure
     cursor.execute("""
@@ -293,80 +606,225 @@ def init_db():
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
     """)
 
+    analytics.backfill_round_summary(cursor)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_meta (
+            name VARCHAR(50) PRIMARY KEY,
+            value VARCHAR(50)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    cursor.execute(
+        "REPLACE INTO schema_meta (name, value) VALUES ('schema_version', %s)", (str(SCHEMA_VERSION),)
+    )
+
     con.commit()
     cursor.close()
     con.close()
 
 
 # -------------------- Context --------------------
+SERVER_THREADS = int(os.environ.get("THREADS", "48"))
+
+class LoadGauge:
+    """Counts the requests currently in flight in this process."""
+
+    def __init__(self):
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            self._inflight += 1
+
+    def leave(self):
+        with self._lock:
+            self._inflight -= 1
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def load(self) -> float:
+        return min(1.0, self.inflight / float(max(1, SERVER_THREADS)))
+
+load_gauge = LoadGauge()
+
 @app.before_request
-def load_participant():
+def track_inflight():
+    load_gauge.enter()
+    g.inflight_counted = True
+
+@app.teardown_request
+def untrack_inflight(exception=None):
+    if g.pop("inflight_counted", False):
+        load_gauge.leave()
+
+# g.participant is loaded on first access, with the columns the endpoint
+# declared via @uses_participant (undeclared: the full row). Endpoints that
+# never look at it, static files and /healthz, never open a connection.
+_PARTICIPANT_COLUMNS = {"static": ()}   # endpoint -> columns
+
+def uses_participant(*columns):
+    """Declare which participant columns an endpoint reads through g.participant.
+
+    No columns: it never needs the participant. ("id",) is answered from the
+    signed session cookie without a query.
+    """
+    def deco(fn):
+        _PARTICIPANT_COLUMNS[fn.__name__] = columns
+        return fn
+    return deco
+
+def _load_participant():
     pid = flask_session.get("participant_id")
-    g.participant = None
-    if pid:
-        con = db()
-        g.participant = con.execute("SELECT * FROM participants WHERE id=%s", (pid,)).fetchone()
+    if not pid:
+        return None
+    columns = _PARTICIPANT_COLUMNS.get(request.endpoint, ("*",))
+    if not columns:
+        return None
+    if columns == ("id",):
+        return {"id": pid}
+    p = db().execute(f"SELECT {', '.join(columns)} FROM participants WHERE id=%s", (pid,)).fetchone()
+    eng = engine_for(p["session_id"]) if p and "session_id" in p else None
+    return eng.overlay(p) if eng else p
+
+class RequestGlobals(app.app_ctx_globals_class):
+    """flask.g with a lazily loaded g.participant."""
+
+    def __getattr__(self, name):
+        if name == "participant" and has_request_context():
+            self.participant = _load_participant()
+            return self.participant
+        return super().__getattr__(name)
+
+app.app_ctx_globals_class = RequestGlobals
 
 def create_code(n=6):
     chars = (string.ascii_uppercase + string.digits).replace("O","").replace("0","").replace("I","").replace("1","")
     return "".join(random.choice(chars) for _ in range(n))
 
+def create_codes(con, count, n=6):
+    """Draw `count` distinct unused codes, checking each batch with one IN (...) query."""
+    codes = set()
+    cursor = con.cursor()
+    try:
+        while len(codes) < count:
+            batch = set()
+            while len(batch) < count - len(codes):
+                code = create_code(n)
+                if code not in codes:
+                    batch.add(code)
+            placeholders = ",".join(["%s"] * len(batch))
+            cursor.execute(f"SELECT code FROM participants WHERE code IN ({placeholders})", tuple(batch))
+            taken = {row["code"] for row in cursor.fetchall()}
+            codes |= batch - taken
+    finally:
+        cursor.close()
+    return list(codes)
 
-# -------------------- State & Guard --------------------
-def current_state(con, p, s) -> str:
-    if not p or not s: return "lobby"
-    if s["archived"]: return "done"
-
-    joined = con.execute(
-        "SELECT COUNT(*) c FROM participants WHERE session_id=%s AND joined=1", (s["id"],)
-    ).fetchone()["c"]
-    if joined < s["group_size"]:
-        return "lobby"
 
-    r = p["current_round"]
+# -------------------- Profiling --------------------
+# Admin-only: /admin/profile/sample samples all threads of the answering
+# process; /admin/profile/routes switches cProfile on for 1 in K requests of
+# a route (broadcast to all workers). Off, the hook is one dict check.
+PROFILE_MAX_SECONDS = int(os.environ.get("PROFILE_MAX_SECONDS", "60"))
 
-    if r > s["rounds"]:
-        all_ready = con.execute(
-            "SELECT COUNT(*) c FROM participants WHERE session_id=%s AND ready_for_next=1",
-            (s["id"],)
-        ).fetchone()["c"] >= s["group_size"]
+stack_sampler = profiling.StackSampler()
+route_profiler = profiling.RouteProfiler()
 
-        if all_ready:
-            return "done"
-        else:
-            return "reveal"
+@app.before_request
+def profile_start():
+    if route_profiler.every and request.url_rule is not None:
+        g.route_profile = route_profiler.start(request.url_rule.rule)
 
-    if r > 1:
-        all_ready = con.execute(
-            "SELECT COUNT(*) c FROM participants WHERE session_id=%s AND ready_for_next=1",
-            (s["id"],)
-        ).fetchone()["c"] >= s["group_size"]
+@app.teardown_request
+def profile_stop(exception=None):
+    prof = g.pop("route_profile", None)
+    if prof is not None:
+        route_profiler.stop(request.url_rule.rule, prof)
 
-        if not all_ready:
-            return "reveal"
+bus.subscribe("profile.routes", lambda msg: route_profiler.configure(msg["rule"], msg["every"]))
 
-    decided = con.execute(
-        "SELECT 1 FROM decisions WHERE participant_id=%s AND round_number=%s", (p["id"], r)
-    ).fetchone()
-    if not decided: return "round"
 
-    ph = con.execute(
-        "SELECT watch_ends_at FROM round_phases WHERE session_id=%s AND round_number=%s",
-        (s["id"], r)
-    ).fetchone()
-    if not ph: return "wait"
+# -------------------- State & Guard --------------------
+# The status queries and payloads live in status.py (shared with asgi.py);
+# sessions run by the engine answer from memory through _EngineStatus.
+class _EngineStatus(status.StatusQueries):
+    """status.StatusQueries answered by the session's engine; no queries to run."""
+
+    def __init__(self, eng):
+        super().__init__(retry_after_ms)
+        self.eng = eng
+
+    def state(self, p, s):
+        return "done" if s["archived"] else self.eng.state(p["id"])
+        yield  # a generator like the SQL builders
+
+    def lobby(self, sid, pid):
+        return {**self.eng.lobby_status(pid), "retry_after_ms": retry_after_ms("lobby")}
+        yield
+
+    def round(self, sid, r, pid, defer_unsettled=True):
+        round_finalized(sid, r, self.eng.finalize_if_complete(r, utc_now()))
+        payload = self.eng.round_status(pid, r)
+        if not payload.get("reset"):
+            payload["retry_after_ms"] = retry_after_ms("round")
+        return payload
+        yield
+
+    def ready(self, sid, pid, me):
+        payload = self.eng.ready_status(pid, me)
+        if not payload.get("reset"):
+            payload["retry_after_ms"] = retry_after_ms("ready")
+        return payload
+        yield
+
+def status_for(sid) -> status.StatusQueries:
+    eng = engine_for(sid)
+    return _EngineStatus(eng) if eng else sql_status
+
+def status_run(builder):
+    """Run a status.py builder on this request's connection.
+
+    A complete round without its phase row is settled on the session's lane
+    first, then the builder's payload is read again from the primary.
+    """
+    payload = status.run(db(), builder())
+    if isinstance(payload, status.Unsettled):
+        sid, r = payload.sid, payload.r
+        # Normally settled by the last /choose; queue it on the session's lane.
+        round_finalized(sid, r, commit_event("finalize", sid, r=r, at=iso_utc(utc_now())))
+        con = db(primary=True)
+        con.commit()  # new snapshot, so the settled round is visible
+        payload = status.run(con, builder(defer_unsettled=False))
+    return payload
 
-    return "reveal"
+def current_state(con, p, s) -> str:
+    if not p or not s: return "lobby"
+    return status.run(con, status_for(s["id"]).state(p, s))
 
 def state_to_url(state: str) -> str:
-    return {
-        "lobby": url_for("lobby"),
-        "round": url_for("round_view"),
-        "wait": url_for("wait_view"),
-        "reveal": url_for("reveal"),
-        "feedback": url_for("feedback"),
-        "done": url_for("done"),
-    }[state]
+    # All phases run in the single-page client; only the end screen is a page of its own.
+    return url_for("done") if state == "done" else url_for("play")
+
+@app.before_request
+def refuse_closing_session():
+    """While a session is being reset or deleted, its participants see it as gone.
+
+    Polls get {"reset": true} (clients go back to /join), writes a 409 and
+    pages a redirect to /join.
+    """
+    if not closing_sessions or request.endpoint in (None, "static", "join") or request.path.startswith("/admin"):
+        return None
+    sid = request.args.get("session_id") or request.cookies.get(SESSION_COOKIE)
+    if sid not in closing_sessions:
+        return None
+    if request.method != "GET":
+        return jsonify({"reset": True, "state": "join"}), 409
+    if request.args.get("session_id"):
+        return jsonify({"reset": True, "state": "join"})
+    return redirect(url_for("join"))
 
 def guard(expect_state: str):
     def deco(fn):
@@ -374,7 +832,7 @@ def guard(expect_state: str):
         def inner(*args, **kwargs):
             if not g.participant: return redirect(url_for("join"))
             con = db()
-            p = con.execute("SELECT * FROM participants WHERE id=%s", (g.participant["id"],)).fetchone()
+            p = g.participant
             s = con.execute("SELECT * FROM sessions WHERE id=%s", (p["session_id"],)).fetchone()
             st = current_state(con, p, s)
             if st != expect_state: return redirect(state_to_url(st))
@@ -383,106 +841,1125 @@ def guard(expect_state: str):
     return deco
 
 
-# -------------------- Round finalization (atomic) --------------------
-def _finalize_round_atomic(con, sid: str, r: int, s: dict):
-    cursor = con.cursor()
+# -------------------- Poll hints --------------------
+POLL_MIN_MS = int(os.environ.get("POLL_MIN_MS", "500"))
+POLL_MAX_MS = int(os.environ.get("POLL_MAX_MS", "15000"))
+POLL_BASE_MS = {
+    "lobby": 2000,
+    "round": 2000,
+    "ready": 2000,
+    "done": 5000,
+    "admin": 1000,
+    "admin_overview": 3000,
+}
 
-    try:
-        con.begin()
+def retry_after_ms(kind: str, deadline: datetime.datetime = None) -> int:
+    """Suggest how long a client should wait before its next status poll.
 
-        cursor.execute(
-            "SELECT COUNT(*) as c FROM decisions WHERE session_id=%s AND round_number=%s",
-            (sid, r)
-        )
-        decided = cursor.fetchone()["c"]
+    With a known deadline (reveal watch phase) nothing changes before it, so
+    the client sleeps until just after it. Otherwise the per-phase base
+    interval is stretched by up to 3x as the worker pool fills up.
+    """
+    if deadline is not None:
+        ms = (deadline - utc_now()).total_seconds() * 1000 + 150
+    else:
+        ms = POLL_BASE_MS.get(kind, 2000) * (1 + 2 * load_gauge.load())
+    return int(min(POLL_MAX_MS, max(POLL_MIN_MS, ms)))
+
+sql_status = status.StatusQueries(retry_after_ms)
+
+
+# -------------------- Admission control --------------------
+# Read polls may occupy at most POLL_MAX_INFLIGHT (+ POLL_QUEUE_SIZE waiting)
+# worker threads; the rest of the pool stays free for choose/join/confirm_ready.
+POLL_MAX_INFLIGHT = int(os.environ.get("POLL_MAX_INFLIGHT", str(max(1, SERVER_THREADS // 2))))
+POLL_MAX_PER_SESSION = int(os.environ.get("POLL_MAX_PER_SESSION", "6"))
+POLL_QUEUE_SIZE = int(os.environ.get("POLL_QUEUE_SIZE", "8"))
+POLL_QUEUE_WAIT = float(os.environ.get("POLL_QUEUE_WAIT", "0.5"))
+POLL_SNAPSHOT_MAX_AGE = float(os.environ.get("POLL_SNAPSHOT_MAX_AGE", "5"))
+POLL_SNAPSHOT_ENTRIES = 512
+LONGPOLL_MAX_WAIT = float(os.environ.get("LONGPOLL_MAX_WAIT", "10"))   # asgi.py long-polls
+
+class Admission:
+    """Priority gate for read polls: per-process and per-session caps plus a bounded queue."""
+
+    def __init__(self, limit, per_session, queue_size, queue_wait):
+        self.limit = limit
+        self.per_session = per_session
+        self.queue_size = queue_size
+        self.queue_wait = queue_wait
+        self._inflight = 0
+        self._by_session = {}
+        self._queued = 0
+        self._cond = threading.Condition()
+        self.counters = collections.Counter()
+
+    def _has_room(self, sid) -> bool:
+        return self._inflight < self.limit and self._by_session.get(sid, 0) < self.per_session
+
+    def _take(self, sid):
+        self._inflight += 1
+        self._by_session[sid] = self._by_session.get(sid, 0) + 1
+        self.counters["admitted"] += 1
+
+    def acquire(self, sid: str) -> bool:
+        with self._cond:
+            if self._has_room(sid):
+                self._take(sid)
+                return True
+            if self._queued >= self.queue_size:
+                self.counters["shed_queue_full"] += 1
+                return False
+            self._queued += 1
+            self.counters["queued_total"] += 1
+            try:
+                ok = self._cond.wait_for(lambda: self._has_room(sid), self.queue_wait)
+            finally:
+                self._queued -= 1
+            if not ok:
+                self.counters["shed_timeout"] += 1
+                return False
+            self._take(sid)
+            return True
+
+    def release(self, sid: str):
+        with self._cond:
+            self._inflight -= 1
+            left = self._by_session.get(sid, 1) - 1
+            if left > 0:
+                self._by_session[sid] = left
+            else:
+                self._by_session.pop(sid, None)
+            self._cond.notify_all()
+
+    def count(self, name: str):
+        with self._cond:
+            self.counters[name] += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "inflight": self._inflight,
+                "queue_depth": self._queued,
+                "limit": self.limit,
+                "per_session": self.per_session,
+                "queue_size": self.queue_size,
+                **self.counters,
+            }
+
+admission = Admission(POLL_MAX_INFLIGHT, POLL_MAX_PER_SESSION, POLL_QUEUE_SIZE, POLL_QUEUE_WAIT)
+_poll_snapshots = collections.OrderedDict()   # _poll_key() -> (monotonic ts, body)
+_poll_snapshots_lock = threading.Lock()
+
+def _poll_key():
+    # Responses carry a "me" part, so the caller's participant is part of the key.
+    return (request.endpoint, request.query_string, flask_session.get("participant_id"))
+
+def poll_endpoint(snapshot=True):
+    """Run a status endpoint behind the admission gate.
+
+    When the gate sheds the request, the last successful response for the same
+    URL is replayed if it is fresh enough (snapshot=True), otherwise the client
+    gets a fast 429 with a Retry-After hint.
+    """
+    def deco(fn):
+        @wraps(fn)
+        def inner(*args, **kwargs):
+            sid = request.args.get("session_id") or ""
+            key = _poll_key()
+            if not admission.acquire(sid):
+                if snapshot:
+                    with _poll_snapshots_lock:
+                        cached = _poll_snapshots.get(key)
+                    if cached and time.monotonic() - cached[0] <= POLL_SNAPSHOT_MAX_AGE:
+                        admission.count("served_snapshot")
+                        resp = app.response_class(cached[1], mimetype="application/json")
+                        resp.headers["X-Snapshot-Age"] = f"{time.monotonic() - cached[0]:.1f}"
+                        return resp
+                admission.count("rejected")
+                ms = retry_after_ms(request.endpoint) * 2
+                resp = jsonify({"err": "busy", "retry_after_ms": ms})
+                resp.status_code = 429
+                resp.headers["Retry-After"] = str(max(1, ms // 1000))
+                return resp
+            try:
+                resp = make_response(fn(*args, **kwargs))
+            finally:
+                admission.release(sid)
+            if snapshot and resp.status_code == 200 and resp.mimetype == "application/json":
+                with _poll_snapshots_lock:
+                    _poll_snapshots[key] = (time.monotonic(), resp.get_data())
+                    _poll_snapshots.move_to_end(key)
+                    while len(_poll_snapshots) > POLL_SNAPSHOT_ENTRIES:
+                        _poll_snapshots.popitem(last=False)
+            return resp
+        return inner
+    return deco
 
-        if decided < s["group_size"]:
-            con.rollback()
-            return
 
-        cursor.execute(
-            "SELECT COUNT(*) as c FROM decisions WHERE session_id=%s AND round_number=%s AND total_cost IS NULL",
-            (sid, r)
-        )
-        missing = cursor.fetchone()["c"]
+# -------------------- Session affinity --------------------
+# With serve_multi.py in SESSION_AFFINITY mode, the dispatcher pins every
+# session to one worker (X-Shard-Owner: 1). That worker keeps the session's
+# poll payloads in memory and drops them on each write it commits, so polls
+# between writes never reach MySQL. Requests arriving via failover are served
+# from the DB and tell the owner to drop its copy.
+SESSION_AFFINITY = os.environ.get("SESSION_AFFINITY", "0") == "1"
+SESSION_CACHE_TTL = float(os.environ.get("SESSION_CACHE_TTL", "30"))
+SESSION_COOKIE = "vg_sid"
+
+class SessionStateCache:
+    """Per-session poll payloads held by the worker that owns the session."""
+
+    def __init__(self):
+        self._data = {}      # session_id -> {poll key: (monotonic ts, payload)}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sid, key):
+        with self._lock:
+            entry = self._data.get(sid, {}).get(key)
+            if entry and time.monotonic() - entry[0] <= SESSION_CACHE_TTL:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, sid, key, payload):
+        with self._lock:
+            self._data.setdefault(sid, {})[key] = (time.monotonic(), payload)
+
+    def drop(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def after_fork(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+session_cache = SessionStateCache()
+
+def owns_session() -> bool:
+    return (
+        SESSION_AFFINITY and has_request_context()
+        and request.headers.get("X-Shard-Owner") == "1"
+    )
 
-        if missing <= 0:
-            con.rollback()
-            return
+# Callables notified with the session id after each change (asgi.py wakes its long-polls)
+change_listeners = []
 
-        cursor.execute(
-            """SELECT d.id, d.participant_id, d.choice, p.ptype, p.join_number
-               FROM decisions d JOIN participants p ON p.id=d.participant_id
-               WHERE d.session_id=%s AND d.round_number=%s
-               ORDER BY p.join_number""",
-            (sid, r)
-        )
-        rows = cursor.fetchall()
-
-        total_A = sum(1 for row in rows if row["choice"] == "A")
-        N = s["group_size"]
-        M = float(s["starting_balance"] or 500)
-
-        for row in rows:
-            did = row["id"]
-            pid = row["participant_id"]
-            choice = row["choice"]
-            ptype = row["ptype"] or 1
-
-            if choice == "A":
-                cost = a_cost_for(ptype)
-                others_A = max(0, total_A - 1)
-                b_cost_round = None
-            else:
-                others_A = total_A
-                cost = b_cost_adapt(ptype, others_A, N)
-                b_cost_round = cost
-
-            payout = max(M - float(cost), 0)
-
-            cursor.execute(
-                """UPDATE decisions
-                   SET a_cost=%s, b_cost=%s, total_cost=%s,
-                       payout=%s, base_payout=%s, others_A=%s, b_cost_round=%s, reveal=1
-                   WHERE id=%s AND total_cost IS NULL""",
-                (
-                    cost if choice == "A" else None,
-                    cost if choice == "B" else None,
-                    cost,
-                    payout,
-                    M,
-                    others_A,
-                    b_cost_round,
-                    did
-                )
+def _notify_change(sid: str):
+    for notify in change_listeners:
+        notify(sid)
+
+def session_changed(sid: str):
+    """Write-through hook, called after every committed write that affects a session."""
+    session_cache.drop(sid)
+    _notify_change(sid)
+    if SESSION_AFFINITY and has_request_context() and not owns_session():
+        bus.publish("session.changed", sid=sid)
+
+def _remote_change(sid: str):
+    session_cache.drop(sid)
+    _notify_change(sid)
+
+bus.subscribe("session.changed", lambda msg: _remote_change(msg["sid"]))
+
+def session_cached(fn):
+    """Serve a status endpoint from the owning worker's memory when possible."""
+    @wraps(fn)
+    def inner(*args, **kwargs):
+        sid = request.args.get("session_id")
+        if not sid or not owns_session():
+            return fn(*args, **kwargs)
+        key = _poll_key()
+        payload = session_cache.get(sid, key)
+        if payload is not None:
+            payload = dict(payload)
+            if payload.get("phase") == "watch" and payload.get("ends_at"):
+                payload["retry_after_ms"] = retry_after_ms("watch", parse_iso_utc(payload["ends_at"]))
+            return jsonify(payload)
+        resp = make_response(fn(*args, **kwargs))
+        if resp.status_code == 200 and resp.is_json:
+            session_cache.put(sid, key, resp.get_json())
+        return resp
+    return inner
+
+
+# -------------------- Phase scheduler --------------------
+class PhaseScheduler:
+    """Fires round phase transitions (watch -> done) when their deadline falls due.
+
+    Deadlines live in a heap; a single daemon thread sleeps until the next one
+    and persists the transition in round_phases. Only the process that opened
+    a phase arms its deadline; the others derive "done" from watch_ends_at
+    and learn about the transition from one "phase.fired" bus message. A
+    (re)starting process also arms deadlines left pending in the database;
+    if several do, only the one whose UPDATE wins reports the transition.
+    Only pending rounds are kept in memory: once fired, phase() returns None
+    and callers fall back to round_phases.phase / the deadline.
+    """
+
+    def __init__(self):
+        self._heap = []            # (due_ts, session_id, round_number)
+        self._phases = {}          # (session_id, round_number) -> "watch", pending only
+        self._versions = {}        # session_id -> transition counter, while a round is pending
+        self._cond = threading.Condition()
+        self._thread = None
+        self._con = None           # timer thread's connection
+        self._con_used = 0.0
+
+    def start(self):
+        """Start the timer thread eagerly (it also starts on first schedule())."""
+        with self._cond:
+            self._ensure_thread()
+
+    def schedule(self, sid: str, r: int, due: datetime.datetime):
+        with self._cond:
+            self._phases[(sid, r)] = "watch"
+            heapq.heappush(self._heap, (due.timestamp(), sid, r))
+            self._bump(sid)
+            self._ensure_thread()
+
+    def phase(self, sid: str, r: int):
+        return self._phases.get((sid, r))
+
+    def version(self, sid: str) -> int:
+        return self._versions.get(sid, 0)
+
+    def forget(self, sid: str):
+        """Drop all pending transitions of a session (reset/delete)."""
+        with self._cond:
+            for key in [k for k in self._phases if k[0] == sid]:
+                del self._phases[key]
+            self._bump(sid)
+            self._versions.pop(sid, None)
+
+    def after_fork(self):
+        # Threads do not survive fork(); the child re-arms its own timer.
+        self._cond = threading.Condition()
+        self._thread = None
+        self._con = None           # its socket belongs to the parent
+
+    def _bump(self, sid: str):
+        self._versions[sid] = self._versions.get(sid, 0) + 1
+        self._cond.notify_all()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="phase-scheduler", daemon=True)
+            self._thread.start()
+
+    def _connection(self):
+        if self._con is None:
+            self._con = _connect_db()
+        elif time.monotonic() - self._con_used > DB_POOL_PING_AFTER:
+            self._con.ping()
+        self._con_used = time.monotonic()
+        return self._con
+
+    def _drop_connection(self):
+        con, self._con = self._con, None
+        if con is not None:
+            try:
+                con.close()
+            except Exception:
+                pass
+
+    def _load_pending(self):
+        """Re-arm deadlines that were pending when the process (re)started.
+
+        Deadlines already past are settled in one statement instead of
+        being armed and fired one by one.
+        """
+        con = self._connection()
+        try:
+            con.execute(
+                "UPDATE round_phases SET phase='done' WHERE (phase IS NULL OR phase='watch') AND watch_ends_at <= %s",
+                (iso_utc(utc_now()),)
+            )
+            con.commit()
+            rows = con.execute(
+                "SELECT session_id, round_number, watch_ends_at FROM round_phases "
+                "WHERE phase IS NULL OR phase='watch'"
+            ).fetchall()
+            con.rollback()
+        except Exception:
+            self._drop_connection()
+            raise
+        with self._cond:
+            for row in rows:
+                key = (row["session_id"], row["round_number"])
+                if key in self._phases:
+                    continue
+                self._phases[key] = "watch"
+                due = parse_iso_utc(row["watch_ends_at"]).timestamp()
+                heapq.heappush(self._heap, (due, key[0], key[1]))
+            self._cond.notify_all()
+
+    def _run(self):
+        try:
+            self._load_pending()
+        except Exception:
+            app.logger.exception("phase scheduler: could not load pending deadlines")
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.time():
+                    self._cond.wait(min(self._heap[0][0] - time.time(), 3600) if self._heap else None)
+                _, sid, r = heapq.heappop(self._heap)
+                if self._phases.get((sid, r)) != "watch":
+                    continue
+            fired = False
+            try:
+                fired = self._fire(sid, r)
+            except Exception:
+                app.logger.exception("phase scheduler: transition %s/%s failed", sid, r)
+            with self._cond:
+                if self._phases.pop((sid, r), None) == "watch":
+                    self._bump(sid)
+                    if not any(k[0] == sid for k in self._phases):
+                        self._versions.pop(sid, None)
+            session_changed(sid)
+            if fired:
+                bus.publish("phase.fired", sid=sid, r=r)
+
+    def _fire(self, sid: str, r: int) -> bool:
+        """Persist the transition; False if another process already did."""
+        con = self._connection()
+        try:
+            cursor = con.execute(
+                "UPDATE round_phases SET phase='done' WHERE session_id=%s AND round_number=%s AND phase='watch'",
+                (sid, r)
             )
+            fired = cursor.rowcount == 1
+            if fired:
+                touch_session(con, sid)
+            con.commit()
+            return fired
+        except Exception:
+            self._drop_connection()
+            raise
+
+phase_scheduler = PhaseScheduler()
+
+# Status caches and long-polls of the other workers pick up the transition.
+bus.subscribe("phase.fired", lambda msg: _remote_change(msg["sid"]))
+
+
+# -------------------- Analytics cache --------------------
+# Study-wide aggregates only change when a round is settled or a session is
+# archived, reset or deleted; until then /admin/analytics/* is served from memory.
+analytics_cache = analytics.AggregateCache()
+
+def analytics_changed():
+    analytics_cache.invalidate()
+    bus.publish("analytics.changed")
+
+bus.subscribe("analytics.changed", lambda msg: analytics_cache.invalidate())
+
+def _engine_events_stored(events):
+    if any(ev["t"] == "finalize" for ev in events):
+        analytics_changed()
+
+
+# -------------------- Game engine --------------------
+# GAME_ENGINE=1 keeps each session's state in memory (engine.py) and persists
+# it write-behind through an event log. Only the process that owns a session
+# may use it: serve_waitress.py, or the owner worker in SESSION_AFFINITY mode.
+GAME_ENGINE = os.environ.get("GAME_ENGINE", "0") == "1"
+ENGINE_LOG_DIR = os.environ.get("ENGINE_LOG_DIR", os.path.join(APP_DIR, "engine-log"))
+ENGINE_FLUSH_MS = int(os.environ.get("ENGINE_FLUSH_MS", "20"))
+
+engines = engine.Engines(
+    engine.EventLog(ENGINE_LOG_DIR, _connect_db, interval=ENGINE_FLUSH_MS / 1000.0, logger=app.logger,
+                    on_stored=_engine_events_stored),
+    costs=(a_cost_for, b_cost_adapt),
+)
+
+def engine_for(sid):
+    """The in-memory engine of `sid` if this process is authoritative for it, else None."""
+    if not GAME_ENGINE or not sid:
+        return None
+    if SESSION_AFFINITY and not owns_session():
+        return None
+    return engines.get(sid, db)
 
-            cursor.execute("UPDATE participants SET balance=%s WHERE id=%s", (payout, pid))
+# A write served by another worker (failover) makes the owner's copy stale.
+bus.subscribe("session.changed", lambda msg: engines.drop(msg["sid"]))
+
+
+# -------------------- Round finalization (atomic) --------------------
+_group_sizes = {}   # session_id -> group_size (fixed once a session exists)
+
+def _drop_session_state(sid: str):
+    engines.drop(sid)
+    phase_scheduler.forget(sid)
+    session_cache.drop(sid)
+    _notify_change(sid)
+    _group_sizes.pop(sid, None)
+    _replica_versions.pop(sid, None)
+    analytics_cache.invalidate()
+
+def invalidate_session(sid: str):
+    """Drop in-memory state of a reset/deleted session in this and all other workers."""
+    _drop_session_state(sid)
+    bus.publish("session.invalidate", sid=sid)
+
+bus.subscribe("session.invalidate", lambda msg: _drop_session_state(msg["sid"]))
+
+def _finalize_round(cursor, sid: str, r: int):
+    """Settle round `r` once everybody decided; returns the watch deadline, else None.
+
+    Runs inside the caller's transaction, on the session's writer lane.
+    """
+    cursor.execute("SELECT * FROM sessions WHERE id=%s", (sid,))
+    s = cursor.fetchone()
+    if not s:
+        return None
+    _group_sizes[sid] = int(s["group_size"])
+
+    cursor.execute(
+        "SELECT COUNT(*) as c FROM decisions WHERE session_id=%s AND round_number=%s",
+        (sid, r)
+    )
+    decided = cursor.fetchone()["c"]
+
+    if decided < s["group_size"]:
+        return None
+
+    cursor.execute(
+        "SELECT COUNT(*) as c FROM decisions WHERE session_id=%s AND round_number=%s AND total_cost IS NULL",
+        (sid, r)
+    )
+    missing = cursor.fetchone()["c"]
+
+    if missing <= 0:
+        return None
+
+    cursor.execute(
+        """SELECT d.id, d.participant_id, d.choice, p.ptype, p.join_number
+           FROM decisions d JOIN participants p ON p.id=d.participant_id
+           WHERE d.session_id=%s AND d.round_number=%s
+           ORDER BY p.join_number""",
+        (sid, r)
+    )
+    rows = cursor.fetchall()
+
+    total_A = sum(1 for row in rows if row["choice"] == "A")
+    N = s["group_size"]
+    M = float(s["starting_balance"] or 500)
+
+    for row in rows:
+        did = row["id"]
+        pid = row["participant_id"]
+        choice = row["choice"]
+        ptype = row["ptype"] or 1
+
+        if choice == "A":
+            cost = a_cost_for(ptype)
+            others_A = max(0, total_A - 1)
+            b_cost_round = None
+        else:
+            others_A = total_A
+            cost = b_cost_adapt(ptype, others_A, N)
+            b_cost_round = cost
+
+        payout = max(M - float(cost), 0)
 
         cursor.execute(
-            "UPDATE participants SET current_round = current_round + 1, ready_for_next = 0 WHERE session_id=%s AND current_round=%s",
-            (sid, r)
+            """UPDATE decisions
+               SET a_cost=%s, b_cost=%s, total_cost=%s,
+                   payout=%s, base_payout=%s, others_A=%s, b_cost_round=%s, reveal=1
+               WHERE id=%s AND total_cost IS NULL""",
+            (
+                cost if choice == "A" else None,
+                cost if choice == "B" else None,
+                cost,
+                payout,
+                M,
+                others_A,
+                b_cost_round,
+                did
+            )
         )
 
-        now = utc_now()
-        sec = int(s["watch_time"] or s["reveal_window"] or 5)
+        cursor.execute("UPDATE participants SET balance=%s WHERE id=%s", (payout, pid))
+
+    cursor.execute(
+        "UPDATE participants SET current_round = current_round + 1, ready_for_next = 0 WHERE session_id=%s AND current_round=%s",
+        (sid, r)
+    )
+
+    now = utc_now()
+    sec = int(s["watch_time"] or s["reveal_window"] or 5)
+    watch_ends = now + timedelta(seconds=sec)
+    cursor.execute(
+        """REPLACE INTO round_phases
+           (session_id,round_number,decision_ends_at,watch_ends_at,created_at,phase)
+           VALUES (%s,%s,%s,%s,%s,'watch')""",
+        (sid, r, iso_utc(now), iso_utc(watch_ends), iso_utc(now))
+    )
+    analytics.write_round_summary(cursor, sid, r, iso_utc(now))
+    return watch_ends
+
+def round_finalized(sid: str, r: int, watch_ends):
+    """Post-commit side effects of a settled round (None: nothing was settled)."""
+    if watch_ends:
+        phase_scheduler.schedule(sid, r, watch_ends)
+        session_changed(sid)
+        analytics_changed()
+
+
+# -------------------- Write journal (group commit) --------------------
+# All participant writes and round finalization of a session go through its
+# single-writer lane in journal.GroupCommitter; see journal.py.
+JOURNAL_MAX_BATCH = int(os.environ.get("JOURNAL_MAX_BATCH", "64"))
+JOURNAL_MAX_WAIT_MS = float(os.environ.get("JOURNAL_MAX_WAIT_MS", "5"))
+JOURNAL_THREADS = int(os.environ.get("JOURNAL_THREADS", "1"))
+JOURNAL_TIMEOUT = 10  # seconds a request waits for its batch to commit
+JOURNAL_RETENTION_DAYS = float(os.environ.get("JOURNAL_RETENTION_DAYS", "30"))  # 0 keeps game_events forever
+JOURNAL_PRUNE_EVERY = 3600  # seconds between retention runs
+
+# What a caller gets for a write to a session that is being reset or deleted
+_JOURNAL_CLOSED = {"choose": (False, None)}
+
+# Each apply function checks the session status in a statement it runs
+# anyway. The lock it takes on the sessions row holds until commit:
+# close_session's mark waits for this batch, and no later batch re-creates
+# rows the janitor is clearing.
+def _closed(cursor, sid):
+    cursor.execute("SELECT status FROM sessions WHERE id=%s LOCK IN SHARE MODE", (sid,))
+    s = cursor.fetchone()
+    return not s or bool(s["status"])
+
+def _discard(ev):
+    return journal.Discarded(_JOURNAL_CLOSED.get(ev["kind"]))
+
+def _group_size(cursor, sid):
+    n = _group_sizes.get(sid)
+    if n is None:
+        cursor.execute("SELECT group_size FROM sessions WHERE id=%s", (sid,))
+        s = cursor.fetchone()
+        n = _group_sizes[sid] = int(s["group_size"]) if s else 0
+    return n
+
+def _apply_join(cursor, ev):
+    cursor.execute(
+        "SELECT p.joined, p.join_number, p.ptype, s.status, s.group_size FROM participants p "
+        "JOIN sessions s ON s.id = p.session_id WHERE p.id=%s FOR UPDATE",
+        (ev["pid"],)
+    )
+    p = cursor.fetchone()
+    if not p or p["status"]:
+        return _discard(ev)
+    if not p["joined"]:
+        # Atomic per-session counter (see storage.Cursor.bump): constant time,
+        # and concurrent joins can never draw the same number.
+        nxt = cursor.bump("join_counters", {"session_id": ev["sid"]}, "last_join")
+        ptype = p["ptype"] or ((nxt-1) % 6) + 1
         cursor.execute(
-            """REPLACE INTO round_phases
-               (session_id,round_number,decision_ends_at,watch_ends_at,created_at)
-               VALUES (%s,%s,%s,%s,%s)""",
-            (sid, r, iso_utc(now), iso_utc(now + timedelta(seconds=sec)), iso_utc(now))
+            "UPDATE participants SET joined=1, join_number=%s, ptype=%s, created_at=COALESCE(created_at, %s) WHERE id=%s",
+            (nxt, ptype, ev["at"], ev["pid"])
         )
+        if nxt == p["group_size"]:
+            analytics.open_round(cursor, ev["sid"], 1, ev["at"])
+    else:
+        if not p["ptype"]:
+            ptype = (((p["join_number"] or 1) - 1) % 6) + 1
+            cursor.execute("UPDATE participants SET ptype=%s WHERE id=%s", (ptype, ev["pid"]))
+        cursor.execute("UPDATE participants SET joined=1 WHERE id=%s", (ev["pid"],))
+    return None
+
+def _apply_choose(cursor, ev):
+    """Returns (inserted, watch deadline if this decision completed the round)."""
+    # ux_participant_round makes the insert idempotent; only a fresh row bumps
+    # the round counter (an atomic upsert, see storage.Cursor.bump).
+    cursor.execute(
+        "INSERT IGNORE INTO decisions (session_id, participant_id, round_number, choice, created_at) "
+        "SELECT %s,%s,%s,%s,%s FROM sessions WHERE id=%s AND status IS NULL",
+        (ev["sid"], ev["pid"], ev["r"], ev["choice"], ev["at"], ev["sid"]),
+    )
+    if cursor.rowcount != 1:
+        # A repeated click, or (rarely) a closing session: tell them apart.
+        return _discard(ev) if _closed(cursor, ev["sid"]) else (False, None)
+    decided = cursor.bump("round_progress", {"session_id": ev["sid"], "round_number": ev["r"]}, "decided")
+    # The last decision settles the round right here, on the session's lane.
+    n = _group_sizes.get(ev["sid"])
+    if n is None or decided >= n:
+        return True, _finalize_round(cursor, ev["sid"], ev["r"])
+    return True, None
+
+def _apply_ready(cursor, ev):
+    cursor.execute(
+        "UPDATE participants SET ready_for_next=1 WHERE id=%s AND ready_for_next=0 "
+        "AND session_id IN (SELECT id FROM sessions WHERE id=%s AND status IS NULL)",
+        (ev["pid"], ev["sid"])
+    )
+    if cursor.rowcount != 1:
+        return _discard(ev) if _closed(cursor, ev["sid"]) else None
+    # The last confirmation opens round r for the group.
+    cursor.execute("SELECT COUNT(*) AS c FROM participants WHERE session_id=%s AND ready_for_next=1", (ev["sid"],))
+    if cursor.fetchone()["c"] >= _group_size(cursor, ev["sid"]):
+        analytics.open_round(cursor, ev["sid"], ev["r"], ev["at"])
+    return None
+
+def _apply_finalize(cursor, ev):
+    if _closed(cursor, ev["sid"]):
+        return _discard(ev)
+    return _finalize_round(cursor, ev["sid"], ev["r"])
+
+_JOURNAL_APPLY = {
+    "join": _apply_join,
+    "choose": _apply_choose,
+    "ready": _apply_ready,
+    "finalize": _apply_finalize,
+}
 
-        con.commit()
+def _apply_event(cursor, ev):
+    result = _JOURNAL_APPLY[ev["kind"]](cursor, ev)
+    if isinstance(result, journal.Discarded):
+        return journal.Discarded((result.result, 0))
+    version = cursor.bump("session_versions", {"session_id": ev["sid"]}, "version")
+    return result, version
+
+committer = journal.GroupCommitter(
+    _connect_db,
+    _apply_event,
+    max_batch=JOURNAL_MAX_BATCH,
+    max_wait=JOURNAL_MAX_WAIT_MS / 1000.0,
+    threads=JOURNAL_THREADS,
+    logger=app.logger,
+)
+
+class JournalBusy(Exception):
+    """A write was not committed within JOURNAL_TIMEOUT; it may still be."""
 
-    except Exception:
+def commit_event(kind, sid, pid=None, **payload):
+    """Journal a participant write and wait until its batch is committed."""
+    payload.setdefault("at", iso_utc(utc_now()))
+    fut = committer.submit(kind, sid, pid, **payload)
+    try:
+        result, version = fut.result(timeout=JOURNAL_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        raise JournalBusy(kind) from None
+    note_write(sid, version)
+    return result
+
+@app.errorhandler(JournalBusy)
+@app.errorhandler(engine.LogBusy)
+def journal_busy(exc):
+    # Every journaled write is idempotent, so the client just sends it again.
+    if request.endpoint == "join":
+        resp = make_response(render_template(
+            "join.html", error="Der Server ist gerade ausgelastet. Bitte den Code noch einmal absenden."
+        ), 503)
+    else:
+        resp = jsonify({"err": "busy", "retry_after_ms": 1000})
+        resp.status_code = 503
+    resp.headers["Retry-After"] = "1"
+    return resp
+
+
+# -------------------- Session janitor --------------------
+# Reset and delete run in the background: the admin request only marks the
+# session (sessions.status = 'resetting' / 'deleting') and from then on no
+# participant route serves it. A daemon thread clears its rows in batches of
+# JANITOR_BATCH, one short transaction per batch, so a big session never
+# holds row locks or a long undo log while other sessions are playing.
+# Each batch re-checks the mark under a row lock: a job that was superseded
+# (reset turned into delete) or already finished by another worker stops.
+# Between jobs the same thread applies JOURNAL_RETENTION_DAYS to game_events.
+JANITOR_BATCH = int(os.environ.get("JANITOR_BATCH", "500"))
+JANITOR_PAUSE = float(os.environ.get("JANITOR_PAUSE_MS", "20")) / 1000.0
+
+# Per-session tables cleared by reset and delete, biggest first
+_SESSION_TABLES = ("game_events", "decisions", "round_payouts", "round_summary",
+                   "round_progress", "round_phases", "join_counters")
+
+closing_sessions = {}   # session_id -> 'resetting' / 'deleting', kept in every worker
+
+def _mark_closing(sid, status, publish=True):
+    if status:
+        closing_sessions[sid] = status
+    else:
+        closing_sessions.pop(sid, None)
+    if publish:
+        bus.publish("session.closing", sid=sid, status=status)
+
+bus.subscribe("session.closing", lambda msg: _mark_closing(msg["sid"], msg["status"], publish=False))
+
+def _prune_journal():
+    """Delete game_events older than JOURNAL_RETENTION_DAYS, oldest first, in batches.
+
+    Nothing reads the journal back once its batch is committed; it is kept
+    for audits only. Ids grow with time, so each batch is a primary-key range.
+    """
+    cutoff = iso_utc(utc_now() - timedelta(days=JOURNAL_RETENTION_DAYS))
+    con = _connect_db()
+    try:
+        while True:
+            row = con.execute(
+                "SELECT MAX(id) AS m FROM (SELECT id, created_at FROM game_events ORDER BY id LIMIT %s) t "
+                "WHERE created_at IS NULL OR created_at < %s",
+                (JANITOR_BATCH, cutoff)
+            ).fetchone()
+            if not row or row["m"] is None:
+                return
+            n = con.execute("DELETE FROM game_events WHERE id <= %s", (row["m"],)).rowcount
+            con.commit()
+            if n < JANITOR_BATCH:
+                return
+            time.sleep(JANITOR_PAUSE)
+    finally:
+        con.close()
+
+class SessionJanitor:
+    """Runs queued session resets and deletes, one batch at a time."""
+
+    def __init__(self):
+        self._jobs = collections.deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._next_prune = 0.0
+        self.current = None     # (sid, status) being worked on
+
+    def start(self):
+        """Resume jobs left over from before a restart (they also start on submit())."""
+        with self._cond:
+            self._ensure_thread()
+
+    def submit(self, sid, status):
+        with self._cond:
+            self._jobs.append((sid, status))
+            self._ensure_thread()
+            self._cond.notify()
+
+    def after_fork(self):
+        self._jobs = collections.deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._next_prune = 0.0
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="session-janitor", daemon=True)
+            self._thread.start()
+
+    def _load_pending(self):
+        con = _connect_db()
+        try:
+            rows = con.execute("SELECT id, status FROM sessions WHERE status IS NOT NULL").fetchall()
+        finally:
+            con.close()
+        with self._cond:
+            for row in rows:
+                closing_sessions[row["id"]] = row["status"]
+                if (row["id"], row["status"]) not in self._jobs:
+                    self._jobs.append((row["id"], row["status"]))
+
+    def _run(self):
+        try:
+            self._load_pending()
+        except Exception:
+            app.logger.exception("session janitor: could not load pending jobs")
+        while True:
+            with self._cond:
+                while not self._jobs:
+                    wait = self._next_prune - time.monotonic() if JOURNAL_RETENTION_DAYS else None
+                    if wait is not None and wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                self.current = self._jobs.popleft() if self._jobs else None
+            if self.current is None:
+                self._next_prune = time.monotonic() + JOURNAL_PRUNE_EVERY
+                try:
+                    _prune_journal()
+                except Exception:
+                    app.logger.exception("session janitor: pruning game_events failed")
+                continue
+            sid, status = self.current
+            try:
+                finished = self._work(sid, status)
+            except Exception:
+                app.logger.exception("session janitor: %s of %s failed", status, sid)
+                finished = False
+                time.sleep(1)
+                self.submit(sid, status)   # retry; the batches already done stay done
+            self.current = None
+            if finished:
+                _mark_closing(sid, None)
+                invalidate_session(sid)
+
+    def _work(self, sid, status) -> bool:
+        """Clear the session in batches; False if the job was superseded."""
+        con = _connect_db()
         try:
+            tables = _SESSION_TABLES + (("session_versions", "participants") if status == "deleting" else ())
+            total = sum(
+                con.execute(f"SELECT COUNT(*) c FROM {table} WHERE session_id=%s", (sid,)).fetchone()["c"]
+                for table in tables
+            )
+            if status == "resetting":
+                total += con.execute(
+                    "SELECT COUNT(*) c FROM participants WHERE session_id=%s", (sid,)
+                ).fetchone()["c"]
+            con.execute("UPDATE sessions SET status_total=status_done+%s WHERE id=%s AND status=%s", (total, sid, status))
+            con.commit()
+
+            for table in tables:
+                if not self._drain(con, sid, status, f"DELETE FROM {table} WHERE session_id=%s LIMIT {JANITOR_BATCH}", (sid,)):
+                    return False
+            if status == "resetting":
+                s = con.execute("SELECT starting_balance FROM sessions WHERE id=%s", (sid,)).fetchone()
+                if not s or not self._drain(con, sid, status, f"""
+                        UPDATE participants
+                        SET current_round=1, join_number=NULL, joined=0, balance=%s, completed=0, ready_for_next=0
+                        WHERE session_id=%s AND (joined=1 OR completed=1 OR ready_for_next=1 OR current_round<>1
+                              OR join_number IS NOT NULL OR balance<>%s)
+                        LIMIT {JANITOR_BATCH}""", (s["starting_balance"], sid, s["starting_balance"])):
+                    return False
+                last = "UPDATE sessions SET status=NULL, status_done=0, status_total=0, archived=0 WHERE id=%s"
+            else:
+                last = "DELETE FROM sessions WHERE id=%s"
+            if self._batch(con, sid, status, last, (sid,), progress=False) is None:
+                return False
+            touch_session(con, sid)   # the reset/delete itself, for incremental backups
+            con.commit()
+            return True
+        finally:
+            con.close()
+
+    def _drain(self, con, sid, status, sql, args) -> bool:
+        while True:
+            n = self._batch(con, sid, status, sql, args)
+            if n is None:
+                return False
+            if n < JANITOR_BATCH:
+                return True
+            time.sleep(JANITOR_PAUSE)   # let the live sessions' writes through
+
+    @staticmethod
+    def _batch(con, sid, status, sql, args, progress=True):
+        """Run one statement in its own transaction while the mark holds; rows affected or None."""
+        con.execute("START TRANSACTION")
+        try:
+            row = con.execute("SELECT status FROM sessions WHERE id=%s FOR UPDATE", (sid,)).fetchone()
+            if not row or row["status"] != status:
+                con.rollback()
+                return None
+            n = con.execute(sql, args).rowcount
+            if progress and n > 0:
+                con.execute("UPDATE sessions SET status_done=status_done+%s WHERE id=%s", (n, sid))
+            con.commit()
+            return n
+        except Exception:
             con.rollback()
+            raise
+
+session_janitor = SessionJanitor()
+
+def close_session(sid, status) -> bool:
+    """Mark `sid` for a background reset/delete and queue the job.
+
+    A reset may turn into a delete, not the other way round. False if the
+    session does not exist or is already marked. Writes still in flight in
+    any worker (journal lanes, engine write-behind) are discarded when they
+    reach the database: both check the mark under a share lock, so none of
+    them can re-create rows behind the janitor.
+    """
+    con = db()
+    allowed = "status IS NULL" if status == "resetting" else "(status IS NULL OR status='resetting')"
+    n = con.execute(
+        f"UPDATE sessions SET status=%s, status_done=0, status_total=0 WHERE id=%s AND {allowed}",
+        (status, sid)
+    ).rowcount
+    if n:
+        touch_session(con, sid)
+    con.commit()
+    if not n:
+        return False
+    _mark_closing(sid, status)
+    engines.drop(sid)  # flush this worker's write-behind log; the owner's drops on invalidate
+    invalidate_session(sid)
+    session_janitor.submit(sid, status)
+    return True
+
+
+# -------------------- Static assets --------------------
+# Every url_for('static', ...) carries the file's content hash (?v=...), so a
+# URL never changes meaning and is served with a one-year immutable
+# Cache-Control. Text assets are compressed once per file version (gzip, and
+# brotli when the optional `brotli` package is installed).
+STATIC_MAX_AGE = 365 * 24 * 3600
+STATIC_COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt")
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+class StaticAssets:
+    """Content hash and precompressed variants of each file in static/."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._files = {}   # filename -> (stat key, hash, {encoding: bytes})
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        path = safe_join(self.folder, filename)
+        try:
+            st = os.stat(path) if path else None
+        except OSError:
+            st = None
+        if st is None or not os.path.isfile(path):
+            return None
+        key = (st.st_mtime_ns, st.st_size)
+        entry = self._files.get(filename)
+        if entry is None or entry[0] != key:
+            with open(path, "rb") as f:
+                data = f.read()
+            variants = {"identity": data}
+            if filename.endswith(STATIC_COMPRESSIBLE):
+                variants["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+                if brotli is not None:
+                    variants["br"] = brotli.compress(data, quality=11)
+            entry = (key, hashlib.sha256(data).hexdigest()[:12], variants)
+            with self._lock:
+                self._files[filename] = entry
+        return entry
+
+    def version(self, filename):
+        entry = self.get(filename)
+        return entry[1] if entry else None
+
+static_assets = StaticAssets(app.static_folder)
+
+@app.url_defaults
+def _fingerprint_static(endpoint, values):
+    if endpoint == "static" and "v" not in values:
+        version = static_assets.version(values.get("filename", ""))
+        if version:
+            values["v"] = version
+
+def static_file(filename):
+    entry = static_assets.get(filename)
+    if entry is None:
+        abort(404)
+    _, version, variants = entry
+    encoding = next((e for e in ("br", "gzip") if e in variants and request.accept_encodings[e]), "identity")
+    resp = app.response_class(
+        variants[encoding], mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    )
+    if encoding != "identity":
+        resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+    resp.set_etag(f"{version}-{encoding}")
+    if request.args.get("v") == version:
+        resp.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+    else:
+        resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+app.view_functions["static"] = static_file
+
+
+# -------------------- Traffic recording --------------------
+# RECORD_TRAFFIC=<file> appends one JSON line per request for replay.py:
+# start time, method, route rule, status and duration, plus whitelisted
+# parameters. Session and participant ids become keyed-hash aliases (same
+# key in every worker, not reversible without SECRET_KEY); participant
+# codes, passwords and other form data are never written. Once per session
+# a line with its group size and number of rounds follows.
+RECORD_TRAFFIC = os.environ.get("RECORD_TRAFFIC")
+RECORD_PARAMS = ("round", "wait", "results", "by", "ptype", "group_size", "since", "until")
+RECORD_BODY = ("choice",)
+
+class TrafficRecorder:
+    """Appends anonymized request records to a JSONL file."""
+
+    def __init__(self, path, secret):
+        # O_APPEND + one write() per line keeps lines whole across workers
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self._key = hashlib.sha256(b"traffic:" + secret.encode()).digest()
+        self._sessions = set()
+        self._lock = threading.Lock()
+
+    def alias(self, value, prefix):
+        if not value:
+            return None
+        return prefix + hashlib.blake2s(str(value).encode(), key=self._key, digest_size=6).hexdigest()
+
+    def write(self, record):
+        os.write(self._fd, (json.dumps(record, separators=(",", ":")) + "\n").encode())
+
+    def request(self, resp, started, pid):
+        rule = request.url_rule.rule if request.url_rule else None
+        if rule is None:
+            return
+        sid = (
+            (request.view_args or {}).get("session_id") or request.args.get("session_id")
+            or request.form.get("session_id") or _response_cookie(resp, SESSION_COOKIE)
+            or request.cookies.get(SESSION_COOKIE)
+        )
+        record = {
+            "t": round(started, 3),
+            "m": request.method,
+            "r": rule,
+            "s": self.alias(sid, "s"),
+            "p": self.alias(flask_session.get("participant_id") or pid, "p"),
+            "st": resp.status_code,
+            "ms": round((time.time() - started) * 1000, 2),
+        }
+        if flask_session.get("admin_ok"):
+            record["adm"] = 1
+        args = {k: (self.alias(v, "s") if k == "session_id" else v) for k, v in (request.view_args or {}).items()}
+        if args:
+            record["a"] = args
+        query = {k: v for k, v in request.args.items() if k in RECORD_PARAMS}
+        for k, prefix in (("session_id", "s"), ("participant_id", "p")):
+            if request.args.get(k):
+                query[k] = self.alias(request.args[k], prefix)
+        if query:
+            record["q"] = query
+        body = request.get_json(silent=True) if request.is_json else None
+        if isinstance(body, dict) and any(k in body for k in RECORD_BODY):
+            record["b"] = {k: body[k] for k in RECORD_BODY if k in body}
+        self.write(record)
+        if sid and record["s"] not in self._sessions:
+            with self._lock:
+                self._sessions.add(record["s"])
+            row = db().execute("SELECT group_size, rounds FROM sessions WHERE id=%s", (sid,)).fetchone()
+            if row:
+                self.write({"session": record["s"], "group_size": row["group_size"], "rounds": row["rounds"]})
+
+def _response_cookie(resp, name):
+    for header in resp.headers.getlist("Set-Cookie"):
+        if header.startswith(name + "="):
+            return header.split(";", 1)[0].split("=", 1)[1] or None
+    return None
+
+if RECORD_TRAFFIC:
+    recorder = TrafficRecorder(RECORD_TRAFFIC, app.secret_key)
+
+    def _record_start():
+        g.record_start = time.time()
+        g.record_pid = flask_session.get("participant_id")   # /done drops it
+
+    # Ahead of the hooks registered above, so requests they short-circuit
+    # (e.g. refuse_closing_session) are recorded too.
+    app.before_request_funcs.setdefault(None, []).insert(0, _record_start)
+
+    @app.after_request
+    def _record_request(resp):
+        start = g.get("record_start")
+        if start is None:
+            return resp
+        try:
+            recorder.request(resp, start, g.record_pid)
         except Exception:
-            pass
-        raise
-    finally:
-        cursor.close()
+            app.logger.exception("traffic recording failed")
+        return resp
 
 
 # -------------------- Public --------------------
@@ -510,96 +1987,95 @@ def join():
             return render_template("join.html", error="Code unbekannt.")
         if p["completed"]:
             return render_template("join.html", error="Dieser Code wurde bereits abgeschlossen. Bitte neuen Code verwenden.")
+        if p["session_id"] in closing_sessions:
+            return render_template("join.html", error="Diese Session wird gerade zurückgesetzt oder gelöscht. Bitte kurz warten.")
         now = iso_utc(utc_now())
-        if not p["joined"]:
-            nxt = con.execute(
-                "SELECT COALESCE(MAX(join_number),0)+1 AS n FROM participants WHERE session_id=%s AND joined=1",
-                (p["session_id"],)
-            ).fetchone()["n"]
-            ptype = p["ptype"] or ((nxt-1) % 6) + 1
-            con.execute(
-                "UPDATE participants SET joined=1, join_number=%s, ptype=%s, created_at=COALESCE(created_at, %s) WHERE id=%s",
-                (nxt, ptype, now, p["id"])
-            )
+        eng = engine_for(p["session_id"])
+        if eng:
+            eng.join(p["id"], utc_now())
         else:
-            if not p["ptype"]:
-                cnt = con.execute(
-                    "SELECT COUNT(*) c FROM participants WHERE session_id=%s AND ptype IS NOT NULL",
-                    (p["session_id"],)
-                ).fetchone()["c"]
-                ptype = (cnt % 6) + 1
-                con.execute("UPDATE participants SET ptype=%s WHERE id=%s", (ptype, p["id"]))
-            con.execute("UPDATE participants SET joined=1 WHERE id=%s", (p["id"],))
+            commit_event("join", p["session_id"], p["id"], at=now)
         flask_session["participant_id"] = p["id"]
         flask_session.permanent = False
-        con.commit()
+        con.commit()  # end this connection's snapshot so the re-read sees the join
+        session_changed(p["session_id"])
         p2 = con.execute("SELECT * FROM participants WHERE id=%s", (p["id"],)).fetchone()
+        if eng:
+            p2 = eng.overlay(p2)
         s = con.execute("SELECT * FROM sessions WHERE id=%s", (p["session_id"],)).fetchone()
-        return redirect(state_to_url(current_state(con, p2, s)))
+        resp = redirect(state_to_url(current_state(con, p2, s)))
+        # Routing hint for the affinity dispatcher; carries no secret.
+        resp.set_cookie(SESSION_COOKIE, p["session_id"], httponly=True, samesite="Lax")
+        return resp
     return render_template("join.html", error=None)
 
-@app.route("/lobby")
-@guard("lobby")
-def lobby():
-    con = db()
-    s = con.execute("SELECT * FROM sessions WHERE id=%s", (g.participant["session_id"],)).fetchone()
-    joined = con.execute(
-        "SELECT COUNT(*) c FROM participants WHERE session_id=%s AND joined=1",
-        (s["id"],)
-    ).fetchone()["c"]
-    return render_template("lobby.html", session=s, participant=g.participant, joined=joined)
-
-@app.get("/lobby_status")
-def lobby_status():
-    sid = request.args.get("session_id")
-    pid = request.args.get("participant_id")
-    con = db()
-    s = con.execute("SELECT * FROM sessions WHERE id=%s", (sid,)).fetchone()
-    if not s:
-        return jsonify({"err": "unknown_session"}), 404
-    joined = con.execute(
-        "SELECT COUNT(*) c FROM participants WHERE session_id=%s AND joined=1",
-        (sid,)
-    ).fetchone()["c"]
-
-    reset = False
-    if pid:
-        p = con.execute("SELECT joined FROM participants WHERE id=%s", (pid,)).fetchone()
-        if p and not p["joined"]:
-            reset = True
-
-    return jsonify({"joined": joined, "group_size": s["group_size"], "ready": joined >= s["group_size"], "reset": reset})
-
-# ---------- Round ----------
-@app.route("/round")
-@guard("round")
-def round_view():
-    con = db()
+# ---------- Single-page client ----------
+# /play is rendered once per participant and session; play.js switches
+# between lobby, round, wait and reveal from the /state feed. The phase
+# payloads (status.py) are shared by /state and the per-phase status endpoints.
+@app.route("/play")
+@uses_participant("id", "session_id", "ptype", "join_number")
+def play():
+    if not g.participant:
+        return redirect(url_for("join"))
     p = g.participant
-    s = con.execute("SELECT * FROM sessions WHERE id=%s", (p["session_id"],)).fetchone()
-    r = p["current_round"]
+    s = db().execute("SELECT * FROM sessions WHERE id=%s", (p["session_id"],)).fetchone()
     ptype = p["ptype"] or 1
     N = s["group_size"]
-
-    a_cost_display = a_cost_for(ptype)
     others_max = max(1, N - 1)
-    b_row_costs = [int(b_cost_adapt(ptype, k, N)) for k in range(1, others_max + 1)]
-    b_list = [{"others": k, "cost": b_row_costs[k-1]} for k in range(1, others_max + 1)]
-
+    b_list = [{"others": k, "cost": int(b_cost_adapt(ptype, k, N))} for k in range(1, others_max + 1)]
     return render_template(
-        "round.html",
+        "play.html",
         session=s,
-        round_number=r,
-        N=N,
-        a_cost_display=a_cost_display,
+        participant=p,
+        a_cost_display=a_cost_for(ptype),
         b_list=b_list,
-        others_max=others_max,
         base_payout=int(s["starting_balance"] or 500),
-        balance_current=int(s["starting_balance"] or 500),
-        participant=p
     )
 
+@app.route("/lobby")
+@app.route("/round")
+@app.route("/wait")
+@app.route("/reveal")
+@app.route("/feedback")
+@uses_participant()
+def phase_page():
+    """Per-phase pages of older clients; everything is served by /play now."""
+    return redirect(url_for("play"))
+
+@app.get("/state")
+@uses_participant("id", "session_id", "current_round")
+@replica_reads
+@session_cached
+@poll_endpoint()
+def state_feed():
+    """Current phase of the caller plus the data /play needs to show it.
+
+    `results=<round>` tells the server the client already has the result
+    table of that round, so the reveal phase does not resend it each poll.
+    """
+    p = g.participant
+    if not p:
+        return jsonify({"state": "join"})
+    feed = partial(status_for(p["session_id"]).feed, p, request.args.get("results"))
+    return jsonify(status_run(feed))
+
+@app.get("/lobby_status")
+@uses_participant()
+@replica_reads
+@session_cached
+@poll_endpoint()
+def lobby_status():
+    sid = request.args.get("session_id")
+    payload = status.run(db(), status_for(sid).lobby(sid, request.args.get("participant_id")))
+    if payload is None:
+        return jsonify({"err": "unknown_session"}), 404
+    return jsonify(payload)
+
+# ---------- Round ----------
+
 @app.post("/choose")
+@uses_participant("id", "session_id", "current_round")
 def choose():
     if not g.participant:
         return ("No participant", 400)
@@ -607,295 +2083,198 @@ def choose():
     choice = (data.get("choice") or "").upper()
     if choice not in ("A", "B"):
         return ("Invalid choice", 400)
-    con = db()
     p = g.participant
-    s = con.execute("SELECT * FROM sessions WHERE id=%s", (p["session_id"],)).fetchone()
+    sid = p["session_id"]
     r = p["current_round"]
 
-    already = con.execute(
-        "SELECT 1 FROM decisions WHERE participant_id=%s AND round_number=%s",
-        (p["id"], r)
-    ).fetchone()
-    if already:
-        return jsonify({"ok": True})
+    eng = engine_for(sid)
+    if eng:
+        r, inserted, watch_ends = eng.choose(p["id"], choice, utc_now())
+        if inserted:
+            session_changed(sid)
+        round_finalized(sid, r, watch_ends)
+        return jsonify({"ok": True, "duplicate": not inserted, "completed": watch_ends is not None})
 
-    con.execute(
-        "INSERT INTO decisions (session_id, participant_id, round_number, choice, created_at) VALUES (%s,%s,%s,%s,%s)",
-        (s["id"], p["id"], r, choice, iso_utc(utc_now())),
-    )
-    con.commit()
-    return jsonify({"ok": True})
-
-@app.route("/wait")
-@guard("wait")
-def wait_view():
-    con = db()
-    p = g.participant
-    s = con.execute("SELECT * FROM sessions WHERE id=%s", (p["session_id"],)).fetchone()
-    r = p["current_round"]
-    decided = con.execute(
-        "SELECT COUNT(*) c FROM decisions WHERE session_id=%s AND round_number=%s",
-        (s["id"], r)
-    ).fetchone()["c"]
-    return render_template("wait.html", session=s, round_number=r, decided=decided, participant=p)
+    inserted, watch_ends = commit_event("choose", sid, p["id"], r=r, choice=choice, at=iso_utc(utc_now()))
+    if inserted:
+        session_changed(sid)
+    round_finalized(sid, r, watch_ends)
+    return jsonify({"ok": True, "duplicate": not inserted, "completed": watch_ends is not None})
 
 @app.get("/round_status")
+@uses_participant()
+@replica_reads
+@session_cached
+@poll_endpoint()
 def round_status():
     sid = request.args.get("session_id")
-    r = int(request.args.get("round"))
-    pid = request.args.get("participant_id")
-    con = db()
-    s = con.execute("SELECT * FROM sessions WHERE id=%s", (sid,)).fetchone()
-    if not s:
+    payload = status_run(partial(status_for(sid).round, sid, int(request.args.get("round")),
+                                 request.args.get("participant_id")))
+    if payload is None:
         return jsonify({"err": "unknown_session"}), 404
-
-    reset = False
-    if pid:
-        p = con.execute("SELECT joined FROM participants WHERE id=%s", (pid,)).fetchone()
-        if p and not p["joined"]:
-            reset = True
-    if reset:
-        return jsonify({"reset": True})
-
-    decided = con.execute(
-        "SELECT COUNT(*) c FROM decisions WHERE session_id=%s AND round_number=%s",
-        (sid, r)
-    ).fetchone()["c"]
-    ready = decided >= s["group_size"]
-
-    players_payload = []
-    watch_ends_at = None
-
-    if ready:
-        try:
-            _finalize_round_atomic(con, sid, r, s)
-        except pymysql.OperationalError:
-            pass
-
-        rp = con.execute(
-            "SELECT * FROM round_phases WHERE session_id=%s AND round_number=%s",
-            (sid, r)
-        ).fetchone()
-        watch_ends_at = rp["watch_ends_at"] if rp else None
-
-        for row in con.execute("""
-             SELECT p.join_number, d.choice, d.total_cost, d.payout
-             FROM decisions d JOIN participants p ON p.id=d.participant_id
-             WHERE d.session_id=%s AND d.round_number=%s ORDER BY p.join_number
-        """, (sid, r)).fetchall():
-            players_payload.append({
-                "player_no": row["join_number"],
-                "choice": row["choice"],
-                "cost": row["total_cost"],
-                "payout": row["payout"],
-            })
-
-    decided_players = [row["join_number"] for row in con.execute(
-        "SELECT p.join_number FROM decisions d JOIN participants p ON p.id=d.participant_id "
-        "WHERE d.session_id=%s AND d.round_number=%s ORDER BY p.join_number",
-        (sid, r)
-    ).fetchall()]
-
-    return jsonify({
-        "decided": decided,
-        "ready": ready,
-        "decided_players": decided_players,
-        "watch_ends_at": watch_ends_at,
-        "players": players_payload
-    })
+    return jsonify(payload)
 
 # ---------- Reveal ----------
-@app.route("/reveal")
-@guard("reveal")
-def reveal():
-    con = db()
-    p = g.participant
-    s = con.execute("SELECT * FROM sessions WHERE id=%s", (p["session_id"],)).fetchone()
-    r = p["current_round"] - 1
-    if r < 1: return redirect(url_for("round_view"))
-    is_last_round = (p["current_round"] > s["rounds"])
-    return render_template("reveal.html", session=s, round_number=r, participant=p, is_last_round=is_last_round)
+
+def _not_settled():
+    # Polled before the last decision of the round was in: nothing to show yet.
+    resp = jsonify({"err": "not_settled", "retry_after_ms": retry_after_ms("round")})
+    resp.status_code = 409
+    return resp
 
 @app.get("/reveal_status")
+@uses_participant("id")
+@session_cached
+@poll_endpoint()
 def reveal_status():
     sid = request.args.get("session_id")
     r = int(request.args.get("round") or 0)
-    con = db()
-    s = con.execute("SELECT * FROM sessions WHERE id=%s", (sid,)).fetchone()
-    if not s or r < 1: return jsonify({"err":"bad"}), 400
 
-    ph = con.execute(
-        "SELECT decision_ends_at, watch_ends_at FROM round_phases WHERE session_id=%s AND round_number=%s",
-        (sid, r)
-    ).fetchone()
     now = utc_now()
-    if not ph:
-        sec = int(s["reveal_window"] or 5)
-        con.execute(
-            "REPLACE INTO round_phases (session_id,round_number,decision_ends_at,watch_ends_at,created_at) VALUES (%s,%s,%s,%s,%s)",
-            (sid, r, iso_utc(now), iso_utc(now + timedelta(seconds=sec)), iso_utc(now))
-        )
-        con.commit()
-        ends_at = iso_utc(now + timedelta(seconds=sec))
+    eng = engine_for(sid)
+    if eng:
+        if r < 1: return jsonify({"err":"bad"}), 400
+        ends_at, opened = eng.open_phase(r, now)
+        if ends_at is None:
+            return _not_settled()
+        ends_at = ends_at if ends_at.endswith("Z") else ends_at + "Z"
+        if opened:
+            phase_scheduler.schedule(sid, r, parse_iso_utc(ends_at))
+        phase = phase_scheduler.phase(sid, r) or "watch"
+        if phase == "watch" and now >= parse_iso_utc(ends_at):
+            phase = "done"
+        eng.reveal(r)
+        players, me = eng.reveal_players(r, g.participant["id"] if g.participant else None)
+        summary = analytics.reveal_summary((pl["choice"], pl["payout"]) for pl in players if pl["choice"])
     else:
-        ends_at = ph["watch_ends_at"] if ph["watch_ends_at"].endswith("Z") else ph["watch_ends_at"] + "Z"
-
-    con.execute(
-        "UPDATE decisions SET reveal=1 WHERE session_id=%s AND round_number=%s AND (reveal IS NULL OR reveal!=1)",
-        (sid, r)
-    )
-    con.commit()
-
-    rows = con.execute("""
-        SELECT p.id as pid, p.code, p.join_number, d.choice, d.payout
-        FROM participants p
-        LEFT JOIN decisions d ON d.participant_id=p.id AND d.round_number=%s
-        WHERE p.session_id=%s
-        ORDER BY p.join_number, p.code
-    """, (r, sid)).fetchall()
+        con = db()
+        s = con.execute("SELECT id, group_size, reveal_window FROM sessions WHERE id=%s", (sid,)).fetchone()
+        if not s or r < 1: return jsonify({"err":"bad"}), 400
 
-    players = []
-    me = None
-    for row in rows:
-        obj = {
-            "code": row["code"],
-            "player_no": row["join_number"],
-            "choice": row["choice"],
-            "payout": row["payout"],
-        }
-        players.append(obj)
-        if g.participant and row["pid"] == g.participant["id"]:
-            me = obj
+        ph = con.execute(
+            "SELECT decision_ends_at, watch_ends_at, phase FROM round_phases WHERE session_id=%s AND round_number=%s",
+            (sid, r)
+        ).fetchone()
+        if not ph:
+            # _finalize_round writes the row; without one only a round settled
+            # by an older release may get its watch phase here.
+            (decided, unsettled), = con.rows(
+                "SELECT COUNT(*), COALESCE(SUM(total_cost IS NULL), 0) FROM decisions WHERE session_id=%s AND round_number=%s",
+                (sid, r)
+            )
+            if decided < int(s["group_size"]) or unsettled:
+                return _not_settled()
+            sec = int(s["reveal_window"] or 5)
+            watch_ends = now + timedelta(seconds=sec)
+            con.execute(
+                "REPLACE INTO round_phases (session_id,round_number,decision_ends_at,watch_ends_at,created_at,phase) VALUES (%s,%s,%s,%s,%s,'watch')",
+                (sid, r, iso_utc(now), iso_utc(watch_ends), iso_utc(now))
+            )
+            con.commit()
+            phase_scheduler.schedule(sid, r, watch_ends)
+            ends_at = iso_utc(watch_ends)
+            phase = "watch"
+        else:
+            ends_at = ph["watch_ends_at"] if ph["watch_ends_at"].endswith("Z") else ph["watch_ends_at"] + "Z"
+            phase = phase_scheduler.phase(sid, r) or ph["phase"] or "watch"
+            if phase == "watch" and now >= parse_iso_utc(ends_at):
+                # Deadline owned by another process whose scheduler has not fired yet.
+                phase = "done"
+
+        if con.execute(
+            "UPDATE decisions SET reveal=1 WHERE session_id=%s AND round_number=%s AND (reveal IS NULL OR reveal!=1)",
+            (sid, r)
+        ).rowcount:
+            touch_session(con, sid)
+        con.commit()
 
-    ph2 = con.execute(
-        "SELECT watch_ends_at FROM round_phases WHERE session_id=%s AND round_number=%s",
-        (sid, r)
-    ).fetchone()
-    phase = "watch"
-    if ph2 and utc_now() >= parse_iso_utc(ph2["watch_ends_at"]):
-        phase = "done"
+        rows = con.rows(f"""
+            SELECT p.id, p.code, p.join_number, d.choice, {storage.cents_sql("d.payout")}
+            FROM participants p
+            LEFT JOIN decisions d ON d.participant_id=p.id AND d.round_number=%s
+            WHERE p.session_id=%s
+            ORDER BY p.join_number, p.code
+        """, (r, sid))
+
+        players = []
+        me = None
+        me_id = g.participant["id"] if g.participant else None
+        for pid, code, player_no, choice, payout in rows:
+            obj = {
+                "code": code,
+                "player_no": player_no,
+                "choice": choice,
+                "payout": storage.money(payout),
+            }
+            players.append(obj)
+            if pid == me_id:
+                me = obj
+        summary = analytics.round_summary(con, sid, r)
+        if summary:
+            summary = {k: summary[k] for k in analytics.REVEAL_FIELDS}
+
+    if phase == "done":
         ends_at = iso_utc(utc_now())
 
-    return jsonify({"phase": phase, "ends_at": ends_at, "total": len(players), "players": players, "me": me})
+    return jsonify({
+        "phase": phase,
+        "ends_at": ends_at,
+        "phase_version": phase_scheduler.version(sid),
+        "total": len(players),
+        "players": players,
+        "me": me,
+        "summary": summary,
+        "retry_after_ms": retry_after_ms(phase, parse_iso_utc(ends_at) if phase == "watch" else None)
+    })
 
 # ---------- Ready Confirmation ----------
 @app.post("/confirm_ready")
+@uses_participant("id", "session_id", "current_round")
 def confirm_ready():
     """Player confirms they are ready for the next round."""
     if not g.participant:
         return ("No participant", 400)
-    con = db()
     p = g.participant
-    con.execute("UPDATE participants SET ready_for_next=1 WHERE id=%s", (p["id"],))
-    con.commit()
+    eng = engine_for(p["session_id"])
+    if eng:
+        eng.confirm_ready(p["id"], utc_now())
+    else:
+        commit_event("ready", p["session_id"], p["id"], r=p["current_round"])
+    session_changed(p["session_id"])
     return jsonify({"ok": True})
 
 @app.get("/ready_status")
+@uses_participant("id")
+@replica_reads
+@session_cached
+@poll_endpoint()
 def ready_status():
-    """Returns status of who is ready for the next round."""
     sid = request.args.get("session_id")
-    pid = request.args.get("participant_id")
-    con = db()
-    s = con.execute("SELECT * FROM sessions WHERE id=%s", (sid,)).fetchone()
-    if not s:
+    me = g.participant["id"] if g.participant else None
+    payload = status.run(db(), status_for(sid).ready(sid, request.args.get("participant_id"), me))
+    if payload is None:
         return jsonify({"err": "unknown_session"}), 404
+    return jsonify(payload)
 
-    reset = False
-    if pid:
-        p = con.execute("SELECT joined FROM participants WHERE id=%s", (pid,)).fetchone()
-        if p and not p["joined"]:
-            reset = True
-    if reset:
-        return jsonify({"reset": True})
-
-    rows = con.execute(
-        """SELECT p.id, p.join_number, p.ready_for_next
-           FROM participants p WHERE p.session_id=%s ORDER BY p.join_number""",
-        (sid,)
-    ).fetchall()
-
-    ready_count = sum(1 for r in rows if r["ready_for_next"])
-    all_ready = ready_count >= s["group_size"]
-
-    players = []
-    me_ready = False
-    for row in rows:
-        is_ready = bool(row["ready_for_next"])
-        players.append({
-            "player_no": row["join_number"],
-            "ready": is_ready
-        })
-        if g.participant and row["id"] == g.participant["id"]:
-            me_ready = is_ready
-
-    return jsonify({
-        "ready_count": ready_count,
-        "group_size": s["group_size"],
-        "all_ready": all_ready,
-        "me_ready": me_ready,
-        "players": players
-    })
-
-# ---------- Feedback ----------
-@app.route("/feedback")
-@guard("feedback")
-def feedback():
-    con = db()
-    p = g.participant
-    s = con.execute("SELECT * FROM sessions WHERE id=%s", (p["session_id"],)).fetchone()
-    r = p["current_round"] - 1
-    if r < 1:
-        return redirect(url_for("round_view"))
-
-    d = con.execute(
-        "SELECT choice, total_cost, payout, base_payout, b_cost_round, others_A "
-        "FROM decisions WHERE session_id=%s AND participant_id=%s AND round_number=%s",
-        (s["id"], p["id"], r),
-    ).fetchone()
-
-    decided_A = con.execute(
-        "SELECT COUNT(*) AS c FROM decisions WHERE session_id=%s AND round_number=%s AND choice='A'",
-        (s["id"], r),
-    ).fetchone()["c"]
-    decided_B = con.execute(
-        "SELECT COUNT(*) AS c FROM decisions WHERE session_id=%s AND round_number=%s AND choice='B'",
-        (s["id"], r),
-    ).fetchone()["c"]
-
-    ctx = dict(
-        session=s,
-        N=s["group_size"],
-        round_number=r,
-        my_choice=d["choice"] if d else None,
-        my_cost=d["total_cost"] if d else None,
-        payout=(d["payout"] if d else None),
-        base_payout=(d["base_payout"] if d else s["starting_balance"]),
-        b_cost_round=(d["b_cost_round"] if d else None),
-        others_A=(d["others_A"] if d else None),
-        decided_A=decided_A,
-        decided_B=decided_B,
-        next_round=(not s["archived"]) and (p["current_round"] <= s["rounds"]),
-    )
-    return render_template("feedback.html", **ctx)
-
-@app.route("/done")
+@app.route("/done", methods=["GET", "POST"])
 @guard("done")
 def done():
+    """End screen. POST (from /play) returns the same data as JSON."""
+    # g.participant is the full row, with the engine's balance when it runs the session
+    p = g.participant
+    balance = storage.money(storage.cents(p["balance"]))
+    code = p["code"]
     con = db()
-    pid = flask_session.get("participant_id")
-    balance = None
-    code = None
-    if pid:
-        row = con.execute("SELECT code, balance FROM participants WHERE id=%s", (pid,)).fetchone()
-        if row:
-            balance = row["balance"]
-            code = row["code"]
-            con.execute("UPDATE participants SET completed=1 WHERE id=%s", (pid,))
-            con.commit()
+    if con.execute("UPDATE participants SET completed=1 WHERE id=%s AND COALESCE(completed,0)=0", (p["id"],)).rowcount:
+        touch_session(con, p["session_id"])
+    con.commit()
     flask_session.pop("participant_id", None)
+    if request.method == "POST":
+        return jsonify({"code": code, "balance": balance})
     return render_template("done.html", balance=balance, code=code)
 
 @app.get("/healthz")
+@uses_participant()
 def healthz():
     return "ok", 200
 
@@ -916,6 +2295,88 @@ def _session_done(con, sid):
     ).fetchone()["c"]
     return cnt >= grp
 
+def _session_buckets(con):
+    """Split all sessions into (active, done, archived, closing), newest first.
+
+    closing: sessions the janitor is resetting or deleting.
+    """
+    rows = con.execute("SELECT * FROM sessions ORDER BY created_at DESC").fetchall()
+    active, done, arch, closing = [], [], [], []
+    for s in rows:
+        if s["status"]:
+            closing.append(s)
+        elif s["archived"]:
+            arch.append(s)
+        elif _session_done(con, s["id"]):
+            done.append(s)
+        else:
+            active.append(s)
+    return active, done, arch, closing
+
+BULK_MAX_SESSIONS = 100
+BULK_MAX_GROUP_SIZE = 50
+
+def _session_spec(src, default_name):
+    """Validated session parameters from a form or JSON object."""
+    spec = {
+        "name": (src.get("name") or default_name),
+        "group_size": int(src.get("group_size", 6)),
+        "rounds": int(src.get("rounds", 20)),
+        "base_payout": int(src.get("base_payout", 500)),
+    }
+    if not 1 <= spec["group_size"] <= BULK_MAX_GROUP_SIZE or spec["rounds"] < 1:
+        raise ValueError("group_size/rounds out of range")
+    return spec
+
+def _provision_sessions(con, specs, attempts=3):
+    """Create sessions and all their participants in one transaction.
+
+    Codes are drawn in one batch; participants go in with a multi-row
+    executemany. A code taken concurrently trips the UNIQUE key and the
+    whole batch is retried with fresh codes.
+    """
+    for attempt in range(attempts):
+        now = iso_utc(utc_now())
+        codes = iter(create_codes(con, sum(spec["group_size"] for spec in specs)))
+        session_rows, participant_rows, created = [], [], []
+        for spec in specs:
+            sid = str(uuid.uuid4())
+            session_rows.append((
+                sid, spec["name"], spec["group_size"], spec["rounds"], 0.0, 0.0, 0.0, 0, 0.0,
+                spec["base_payout"], now, 0, 5, 5, "type_table"
+            ))
+            sess_codes = []
+            for i in range(spec["group_size"]):
+                code = next(codes)
+                sess_codes.append(code)
+                participant_rows.append((
+                    str(uuid.uuid4()), sid, code, 0.0, 0.0, 0, None, 1,
+                    spec["base_payout"], 0, now, (i % 6) + 1
+                ))
+            created.append({"id": sid, "name": spec["name"], "codes": sess_codes})
+
+        cursor = con.cursor()
+        try:
+            cursor.executemany("""
+                INSERT INTO sessions
+                  (id,name,group_size,rounds,cvac,alpha,cinf,subsidy,subsidy_amount,
+                   starting_balance,created_at,archived,reveal_window,watch_time,cost_mode)
+                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+            """, session_rows)
+            cursor.executemany(
+                "INSERT INTO participants (id,session_id,code,theta,lambda,joined,join_number,current_round,balance,completed,created_at,ptype) "
+                "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)",
+                participant_rows
+            )
+            con.commit()
+            return created
+        except storage.IntegrityError:
+            con.rollback()
+            if attempt == attempts - 1:
+                raise
+        finally:
+            cursor.close()
+
 @app.route("/admin_login", methods=["GET", "POST"])
 def admin_login():
     if request.method == "POST":
@@ -926,63 +2387,25 @@ def admin_login():
     return render_template("admin_login.html", error=None, admin_tab_guard=True)
 
 @app.route("/admin", methods=["GET", "POST"])
+@replica_reads
 def admin():
     if not require_admin():
         return redirect(url_for("admin_login"))
     con = db()
 
     if request.method == "POST":
-        name = request.form.get("name", f"Session {datetime.datetime.now():%Y-%m-%d %H:%M}")
-        group_size = int(request.form.get("group_size", "6"))
-        rounds = int(request.form.get("rounds", "20"))
-        base_payout = int(request.form.get("base_payout", "500"))
-
-        cvac = 0.0
-        alpha = 0.0
-        cinf = 0.0
-        subsidy = 0
-        subsidy_amount = 0.0
-        cost_mode = "type_table"
-
-        sid = str(uuid.uuid4())
-        con.execute("""
-            INSERT INTO sessions
-              (id,name,group_size,rounds,cvac,alpha,cinf,subsidy,subsidy_amount,
-               starting_balance,created_at,archived,reveal_window,watch_time,cost_mode)
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-        """, (
-            sid, name, group_size, rounds, cvac, alpha, cinf, subsidy, subsidy_amount,
-            base_payout, iso_utc(utc_now()), 0, 5, 5, cost_mode
-        ))
-
-        for i in range(group_size):
-            pid = str(uuid.uuid4())
-            while True:
-                code = create_code(6)
-                if not con.execute("SELECT 1 FROM participants WHERE code=%s", (code,)).fetchone():
-                    break
-            ptype = (i % 6) + 1
-            theta = 0.0
-            lambd = 0.0
-            con.execute(
-                "INSERT INTO participants (id,session_id,code,theta,lambda,joined,join_number,current_round,balance,completed,created_at,ptype) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)",
-                (pid, sid, code, theta, lambd, 0, None, 1, base_payout, 0, iso_utc(utc_now()), ptype)
-            )
-        con.commit()
+        try:
+            spec = _session_spec(request.form, f"Session {datetime.datetime.now():%Y-%m-%d %H:%M}")
+        except (TypeError, ValueError):
+            return redirect(url_for("admin"))
+        _provision_sessions(con, [spec])
         return redirect(url_for("admin"))
 
-    rows = con.execute("SELECT * FROM sessions ORDER BY created_at DESC").fetchall()
-    sessions_active, sessions_done, sessions_arch = [], [], []
-    for s in rows:
-        ps = con.execute("SELECT code FROM participants WHERE session_id=%s", (s["id"],)).fetchall()
-        sdict = {**dict(s), "participants": [dict(p) for p in ps]}
-        if s["archived"]:
-            sessions_arch.append(sdict)
-        else:
-            if _session_done(con, s["id"]):
-                sessions_done.append(sdict)
-            else:
-                sessions_active.append(sdict)
+    sessions_active, sessions_done, sessions_arch, sessions_closing = _session_buckets(con)
+    for bucket in (sessions_active, sessions_done, sessions_arch):
+        for i, s in enumerate(bucket):
+            ps = con.execute("SELECT code FROM participants WHERE session_id=%s", (s["id"],)).fetchall()
+            bucket[i] = {**dict(s), "participants": [dict(p) for p in ps]}
 
     now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
     return render_template(
@@ -990,11 +2413,98 @@ def admin():
         sessions_active=sessions_active,
         sessions_done=sessions_done,
         sessions_arch=sessions_arch,
+        sessions_closing=sessions_closing,
         now=now,
         admin_tab_guard=True
     )
 
+@app.post("/admin/bulk_create")
+def admin_bulk_create():
+    """Create K sessions at once (admin form or JSON API).
+
+    JSON body: {"sessions": [{"name", "group_size", "rounds", "base_payout"}, ...]}
+    or {"count": K, "name": prefix, "group_size": ..., ...} like the form.
+    """
+    if not require_admin():
+        return ("Forbidden", 403) if request.is_json else redirect(url_for("admin_login"))
+    src = (request.get_json(silent=True) or {}) if request.is_json else request.form
+    prefix = src.get("name") or f"Session {datetime.datetime.now():%Y-%m-%d %H:%M}"
+
+    try:
+        if src.get("sessions"):
+            specs = [_session_spec(item, f"{prefix} #{k}") for k, item in enumerate(src["sessions"], 1)]
+        else:
+            count = int(src.get("count", 1))
+            specs = [_session_spec({**src, "name": f"{prefix} #{k}"}, prefix) for k in range(1, count + 1)]
+    except (TypeError, ValueError):
+        return (jsonify({"err": "bad_request"}), 400) if request.is_json else redirect(url_for("admin"))
+    if not 1 <= len(specs) <= BULK_MAX_SESSIONS:
+        return (jsonify({"err": "bad_count"}), 400) if request.is_json else redirect(url_for("admin"))
+
+    created = _provision_sessions(db(), specs)
+    if request.is_json:
+        return jsonify({"sessions": created})
+    return redirect(url_for("admin"))
+
+@app.get("/admin/sessions_overview")
+@replica_reads
+@poll_endpoint(snapshot=False)
+def admin_sessions_overview():
+    if not require_admin():
+        return ("Forbidden", 403)
+    con = db()
+    active, done, arch, closing = _session_buckets(con)
+    return jsonify({
+        "active": [s["id"] for s in active],
+        "done": [s["id"] for s in done],
+        "archived": [s["id"] for s in arch],
+        "closing": [
+            {"id": s["id"], "status": s["status"], "done": s["status_done"], "total": s["status_total"]}
+            for s in closing
+        ],
+        "retry_after_ms": retry_after_ms("admin_overview")
+    })
+
+@app.get("/admin/metrics")
+def admin_metrics():
+    if not require_admin():
+        return ("Forbidden", 403)
+    return jsonify({
+        "admission": admission.stats(),
+        "session_cache": {"hits": session_cache.hits, "misses": session_cache.misses},
+        "engine": {"sessions": len(engines), "backlog": engines.log.backlog()},
+        "group_commit": committer.stats(),
+        "db_routing": dict(_routing_snapshot(), replica_configured=read_pool is not None),
+        "analytics_cache": {"hits": analytics_cache.hits, "misses": analytics_cache.misses,
+                            "entries": len(analytics_cache)},
+        "inflight_requests": load_gauge.inflight,
+        "load": load_gauge.load(),
+    })
+
+@app.get("/admin/analytics/<view>")
+def admin_analytics(view):
+    """Study-wide aggregates from round_summary (see analytics.VIEWS).
+
+    rounds, choice_rates?by=round|ptype|group_size, decision_times?by=...,
+    payouts?ptype=; all accept group_size, since and until (ISO, UTC).
+    """
+    if not require_admin():
+        return ("Forbidden", 403)
+    fn = analytics.VIEWS.get(view)
+    if fn is None:
+        return jsonify({"err": "unknown_view", "views": sorted(analytics.VIEWS)}), 404
+    args = request.args.to_dict()
+    key = (view, tuple(sorted(args.items())))
+    try:
+        # The result is cached until the next invalidation, so it must not
+        # come from a replica that has not seen the settled round yet.
+        payload = analytics_cache.get(key, lambda: fn(db(primary=True), args))
+    except ValueError as e:
+        return jsonify({"err": "bad_request", "detail": str(e)}), 400
+    return jsonify(payload)
+
 @app.get("/admin/session/<session_id>")
+@replica_reads
 def admin_session_view(session_id):
     if not require_admin():
         return redirect(url_for("admin_login"))
@@ -1007,71 +2517,22 @@ def admin_session_view(session_id):
         (session_id,)
     ).fetchone()["r"] or 1
     r = min(r, s["rounds"])
-    return render_template("admin_session.html", session=s, round_number=r, admin_tab_guard=True)
+    return render_template("admin_session.html", session=s, round_number=r,
+                           summary=analytics.session_summary(con, session_id), admin_tab_guard=True)
 
 @app.get("/admin/session_status")
+@replica_reads
+@poll_endpoint(snapshot=False)
 def admin_session_status():
     if not require_admin():
         return ("Forbidden", 403)
-    sid = request.args.get("session_id")
-    con = db()
-    srow = con.execute("SELECT * FROM sessions WHERE id=%s", (sid,)).fetchone()
-    if not srow:
-        return jsonify({"participants": [], "decided_count": 0, "session": None})
-
-    r = con.execute(
-        "SELECT MIN(current_round) AS r FROM participants WHERE session_id=%s",
-        (sid,)
-    ).fetchone()["r"] or 1
-    r_disp = min(r, srow["rounds"])
-
-    rows = con.execute(
-        """SELECT p.id, p.code, p.join_number, p.balance, p.current_round, p.ready_for_next,
-                  EXISTS(SELECT 1 FROM decisions d WHERE d.participant_id=p.id AND d.round_number=%s) AS decided,
-                  (SELECT d.choice FROM decisions d WHERE d.participant_id=p.id AND d.round_number=%s LIMIT 1) AS choice
-           FROM participants p WHERE p.session_id=%s ORDER BY p.join_number, p.code""",
-        (r, r, sid)
-    ).fetchall()
-
-    participants = [{
-        "id": rr["id"],
-        "code": rr["code"],
-        "player_no": rr["join_number"],
-        "balance": rr["balance"],
-        "round_display": min(rr["current_round"], srow["rounds"]),
-        "decided": bool(rr["decided"]),
-        "choice": rr["choice"],
-        "ready_for_next": bool(rr["ready_for_next"])
-    } for rr in rows]
-
-    decided_count = sum(1 for x in participants if x["decided"])
-    ready_count = sum(1 for x in participants if x["ready_for_next"])
-    return jsonify({
-        "participants": participants,
-        "decided_count": decided_count,
-        "ready_count": ready_count,
-        "session": {"id": srow["id"], "current_round": r_disp}
-    })
+    return jsonify(status.run(db(), sql_status.admin_session(request.args.get("session_id"))))
 
 @app.post("/admin/reset_session")
 def admin_reset_session():
     if not require_admin():
         return redirect(url_for("admin_login"))
-    sid = request.form.get("session_id")
-    con = db()
-    s = con.execute("SELECT * FROM sessions WHERE id=%s", (sid,)).fetchone()
-    if not s:
-        return redirect(url_for("admin"))
-
-    con.execute("DELETE FROM decisions WHERE session_id=%s", (sid,))
-    con.execute("DELETE FROM round_phases WHERE session_id=%s", (sid,))
-    con.execute(
-        "UPDATE participants SET current_round=1, join_number=NULL, joined=0, balance=%s, completed=0, ready_for_next=0 WHERE session_id=%s",
-        (s["starting_balance"], sid)
-    )
-    con.commit()
-    con.execute("UPDATE sessions SET archived=0 WHERE id=%s", (sid,))
-    con.commit()
+    close_session(request.form.get("session_id"), "resetting")
     return redirect(url_for("admin"))
 
 @app.post("/admin/archive_session")
@@ -1081,8 +2542,9 @@ def admin_archive_session():
     sid = request.form.get("session_id")
     con = db()
     s = con.execute("SELECT * FROM sessions WHERE id=%s", (sid,)).fetchone()
-    if not s:
+    if not s or s["status"]:
         return redirect(url_for("admin"))
+    engines.drop(sid)  # let pending write-behind events land first
 
     ensure_archive_schema(con, "sessions")
     ensure_archive_schema(con, "participants")
@@ -1094,29 +2556,102 @@ def admin_archive_session():
     con.execute("INSERT INTO archived_decisions SELECT * FROM decisions WHERE session_id=%s", (sid,))
     con.execute("UPDATE sessions SET archived=1 WHERE id=%s", (sid,))
     con.execute("UPDATE participants SET completed=1 WHERE session_id=%s", (sid,))
+    touch_session(con, sid)
     con.commit()
+    invalidate_session(sid)
     return redirect(url_for("admin"))
 
 @app.post("/admin/delete_session")
 def admin_delete_session():
     if not require_admin():
         return redirect(url_for("admin_login"))
-    sid = request.form.get("session_id")
-    con = db()
-    exists = con.execute("SELECT 1 FROM sessions WHERE id=%s", (sid,)).fetchone()
-    if not exists:
-        return redirect(url_for("admin"))
-
-    con.execute("START TRANSACTION")
-    con.execute("DELETE FROM decisions WHERE session_id=%s", (sid,))
-    con.execute("DELETE FROM round_phases WHERE session_id=%s", (sid,))
-    con.execute("DELETE FROM participants WHERE session_id=%s", (sid,))
-    con.execute("DELETE FROM sessions WHERE id=%s", (sid,))
-    con.commit()
+    close_session(request.form.get("session_id"), "deleting")
     return redirect(url_for("admin"))
 
+# --------- Profiling ----------
+@app.route("/admin/profile/sample", methods=["GET", "POST"])
+def admin_profile_sample():
+    """Sample all threads of this process in the background; fetch the result with GET.
+
+    POST ?seconds= starts a sample (?interval_ms= sets the period, default 10;
+    ?idle=1 keeps parked threads). GET answers 202 while it runs, then returns
+    the collapsed stacks as a .folded file for flamegraph.pl or speedscope.
+    """
+    if not require_admin():
+        return ("Forbidden", 403)
+    if request.method == "POST":
+        try:
+            seconds = min(float(request.args.get("seconds", 10)), PROFILE_MAX_SECONDS)
+            interval = max(float(request.args.get("interval_ms", 10)), 1.0) / 1000.0
+        except ValueError:
+            return ("seconds/interval_ms must be numbers", 400)
+        try:
+            ends_at = stack_sampler.start(seconds, interval, idle=request.args.get("idle") == "1")
+        except RuntimeError as e:
+            return (str(e), 409)
+        return _profile_running(ends_at)
+    if stack_sampler.running:
+        return _profile_running(stack_sampler.ends_at)
+    last = stack_sampler.last()
+    if last is None:
+        return ("no sample taken yet in this process; POST to start one", 404)
+    counts, ticks, finished_at = last
+    resp = make_response(profiling.StackSampler.collapsed(counts))
+    resp.mimetype = "text/plain"
+    resp.headers["Content-Disposition"] = f"attachment; filename=profile-{os.getpid()}-{int(finished_at)}.folded"
+    resp.headers["X-Profile-Samples"] = str(ticks)
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+def _profile_running(ends_at):
+    left = max(0.0, ends_at - time.time())
+    resp = jsonify({"status": "running", "pid": os.getpid(), "seconds_left": round(left, 1)})
+    resp.status_code = 202
+    resp.headers["Retry-After"] = str(int(left) + 1)
+    resp.headers["Location"] = url_for("admin_profile_sample")
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+@app.route("/admin/profile/routes", methods=["GET", "POST"])
+def admin_profile_routes():
+    """Per-route cProfile: GET lists the routes, POST {"route", "every"} switches one.
+
+    every=K profiles one request in K (0 switches off). ?report=<route> on GET
+    returns the accumulated pstats of that route in this process
+    (&sort=cumulative|tottime|calls, &limit=40).
+    """
+    if not require_admin():
+        return ("Forbidden", 403)
+    if request.method == "POST":
+        src = request.get_json(silent=True) or {}
+        rule = src.get("route")
+        try:
+            every = int(src.get("every", 0))
+        except (TypeError, ValueError):
+            every = -1
+        if every < 0 or rule not in {r.rule for r in app.url_map.iter_rules()}:
+            return jsonify({"error": "unknown route or invalid every"}), 400
+        route_profiler.configure(rule, every)
+        bus.publish("profile.routes", rule=rule, every=every)
+    elif request.args.get("report"):
+        sort = request.args.get("sort", "cumulative")
+        limit = request.args.get("limit", "40")
+        if sort not in ("cumulative", "tottime", "calls") or not limit.isdigit():
+            return ("sort must be cumulative, tottime or calls, limit a number", 400)
+        text = route_profiler.report(request.args["report"], sort, int(limit))
+        if text is None:
+            return ("nothing profiled for this route yet", 404)
+        resp = make_response(text)
+        resp.mimetype = "text/plain"
+        return resp
+    return jsonify({"pid": os.getpid(), "routes": route_profiler.status()})
+
 # --------- XLSX Export ----------
+# openpyxl is imported on first export; it is a third of the app's import time.
 def _style_table(ws, header_row=1, wrap_cols=None, int_cols=None):
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from openpyxl.utils import get_column_letter
+
     hdr_fill = PatternFill("solid", fgColor="1F2A44")
     hdr_font = Font(bold=True, color="FFFFFF")
     for cell in ws[header_row]:
@@ -1150,6 +2685,7 @@ def _style_table(ws, header_row=1, wrap_cols=None, int_cols=None):
         ws.column_dimensions[col_letter].width = min(60, max(10, width * 1.15))
 
 @app.get("/admin/export_session_xlsx")
+@replica_reads
 def admin_export_session_xlsx():
     if not require_admin():
         return redirect(url_for("admin_login"))
@@ -1159,6 +2695,7 @@ def admin_export_session_xlsx():
     if not s:
         return ("Not found", 404)
 
+    from openpyxl import Workbook
     wb = Workbook()
 
     ws0 = wb.active
@@ -1196,6 +2733,13 @@ def admin_export_session_xlsx():
                     d["others_A"], d["b_cost_round"], d["base_payout"]])
     _style_table(ws2, header_row=1, wrap_cols=[10], int_cols=[1,2,4,6,7,8,9,11,12,13,14])
 
+    ws_sum = wb.create_sheet("RoundSummary")
+    ws_sum.append(["round","n","A","B","payout_mean","payout_var"])
+    for rs in analytics.session_summary(con, sid):
+        ws_sum.append([rs["round_number"], rs["n"], rs["a_count"], rs["b_count"],
+                       rs["payout_mean"], rs["payout_var"]])
+    _style_table(ws_sum, header_row=1, int_cols=[1,2,3,4])
+
     ws3 = wb.create_sheet("Design")
     ws3.append(["Parameter","Wert","Kommentar"])
     for k, v, c in [
@@ -1233,7 +2777,35 @@ def admin_export_session_xlsx():
         download_name=filename
     )
 
+# -------------------- Multi-process support --------------------
+def _after_fork_in_child():
+    global GAME_ENGINE, _routing_lock
+    _routing_lock = threading.Lock()
+    if GAME_ENGINE and not SESSION_AFFINITY:
+        # Forked siblings would each hold their own copy of a session.
+        app.logger.warning("GAME_ENGINE disabled in forked worker: needs SESSION_AFFINITY=1")
+        GAME_ENGINE = False
+    pool.reset()
+    if read_pool is not None:
+        read_pool.reset()
+        read_backend.after_fork()
+    phase_scheduler.after_fork()
+    session_janitor.after_fork()
+    session_cache.after_fork()
+    analytics_cache.after_fork()
+    storage_backend.after_fork()
+    engines.after_fork()
+    committer.after_fork()
+    bus.after_fork()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
 # -------------------- Run --------------------
 if __name__ == "__main__":
     init_db()
+    phase_scheduler.start()
+    session_janitor.start()
+    engines.start()
     app.run(host="127.0.0.1", port=5000, debug=DEBUG_MODE)
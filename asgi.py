@@ -0,0 +1,479 @@
+"""
+ASGI entry point: status polls on asyncio, everything else on the Flask app.
+
+    pip install -r requirements-asgi.txt    # uvicorn, aiomysql (optional)
+    uvicorn asgi:application --host 127.0.0.1 --port 8000
+    python asgi.py                      # the same, PORT/THREADS from the env
+
+Under waitress every poll holds one of THREADS worker threads for as long
+as it runs, long-polls included. Here the status endpoints (/state,
+lobby_status, round_status, ready_status, reveal_status,
+admin/session_status) are coroutines: their queries, the ones the Flask
+views run (status.py), go through an async MySQL pool (aiomysql), and a
+waiting client is a parked future, not a thread. All other routes are passed to the unchanged Flask app on a pool
+of THREADS threads.
+
+Long-poll: a status request with ?wait=1 and If-None-Match set to the ETag
+of its previous answer (static/poll.js sends both) is held until the
+session changes (app.py reports every committed write through
+change_listeners) or LONGPOLL_MAX_WAIT passes. reveal_status is answered
+by the Flask view directly.
+
+Without aiomysql (or on SQLite) the same queries run on a few threads of
+the synchronous pool (ASYNC_DB_THREADS), so waiting still costs nothing.
+With GAME_ENGINE=1 the state is in memory and the payloads are computed
+by the Flask views (a few microseconds on a thread); the waiting stays
+asynchronous. Admission control and the poll snapshots guard the thread
+pool and do not apply here.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl, urlencode
+
+from itsdangerous import BadSignature
+
+import app as vgame
+import status
+
+try:
+    import aiomysql
+except ImportError:  # optional dependency
+    aiomysql = None
+
+THREADS = int(os.environ.get("THREADS", "48"))
+ASYNC_DB_THREADS = int(os.environ.get("ASYNC_DB_THREADS", str(vgame.DB_POOL_SIZE)))
+ASYNC_DB_POOL_SIZE = int(os.environ.get("ASYNC_DB_POOL_SIZE", "10"))
+
+flask_app = vgame.app
+
+
+# -------------------- Database --------------------
+class AioMySQLDB:
+    """Async connection pool on the primary (aiomysql)."""
+
+    def __init__(self, params, size):
+        self.params = params
+        self.size = size
+        self.pool = None
+
+    async def open(self):
+        self.pool = await aiomysql.create_pool(
+            host=self.params["host"], port=self.params["port"], user=self.params["user"],
+            password=self.params["password"], db=self.params["database"],
+            charset="utf8mb4", autocommit=True, minsize=1, maxsize=self.size,
+        )
+
+    async def close(self):
+        self.pool.close()
+        await self.pool.wait_closed()
+
+    async def fetchall(self, sql, args=()):
+        async with self.pool.acquire() as con:
+            async with con.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute(sql, args)
+                return await cur.fetchall()
+
+    async def fetchone(self, sql, args=()):
+        rows = await self.fetchall(sql, args)
+        return rows[0] if rows else None
+
+    async def rows(self, sql, args=()):
+        async with self.pool.acquire() as con:
+            async with con.cursor() as cur:
+                await cur.execute(sql, args)
+                return await cur.fetchall()
+
+
+class ThreadedDB:
+    """Same interface on the synchronous pool, run on a few threads (SQLite, no aiomysql)."""
+
+    def __init__(self, threads):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="async-db")
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+
+    async def _run(self, fn, sql, args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._call, fn, sql, args)
+
+    @staticmethod
+    def _call(fn, sql, args):
+        con = vgame.pool.get()
+        try:
+            return fn(con, sql, args)
+        finally:
+            vgame.pool.put(con)
+
+    async def fetchall(self, sql, args=()):
+        return await self._run(status.QUERIES["fetchall"], sql, args)
+
+    async def fetchone(self, sql, args=()):
+        return await self._run(status.QUERIES["fetchone"], sql, args)
+
+    async def rows(self, sql, args=()):
+        return await self._run(status.QUERIES["rows"], sql, args)
+
+
+def _make_db():
+    if aiomysql is not None and vgame.storage_backend.name == "mysql":
+        return AioMySQLDB(vgame.storage_backend.params, ASYNC_DB_POOL_SIZE)
+    return ThreadedDB(ASYNC_DB_THREADS)
+
+
+# -------------------- Change feed --------------------
+class ChangeFeed:
+    """Per-session change counters that coroutines can wait on.
+
+    notify() is called from any thread (app.change_listeners); the counter
+    is bumped on the event loop. A waiter passes the counter it read before
+    computing its answer, so a change in between is never missed.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self._versions = {}
+        self._waiters = {}      # session_id -> set of futures
+
+    def attach(self, loop):
+        self.loop = loop
+        vgame.change_listeners.append(self.notify)
+
+    def notify(self, sid):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._bump, sid)
+
+    def version(self, sid):
+        return self._versions.get(sid, 0)
+
+    def _bump(self, sid):
+        self._versions[sid] = self._versions.get(sid, 0) + 1
+        for fut in self._waiters.pop(sid, ()):
+            if not fut.done():
+                fut.set_result(None)
+
+    async def wait(self, sid, seen, timeout) -> bool:
+        """Wait until the session's counter moves past `seen`; False on timeout."""
+        if self.version(sid) != seen:
+            return True
+        fut = self.loop.create_future()
+        self._waiters.setdefault(sid, set()).add(fut)
+        try:
+            await asyncio.wait_for(fut, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiters.get(sid)
+            if waiters is not None:
+                waiters.discard(fut)
+                if not waiters:
+                    del self._waiters[sid]
+
+
+# -------------------- WSGI bridge --------------------
+class WSGIBridge:
+    """Runs the Flask app for ASGI requests on a bounded thread pool (buffered bodies)."""
+
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, body, send):
+        status, headers, content = await self.run(scope, body)
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": content})
+
+    async def run(self, scope, body):
+        """(status, headers, body) of the WSGI app's response."""
+        status, headers, chunks = await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._call, self._environ(scope, body)
+        )
+        return status, headers, b"".join(chunks)
+
+    def _call(self, environ):
+        started, chunks = {}, []
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+            return chunks.append
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                chunks.append(chunk)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        return started["status"], started["headers"], chunks
+
+    @staticmethod
+    def _environ(scope, body):
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope["query_string"].decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+            "REMOTE_ADDR": client[0],
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope["headers"]:
+            name, value = name.decode("latin-1"), value.decode("latin-1")
+            if name == "content-type":
+                environ["CONTENT_TYPE"] = value
+            elif name != "content-length":
+                key = "HTTP_" + name.upper().replace("-", "_")
+                environ[key] = environ[key] + "," + value if key in environ else value
+        return environ
+
+
+# -------------------- Requests --------------------
+class Request:
+    """The parts of an ASGI request the status handlers read."""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.args = dict(parse_qsl(scope["query_string"].decode("latin-1")))
+        self.headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        self._session = None
+
+    @property
+    def session(self):
+        """The Flask session cookie's content ({} if missing or tampered with)."""
+        if self._session is None:
+            self._session = {}
+            cookies = SimpleCookie(self.headers.get("cookie", ""))
+            morsel = cookies.get(flask_app.config["SESSION_COOKIE_NAME"])
+            serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+            if morsel is not None and serializer is not None:
+                try:
+                    self._session = serializer.loads(
+                        morsel.value, max_age=int(flask_app.permanent_session_lifetime.total_seconds())
+                    )
+                except BadSignature:
+                    pass
+        return self._session
+
+    def without(self, *names):
+        """This request's scope with query arguments `names` removed."""
+        query = urlencode([(k, v) for k, v in self.args.items() if k not in names])
+        return {**self.scope, "query_string": query.encode("latin-1")}
+
+
+FALLBACK = object()   # handler result: let the Flask view answer
+
+
+# -------------------- Status handlers --------------------
+# The queries and payloads are status.py's, the same the Flask views run for
+# sessions without the engine. Each handler returns (status, payload) or
+# FALLBACK (a complete round that still has to be settled).
+async def state_feed(db, req):
+    pid = req.session.get("participant_id")
+    p = pid and await db.fetchone("SELECT id, session_id, current_round FROM participants WHERE id=%s", (pid,))
+    payload = await status.run_async(db, vgame.sql_status.feed(p, req.args.get("results")))
+    return FALLBACK if isinstance(payload, status.Unsettled) else (200, payload)
+
+
+async def lobby_status(db, req):
+    sid = req.args.get("session_id")
+    payload = await status.run_async(db, vgame.sql_status.lobby(sid, req.args.get("participant_id")))
+    return (404, {"err": "unknown_session"}) if payload is None else (200, payload)
+
+
+async def round_status(db, req):
+    try:
+        r = int(req.args.get("round"))
+    except (TypeError, ValueError):
+        return 400, {"err": "bad"}
+    sid = req.args.get("session_id")
+    payload = await status.run_async(db, vgame.sql_status.round(sid, r, req.args.get("participant_id")))
+    if payload is None:
+        return 404, {"err": "unknown_session"}
+    return FALLBACK if isinstance(payload, status.Unsettled) else (200, payload)
+
+
+async def ready_status(db, req):
+    sid = req.args.get("session_id")
+    payload = await status.run_async(db, vgame.sql_status.ready(
+        sid, req.args.get("participant_id"), req.session.get("participant_id")))
+    return (404, {"err": "unknown_session"}) if payload is None else (200, payload)
+
+
+async def admin_session_status(db, req):
+    return 200, await status.run_async(db, vgame.sql_status.admin_session(req.args.get("session_id")))
+
+
+STATUS_HANDLERS = {
+    "/state": state_feed,
+    "/lobby_status": lobby_status,
+    "/round_status": round_status,
+    "/ready_status": ready_status,
+    "/admin/session_status": admin_session_status,
+}
+
+
+# -------------------- Application --------------------
+def _etag(payload):
+    body = flask_app.json.dumps({k: v for k, v in payload.items() if k != "retry_after_ms"})
+    return '"' + hashlib.blake2s(body.encode(), digest_size=8).hexdigest() + '"'
+
+
+class StatusApp:
+    """The ASGI application: async status handlers in front of the Flask app."""
+
+    def __init__(self):
+        self.db = _make_db()
+        self.feed = ChangeFeed()
+        self.bridge = WSGIBridge(flask_app.wsgi_app, THREADS)
+        self._started = False
+        self._start_lock = None
+
+    async def startup(self):
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._started:
+                return
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.bridge.executor, vgame.init_db)
+            vgame.phase_scheduler.start()
+            vgame.session_janitor.start()
+            vgame.engines.start()
+            self.feed.attach(loop)
+            await self.db.open()
+            self._started = True
+
+    async def shutdown(self):
+        if self._started:
+            await self.db.close()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        if not self._started:
+            await self.startup()
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        path = scope["path"]
+        if scope["method"] == "GET" and (path in STATUS_HANDLERS or path == "/reveal_status"):
+            return await self._status(scope, body, send)
+        return await self.bridge(scope, body, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _status(self, scope, body, send):
+        req = Request(scope)
+        path = scope["path"]
+        sid = req.args.get("session_id") or ""
+        if path == "/state" and not sid:
+            # a /state without session_id: wait on (and check closing for) the caller's
+            pid = req.session.get("participant_id")
+            p = pid and await self.db.fetchone("SELECT session_id FROM participants WHERE id=%s", (pid,))
+            sid = p["session_id"] if p else ""
+        admin = path.startswith("/admin/")
+        if admin and not req.session.get("admin_ok"):
+            return await self._send(send, 403, b"Forbidden", "text/plain; charset=utf-8")
+        if not admin and sid in vgame.closing_sessions:
+            return await self._json(send, 200, {"reset": True, "state": "join"})
+
+        if path == "/reveal_status":
+            return await self.bridge(req.scope, body, send)
+
+        deadline = asyncio.get_running_loop().time() + vgame.LONGPOLL_MAX_WAIT
+        while True:
+            seen = self.feed.version(sid)
+            status, payload, response = await self._answer(req, body)
+            if payload is None:
+                return await self._send_raw(send, response)
+            etag = _etag(payload)
+            remaining = deadline - asyncio.get_running_loop().time()
+            if (status != 200 or not req.args.get("wait") or req.headers.get("if-none-match") != etag
+                    or remaining <= 0 or not await self.feed.wait(sid, seen, remaining)):
+                return await self._json(send, status, payload, etag)
+
+    async def _answer(self, req, body):
+        """(status, payload, None) of a status request, or (status, None, raw response).
+
+        The async handler answers unless the engine holds the session state
+        or the handler defers (FALLBACK); then the Flask view does.
+        """
+        if not vgame.GAME_ENGINE:
+            result = await STATUS_HANDLERS[req.scope["path"]](self.db, req)
+            if result is not FALLBACK:
+                return result[0], result[1], None
+        response = await self.bridge.run(req.without("wait"), body)
+        status, headers, content = response
+        if dict(headers).get(b"content-type", b"").startswith(b"application/json"):
+            return status, json.loads(content), None
+        return status, None, response
+
+    @staticmethod
+    async def _send_raw(send, response):
+        status, headers, content = response
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": content})
+
+    async def _json(self, send, status, payload, etag=None):
+        headers = [(b"etag", etag.encode())] if etag else []
+        body = (flask_app.json.dumps(payload) + "\n").encode()
+        await self._send(send, status, body, "application/json", headers)
+
+    @staticmethod
+    async def _send(send, status, body, content_type, headers=()):
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+            (b"cache-control", b"no-store"),
+            *headers,
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+
+application = StatusApp()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(application, host="127.0.0.1", port=int(os.environ.get("PORT", "8000")),
+                lifespan="on", log_level="warning")
@@ -1,27 +1,277 @@
-﻿import os, sqlite3, datetime, sys
+"""
+Online backup and restore for the game database (MySQL or SQLite).
 
-root = os.path.dirname(os.path.abspath(__file__))
-src  = os.path.join(root, "game.db")
-dst_dir = os.path.join(root, "backups")
-os.makedirs(dst_dir, exist_ok=True)
+    python backup_db.py snapshot                    # full snapshot
+    python backup_db.py snapshot --since last       # sessions active since the last snapshot
+    python backup_db.py snapshot --since 2026-10-19T08:00:00Z
+    python backup_db.py snapshot --session <id> [--session <id> ...]
+    python backup_db.py restore backups/<full> [backups/<incremental> ...] [--jobs 4]
+    python backup_db.py list
 
-if not os.path.exists(src):
-    print("NO_DB")
-    sys.exit(0)
+A snapshot reads every table inside one `START TRANSACTION WITH CONSISTENT
+SNAPSHOT, READ ONLY` (a deferred WAL read transaction on SQLite). That is a
+plain MVCC read: it takes no table or row locks, so /choose and the status
+polls keep running while it streams. Rows are read through a server-side
+cursor in chunks of --chunk rows, with a short pause between chunks, and
+written as gzip-compressed JSON lines to <table>.<part>.jsonl.gz next to a
+manifest.json. The directory only gets its final name once it is complete.
 
-ts = datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S")
-dst = os.path.join(dst_dir, f"game_{ts}.db")
+An incremental snapshot contains the complete rows of every session that
+changed since the given time: created_at of the session, a participant, a
+decision, a phase or a journal event, or changed_at in session_changes, which
+the app sets for everything else (phase transitions, reveals, /done, archive,
+reset and delete). `--since last` uses the start time of the newest snapshot
+in BACKUP_DIR. A deleted session keeps its session_changes row, so it is
+listed in the next incremental with no rows.
 
-con = sqlite3.connect(src)
-try:
-    con.execute("PRAGMA wal_checkpoint(FULL);")
-except Exception:
-    pass
+Restore creates the schema (init_db, and the archive tables' columns) and applies the snapshots in the order
+they were taken. A full snapshot first empties every table it contains; an
+incremental first deletes all rows of its listed sessions. Then the parts are
+loaded in parallel (--jobs connections). So a full snapshot followed by its
+incrementals restores the latest state of each session, resets and deletes
+included.
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-bck = sqlite3.connect(dst)
-con.backup(bck)
-bck.close()
-con.close()
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, APP_DIR)
 
-print(dst)
+from app import _connect_db, ensure_archive_schema, init_db, iso_utc, utc_now
 
+BACKUP_DIR = os.environ.get("BACKUP_DIR", os.path.join(APP_DIR, "backups"))
+ROWS_PER_PART = int(os.environ.get("BACKUP_ROWS_PER_PART", "200000"))
+
+
+def _session_column(table, columns):
+    if "session_id" in columns:
+        return "session_id"
+    if table in ("sessions", "archived_sessions"):
+        return "id"
+    return None
+
+
+def _active_sessions(con, tables, since):
+    """Ids of sessions with any row created or changed at or after `since`."""
+    sids = set()
+    for table, columns in tables.items():
+        col = _session_column(table, columns)
+        if not col:
+            continue
+        for stamp in ("created_at", "changed_at"):
+            if stamp in columns:
+                sql = f"SELECT DISTINCT {col} AS sid FROM {table} WHERE {stamp} >= %s"
+                for chunk in con.stream(sql, (since,)):
+                    sids.update(row["sid"] for row in chunk if row["sid"])
+    return sorted(sids)
+
+
+def _snapshots():
+    """(path, manifest) of all complete snapshots, oldest first."""
+    found = []
+    if os.path.isdir(BACKUP_DIR):
+        for name in os.listdir(BACKUP_DIR):
+            path = os.path.join(BACKUP_DIR, name)
+            manifest = os.path.join(path, "manifest.json")
+            if os.path.isfile(manifest):
+                with open(manifest, encoding="utf-8") as f:
+                    found.append((path, json.load(f)))
+    return sorted(found, key=lambda x: x[1]["snapshot_at"])
+
+
+def snapshot(since=None, sessions=None, chunk=2000, pause=0.005):
+    if since == "last":
+        previous = _snapshots()
+        if not previous:
+            sys.exit("no previous snapshot in " + BACKUP_DIR)
+        since = previous[-1][1]["snapshot_at"]
+    if hasattr(os, "nice"):
+        os.nice(10)
+
+    started = utc_now()
+    kind = "incremental" if (since or sessions) else "full"
+    name = started.strftime("%Y-%m-%d_%H%M%S") + ("" if kind == "full" else "_incr")
+    final = os.path.join(BACKUP_DIR, name)
+    n = 1
+    while os.path.exists(final) or os.path.exists(final + ".partial"):
+        n += 1
+        final = os.path.join(BACKUP_DIR, f"{name}-{n}")
+    work = final + ".partial"
+    os.makedirs(work)
+
+    con = _connect_db()
+    try:
+        tables = {t: [c["Field"] for c in con.columns(t)] for t in con.tables()}
+        con.begin_snapshot()
+        if since:
+            sessions = sorted(set(sessions or []) | set(_active_sessions(con, tables, since)))
+
+        manifest = {
+            "snapshot_at": iso_utc(started),
+            "kind": kind,
+            "backend": con.dialect.name,
+            "since": since,
+            "sessions": sessions,
+            "tables": {},
+        }
+        for table, columns in tables.items():
+            col = _session_column(table, columns)
+            if sessions is not None and col is None:
+                continue
+            queries = []
+            select = "SELECT " + ",".join(f"`{c}`" for c in columns) + f" FROM {table}"
+            if sessions is None:
+                queries.append((select, None))
+            else:
+                for i in range(0, len(sessions), 500):
+                    ids = sessions[i:i + 500]
+                    queries.append((select + f" WHERE {col} IN ({','.join(['%s'] * len(ids))})", tuple(ids)))
+            manifest["tables"][table] = {"columns": columns, **_dump_table(con, work, table, queries, chunk, pause)}
+        con.rollback()
+    except BaseException:
+        shutil.rmtree(work, ignore_errors=True)
+        raise
+    finally:
+        con.close()
+
+    with open(os.path.join(work, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(work, final)
+    return final, manifest
+
+
+def _dump_table(con, directory, table, queries, chunk, pause):
+    rows, parts, out, in_part = 0, [], None, 0
+    try:
+        for sql, args in queries:
+            for batch in con.stream(sql, args, size=chunk):
+                for row in batch:
+                    if out is None or in_part >= ROWS_PER_PART:
+                        if out is not None:
+                            out.close()
+                        part = f"{table}.{len(parts):04d}.jsonl.gz"
+                        parts.append(part)
+                        out = gzip.open(os.path.join(directory, part), "wt", encoding="utf-8", compresslevel=6)
+                        in_part = 0
+                    out.write(json.dumps(list(row.values()), default=str, separators=(",", ":")))
+                    out.write("\n")
+                    in_part += 1
+                rows += len(batch)
+                if pause:
+                    time.sleep(pause)
+    finally:
+        if out is not None:
+            out.close()
+    return {"rows": rows, "parts": parts}
+
+
+def _restore_part(directory, table, columns, part, batch_size):
+    con = _connect_db()
+    try:
+        cursor = con.cursor()
+        sql = (f"REPLACE INTO {table} (" + ",".join(f"`{c}`" for c in columns) + ") "
+               f"VALUES ({','.join(['%s'] * len(columns))})")
+        rows = 0
+        batch = []
+        with gzip.open(os.path.join(directory, part), "rt", encoding="utf-8") as f:
+            for line in f:
+                batch.append(tuple(json.loads(line)))
+                if len(batch) >= batch_size:
+                    cursor.executemany(sql, batch)
+                    con.commit()
+                    rows += len(batch)
+                    batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+            con.commit()
+            rows += len(batch)
+        cursor.close()
+        return rows
+    finally:
+        con.close()
+
+
+def _clear(manifest):
+    """Delete what the snapshot replaces: every table of a full snapshot,
+    the rows of the listed sessions for an incremental one."""
+    con = _connect_db()
+    try:
+        for table, info in manifest["tables"].items():
+            if manifest["sessions"] is None:
+                con.execute(f"DELETE FROM {table}")
+            else:
+                col = _session_column(table, info["columns"])
+                sessions = manifest["sessions"]
+                for i in range(0, len(sessions), 500):
+                    ids = sessions[i:i + 500]
+                    con.execute(f"DELETE FROM {table} WHERE {col} IN ({','.join(['%s'] * len(ids))})", tuple(ids))
+            con.commit()
+    finally:
+        con.close()
+
+
+def restore(directories, jobs=4, batch_size=1000):
+    init_db()
+    snapshots = []
+    for directory in directories:
+        with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+            snapshots.append((directory, json.load(f)))
+    snapshots.sort(key=lambda x: x[1]["snapshot_at"])
+
+    # archived_* tables only get the newer columns of their base table on the first archive
+    con = _connect_db()
+    try:
+        for table in sorted({t for _, m in snapshots for t in m["tables"] if t.startswith("archived_")}):
+            ensure_archive_schema(con, table[len("archived_"):])
+    finally:
+        con.close()
+
+    for directory, manifest in snapshots:
+        _clear(manifest)
+        work = [(table, info["columns"], part)
+                for table, info in manifest["tables"].items()
+                for part in info["parts"]]
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as ex:
+            counts = list(ex.map(lambda w: _restore_part(directory, *w, batch_size), work))
+        print(f"{directory}: {sum(counts)} rows in {len(work)} parts ({manifest['kind']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Online backup and restore of the game database.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("snapshot", help="write a consistent snapshot to BACKUP_DIR")
+    p.add_argument("--since", help="ISO time or 'last': only sessions active since then")
+    p.add_argument("--session", action="append", help="only this session (repeatable)")
+    p.add_argument("--chunk", type=int, default=2000, help="rows per read")
+    p.add_argument("--pause-ms", type=float, default=5.0, help="sleep between chunks")
+
+    p = sub.add_parser("restore", help="load snapshots into the configured database")
+    p.add_argument("directories", nargs="+")
+    p.add_argument("--jobs", type=int, default=4)
+    p.add_argument("--batch", type=int, default=1000)
+
+    sub.add_parser("list", help="show snapshots in BACKUP_DIR")
+
+    args = parser.parse_args()
+    if args.cmd == "snapshot":
+        t0 = time.monotonic()
+        path, manifest = snapshot(args.since, args.session, args.chunk, args.pause_ms / 1000.0)
+        rows = sum(t["rows"] for t in manifest["tables"].values())
+        print(f"{path}: {rows} rows, {len(manifest['tables'])} tables, {time.monotonic() - t0:.1f}s")
+    elif args.cmd == "restore":
+        restore(args.directories, args.jobs, args.batch)
+    else:
+        for path, manifest in _snapshots():
+            rows = sum(t["rows"] for t in manifest["tables"].values())
+            print(f"{manifest['snapshot_at']}  {manifest['kind']:<11}  {rows:>9} rows  {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Write journal benchmark: /choose throughput with group commit against one
+commit per click, for a burst of concurrent clicks at round start.
+
+    python bench/journal_throughput.py        # SQLite in a temp dir unless DB_* is set
+    SESSIONS=20 PLAYERS=30 THREADS=64 python bench/journal_throughput.py
+
+Each mode runs in its own process (the journal settings are read at import):
+"per-click" sets JOURNAL_MAX_BATCH=1 and JOURNAL_MAX_WAIT_MS=0, "group" uses
+the configured defaults. It reports clicks per second, the average batch
+size and the click-to-commit latency, then the speedup. The gain comes from
+saving fsyncs, so measure against MySQL (innodb_flush_log_at_trx_commit=1);
+SQLite in WAL mode with synchronous=NORMAL does not fsync on commit.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SESSIONS = int(os.environ.get("SESSIONS", "10"))
+PLAYERS = int(os.environ.get("PLAYERS", "20"))
+THREADS = int(os.environ.get("THREADS", "32"))
+
+MODES = (
+    ("per-click", {"JOURNAL_MAX_BATCH": "1", "JOURNAL_MAX_WAIT_MS": "0"}),
+    ("group", {}),
+)
+
+
+def bench_env(extra):
+    env = dict(os.environ, **extra)
+    env.setdefault("ADMIN_PASSWORD", "bench")
+    env.setdefault("SECRET_KEY", "bench")
+    if "DB_USER" not in env:
+        env["DB_BACKEND"] = "sqlite"
+        env["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="vgame-bench-"), "bench.db")
+    env.setdefault("ENGINE_LOG_DIR", tempfile.mkdtemp(prefix="vgame-bench-log-"))
+    env["GAME_ENGINE"] = "0"   # the engine bypasses the journal
+    return env
+
+
+def run_mode():
+    """Child process: join SESSIONS x PLAYERS players, then time one burst of /choose."""
+    sys.path.insert(0, ROOT)
+    import app
+
+    app.init_db()
+    app.phase_scheduler.start()
+    admin = app.app.test_client()
+    admin.post("/admin_login", data={"password": os.environ["ADMIN_PASSWORD"]})
+    created = admin.post("/admin/bulk_create", json={
+        "count": SESSIONS, "group_size": PLAYERS, "rounds": 2, "name": "bench"
+    }).get_json()["sessions"]
+    players = []
+    for sess in created:
+        for i, code in enumerate(sess["codes"]):
+            client = app.app.test_client()
+            client.post("/join", data={"code": code})
+            players.append((client, "AB"[i % 2]))
+
+    before = app.committer.stats()
+    start = threading.Barrier(THREADS + 1)
+    errors = []
+
+    def worker(share):
+        start.wait()
+        for client, choice in share:
+            resp = client.post("/choose", json={"choice": choice})
+            if resp.status_code != 200:
+                errors.append(resp.status_code)
+
+    threads = [threading.Thread(target=worker, args=(players[k::THREADS],)) for k in range(THREADS)]
+    for t in threads:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    after = app.committer.stats()
+
+    batches = after["batches"] - before["batches"]
+    events = after["events"] - before["events"]
+    print(json.dumps({
+        "clicks": len(players),
+        "errors": len(errors),
+        "seconds": elapsed,
+        "avg_batch": events / batches if batches else 0.0,
+        "latency_ms": after["latency_ms"],
+        "db": app.storage_backend.name,
+    }))
+
+
+def main():
+    results = {}
+    for name, extra in MODES:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--mode"],
+            env=bench_env(extra), capture_output=True, text=True, check=True,
+        )
+        r = results[name] = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{name:<10} {r['clicks']} clicks in {r['seconds']:.2f} s = {r['clicks'] / r['seconds']:8.1f}/s   "
+              f"avg batch {r['avg_batch']:5.1f}   latency p50 {r['latency_ms']['p50']} ms "
+              f"p95 {r['latency_ms']['p95']} ms   errors {r['errors']}   db={r['db']}")
+    speedup = results["per-click"]["seconds"] / results["group"]["seconds"]
+    print(f"group commit speedup: {speedup:.1f}x ({SESSIONS} sessions x {PLAYERS} players, {THREADS} threads)")
+
+
+if __name__ == "__main__":
+    if "--mode" in sys.argv:
+        run_mode()
+    else:
+        main()
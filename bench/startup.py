@@ -0,0 +1,100 @@
+"""
+Startup benchmark: import cost of app.py, init_db() against a current
+schema, and time from process start to the first answered request.
+
+    python bench/startup.py            # SQLite in a temp dir unless DB_* is set
+    RUNS=10 python bench/startup.py
+
+Exits non-zero if the median time-to-first-request exceeds TARGET_MS
+(default 300), so it can gate a deploy.
+"""
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = int(os.environ.get("RUNS", "5"))
+TARGET_MS = float(os.environ.get("TARGET_MS", "300"))
+
+
+def bench_env():
+    env = dict(os.environ)
+    env.setdefault("ADMIN_PASSWORD", "bench")
+    env.setdefault("SECRET_KEY", "bench")
+    if "DB_USER" not in env:
+        env.setdefault("DB_BACKEND", "sqlite")
+        env.setdefault("SQLITE_PATH", os.path.join(tempfile.mkdtemp(prefix="vgame-bench-"), "bench.db"))
+    env.setdefault("ENGINE_LOG_DIR", tempfile.mkdtemp(prefix="vgame-bench-log-"))
+    return env
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_py(code, env):
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def import_ms(env):
+    return run_py("import time; t = time.perf_counter(); import app; "
+                  "print((time.perf_counter() - t) * 1000)", env)
+
+
+def init_db_ms(env):
+    return run_py("import time, app; t = time.perf_counter(); app.init_db(); "
+                  "print((time.perf_counter() - t) * 1000)", env)
+
+
+def first_request_ms(env):
+    port = free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "serve_waitress.py"], cwd=ROOT,
+                            env={**env, "PORT": str(port)},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1) as r:
+                    if r.status == 200:
+                        return (time.perf_counter() - t0) * 1000
+            except OSError:
+                if proc.poll() is not None:
+                    raise RuntimeError("serve_waitress.py exited during startup")
+                if time.perf_counter() - t0 > 30:
+                    raise RuntimeError("no answer within 30 s")
+                time.sleep(0.005)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def report(name, samples):
+    print(f"{name:<24} median {statistics.median(samples):7.1f} ms   "
+          f"min {min(samples):7.1f}   max {max(samples):7.1f}   (n={len(samples)})")
+    return statistics.median(samples)
+
+
+def main():
+    env = bench_env()
+    subprocess.run([sys.executable, "-c", "import app; app.init_db(force=True)"],
+                   cwd=ROOT, env=env, check=True)   # create the schema once
+    report("import app", [import_ms(env) for _ in range(RUNS)])
+    report("init_db (current)", [init_db_ms(env) for _ in range(RUNS)])
+    ttfr = report("time to first request", [first_request_ms(env) for _ in range(RUNS)])
+    ok = ttfr <= TARGET_MS
+    print(f"target {TARGET_MS:.0f} ms: {'ok' if ok else 'FAILED'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
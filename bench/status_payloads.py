@@ -0,0 +1,90 @@
+"""
+Status payload benchmark: cost of one /reveal_status and one
+/admin/session_status response for a settled round of a full session.
+
+    python bench/status_payloads.py        # SQLite in a temp dir unless DB_* is set
+    PLAYERS=100 REQUESTS=1000 python bench/status_payloads.py
+
+For each endpoint it reports the median request time, the time spent
+encoding the JSON body alone, and the peak memory allocated per request
+(tracemalloc). Run it once with FAST_JSON=0 to see the stdlib encoder.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLAYERS = int(os.environ.get("PLAYERS", "40"))
+REQUESTS = int(os.environ.get("REQUESTS", "500"))
+
+os.environ.setdefault("ADMIN_PASSWORD", "bench")
+os.environ.setdefault("SECRET_KEY", "bench")
+if "DB_USER" not in os.environ:
+    os.environ.setdefault("DB_BACKEND", "sqlite")
+    os.environ.setdefault("SQLITE_PATH", os.path.join(tempfile.mkdtemp(prefix="vgame-bench-"), "bench.db"))
+os.environ.setdefault("ENGINE_LOG_DIR", tempfile.mkdtemp(prefix="vgame-bench-log-"))
+sys.path.insert(0, ROOT)
+
+import app  # noqa: E402
+
+
+def settled_session():
+    """Create a session of PLAYERS players who all decided round 1."""
+    admin = app.app.test_client()
+    admin.post("/admin_login", data={"password": os.environ["ADMIN_PASSWORD"]})
+    created = admin.post("/admin/bulk_create", json={
+        "count": 1, "group_size": PLAYERS, "rounds": 2, "name": "bench"
+    }).get_json()["sessions"][0]
+    players = []
+    for code in created["codes"]:
+        client = app.app.test_client()
+        client.post("/join", data={"code": code})
+        players.append(client)
+    for i, client in enumerate(players):
+        client.post("/choose", json={"choice": "AB"[i % 2]})
+    return admin, players[0], created["id"]
+
+
+def measure(client, url):
+    client.get(url)   # warm up: phase row, caches
+    times, peaks = [], []
+    tracemalloc.start()
+    for _ in range(REQUESTS):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        t = time.perf_counter()
+        resp = client.get(url)
+        times.append(time.perf_counter() - t)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        assert resp.status_code == 200, resp.status_code
+    tracemalloc.stop()
+    payload = resp.get_json()
+    encode = []
+    for _ in range(REQUESTS):
+        t = time.perf_counter()
+        app.app.json.dumps(payload)
+        encode.append(time.perf_counter() - t)
+    return statistics.median(times), statistics.median(encode), statistics.median(peaks)
+
+
+def main():
+    app.init_db()
+    app.phase_scheduler.start()
+    app.engines.start()
+    admin, player, sid = settled_session()
+    print(f"{PLAYERS} players, {REQUESTS} requests, json={type(app.app.json).__name__}, "
+          f"db={app.storage_backend.name}")
+    for name, client, url in (
+        ("/reveal_status", player, f"/reveal_status?session_id={sid}&round=1"),
+        ("/admin/session_status", admin, f"/admin/session_status?session_id={sid}"),
+    ):
+        request_s, encode_s, peak = measure(client, url)
+        print(f"{name:<24} request {request_s * 1e6:8.1f} us   encode {encode_s * 1e6:7.1f} us   "
+              f"peak alloc {peak / 1024:7.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
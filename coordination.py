@@ -0,0 +1,140 @@
+"""
+Cross-process coordination channel for the multi-worker serving mode.
+
+Workers publish small JSON messages (phase deadlines, session resets and
+deletions) that every other worker applies to its in-process state, so
+caches, version counters and long-poll waiters stay consistent when the app
+runs in several processes. MySQL remains the source of truth; the bus only
+carries invalidations and wake-ups, so a lost message costs latency, never
+correctness.
+
+LocalBus is the single-process default. SocketBus talks to the hub that
+serve_multi.py runs on a unix socket, a local stand-in for a real pub/sub
+service (Redis, NATS, ...).
+"""
+import json
+import os
+import socket
+import socketserver
+import threading
+
+
+class LocalBus:
+    """In-process bus: there is nobody else to notify."""
+
+    def __init__(self):
+        self._handlers = {}
+
+    def subscribe(self, topic, handler):
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic, **payload):
+        pass
+
+    def start(self):
+        pass
+
+    def after_fork(self):
+        pass
+
+    def _dispatch(self, msg):
+        for handler in self._handlers.get(msg.get("topic"), ()):
+            try:
+                handler(msg)
+            except Exception:
+                pass
+
+
+class SocketBus(LocalBus):
+    """Bus client connected to the hub; the hub relays each message to all other workers."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._sock = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._sock is not None and self._pid == os.getpid():
+                return
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            self._sock, self._pid = sock, os.getpid()
+        threading.Thread(target=self._read, args=(sock,), name="coord-bus", daemon=True).start()
+
+    def publish(self, topic, **payload):
+        data = (json.dumps({"topic": topic, **payload}) + "\n").encode("utf-8")
+        try:
+            self.start()
+            with self._lock:
+                self._sock.sendall(data)
+        except (OSError, AttributeError):
+            with self._lock:
+                self._sock = None
+
+    def after_fork(self):
+        # The inherited socket belongs to the parent; reconnect lazily.
+        self._sock = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _read(self, sock):
+        try:
+            for line in sock.makefile("rb"):
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    continue
+                self._dispatch(msg)
+        except OSError:
+            pass
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+
+
+class _HubHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        hub = self.server
+        with hub.lock:
+            hub.clients.add(self.wfile)
+        try:
+            for line in self.rfile:
+                # Relay under the lock so lines from different workers never interleave.
+                with hub.lock:
+                    for peer in hub.clients:
+                        if peer is self.wfile:
+                            continue
+                        try:
+                            peer.write(line)
+                            peer.flush()
+                        except OSError:
+                            pass
+        finally:
+            with hub.lock:
+                hub.clients.discard(self.wfile)
+
+
+class _Hub(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.clients = set()
+        super().__init__(path, _HubHandler)
+
+
+def run_hub(path):
+    """Start the relay hub on a unix socket in a background thread and return it."""
+    if os.path.exists(path):
+        os.unlink(path)
+    hub = _Hub(path)
+    threading.Thread(target=hub.serve_forever, name="coord-hub", daemon=True).start()
+    return hub
+
+
+def from_env():
+    path = os.environ.get("COORD_SOCKET")
+    return SocketBus(path) if path else LocalBus()
@@ -0,0 +1,182 @@
+"""
+Session-affinity dispatcher for serve_multi.py (SESSION_AFFINITY=1).
+
+A small WSGI reverse proxy in front of the workers. Requests are routed by
+consistent hashing of the game session id (the `session_id` query argument,
+else the `vg_sid` cookie set at join), so every member of a group lands on
+the same worker and that worker can answer polls from memory. Requests
+without a session are spread round-robin.
+
+If the owning worker cannot be reached, the request goes to the next worker
+on the ring with X-Shard-Owner: 0; that worker serves it from MySQL without
+caching it. A request that failed after it was sent is only resent if its
+method is idempotent: a POST the worker may already have applied gets a 502
+instead of a second delivery.
+"""
+import bisect
+import hashlib
+import http.client
+import itertools
+import select
+import threading
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs, quote
+
+SESSION_COOKIE = "vg_sid"
+
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade",
+}
+
+IDEMPOTENT = {"GET", "HEAD", "OPTIONS"}
+
+
+class Unsent(Exception):
+    """The request never reached the worker (the connection could not be opened)."""
+
+
+def _dropped(conn):
+    # An idle keep-alive socket has nothing to read; readable means the
+    # worker closed it (EOF) and it must not carry the next request.
+    try:
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes."""
+
+    def __init__(self, nodes, vnodes=64):
+        self.nodes = list(nodes)
+        self._ring = sorted(
+            (self._hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes)
+        )
+        self._keys = [h for h, _ in self._ring]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def nodes_for(self, key):
+        """Distinct nodes in ring order: the owner first, then failover candidates."""
+        start = bisect.bisect(self._keys, self._hash(key))
+        found = []
+        for i in range(len(self._ring)):
+            node = self._ring[(start + i) % len(self._ring)][1]
+            if node not in found:
+                found.append(node)
+                if len(found) == len(self.nodes):
+                    break
+        return found
+
+
+class Dispatcher:
+    """WSGI app forwarding each request to the worker that owns its session."""
+
+    def __init__(self, workers, timeout=30):
+        self.ring = HashRing(workers)
+        self.timeout = timeout
+        self._local = threading.local()
+        self._rr = itertools.count()
+
+    def route_key(self, environ):
+        sid = parse_qs(environ.get("QUERY_STRING", "")).get("session_id")
+        if sid and sid[0]:
+            return sid[0]
+        cookie = SimpleCookie(environ.get("HTTP_COOKIE", ""))
+        if SESSION_COOKIE in cookie:
+            return cookie[SESSION_COOKIE].value
+        return None
+
+    def __call__(self, environ, start_response):
+        key = self.route_key(environ)
+        if key:
+            candidates = self.ring.nodes_for(key)
+        else:
+            n = next(self._rr) % len(self.ring.nodes)
+            candidates = self.ring.nodes[n:] + self.ring.nodes[:n]
+
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        body = environ["wsgi.input"].read(length) if length else None
+        path = quote(environ.get("SCRIPT_NAME", "") + environ.get("PATH_INFO", ""))
+        if environ.get("QUERY_STRING"):
+            path += "?" + environ["QUERY_STRING"]
+        headers = self._request_headers(environ)
+        method = environ["REQUEST_METHOD"]
+
+        for i, node in enumerate(candidates):
+            headers["X-Shard-Owner"] = "1" if key and i == 0 else "0"
+            try:
+                resp, data = self._forward(node, method, path, body, headers)
+            except Unsent:
+                continue
+            except (OSError, http.client.HTTPException):
+                if method in IDEMPOTENT:
+                    continue
+                # The worker may have applied it; the client decides whether to resend.
+                start_response("502 Bad Gateway", [("Content-Type", "text/plain")])
+                return [b"worker failed while handling the request"]
+            out = [(k, v) for k, v in resp.getheaders() if k.lower() not in HOP_BY_HOP]
+            start_response(f"{resp.status} {resp.reason}", out)
+            return [data]
+
+        start_response("502 Bad Gateway", [("Content-Type", "text/plain")])
+        return [b"no worker available"]
+
+    def _request_headers(self, environ):
+        headers = {}
+        for k, v in environ.items():
+            if k.startswith("HTTP_") and k not in ("HTTP_X_SHARD_OWNER", "HTTP_CONNECTION"):
+                headers[k[5:].replace("_", "-").title()] = v
+        if environ.get("CONTENT_TYPE"):
+            headers["Content-Type"] = environ["CONTENT_TYPE"]
+        if environ.get("CONTENT_LENGTH"):
+            headers["Content-Length"] = environ["CONTENT_LENGTH"]
+        remote = environ.get("REMOTE_ADDR")
+        if remote:
+            prior = headers.get("X-Forwarded-For")
+            headers["X-Forwarded-For"] = f"{prior}, {remote}" if prior else remote
+        return headers
+
+    def _connection(self, node):
+        """This thread's keep-alive connection to `node` and whether it is new.
+
+        Raises Unsent if a new connection cannot be opened.
+        """
+        conns = self._local.__dict__.setdefault("conns", {})
+        conn = conns.get(node)
+        if conn is not None and conn.sock is not None and not _dropped(conn):
+            return conn, False
+        if conn is not None:
+            conn.close()
+        host, port = node
+        conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        try:
+            conn.connect()
+        except OSError as exc:
+            conns.pop(node, None)
+            raise Unsent(exc) from exc
+        conns[node] = conn
+        return conn, True
+
+    def _forward(self, node, method, path, body, headers):
+        """Send one request to `node` over a keep-alive connection.
+
+        Raises Unsent when the request cannot have reached the worker. A
+        failure after sending is retried once on a fresh connection only
+        for idempotent methods on a reused connection (the worker may have
+        closed it while idle); otherwise it is raised to the caller.
+        """
+        for attempt in range(2):
+            conn, fresh = self._connection(node)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                return resp, resp.read()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                self._local.conns.pop(node, None)
+                if attempt or fresh or method not in IDEMPOTENT:
+                    raise
@@ -0,0 +1,759 @@
+"""
+In-memory game engine (GAME_ENGINE=1).
+
+One GameEngine per session holds its participants, decisions and round
+phases as compact __slots__ records and changes them only by applying
+events (join, choose, finalize, ready, phase, reveal). Status reads and
+state transitions never touch MySQL.
+
+Every event is handed to an EventLog: a writer thread appends pending
+events to an append-only file (one fsync per batch, so concurrent requests
+share it) and then applies them to the existing tables in batches, one
+transaction each, so the stored schema, the admin pages, the export and the
+backups stay as they are. join, choose and confirm_ready return only once
+their events are fsynced: a participant is never told a write was recorded
+that a crash could still lose. Once MySQL has a batch the file is
+truncated; whatever is still in a log file after a crash is replayed into
+MySQL on the next start. All persist statements are idempotent, so
+replaying a batch twice is harmless.
+
+The engine is only authoritative where one process owns a session:
+serve_waitress.py, or the owning worker in SESSION_AFFINITY mode.
+"""
+import datetime
+import glob
+import json
+import os
+import re
+import threading
+import time
+
+import analytics
+from storage import cents, money
+
+
+# -------------------- Records --------------------
+class Participant:
+    __slots__ = ("id", "code", "joined", "join_number", "ptype", "current_round",
+                 "balance", "ready", "created_at")
+
+    def __init__(self, row):
+        self.id = row["id"]
+        self.code = row["code"]
+        self.joined = bool(row["joined"])
+        self.join_number = row["join_number"]
+        self.ptype = row["ptype"]
+        self.current_round = row["current_round"] or 1
+        self.balance = cents(row["balance"])    # integer cents
+        self.ready = bool(row["ready_for_next"])
+        self.created_at = row["created_at"]
+
+    def sort_key(self):
+        # Same order as "ORDER BY join_number, code" (NULLs first in MySQL)
+        return (self.join_number is not None, self.join_number or 0, self.code or "")
+
+
+class Decision:
+    # cost, payout and b_cost_round in integer cents
+    __slots__ = ("participant_id", "choice", "created_at", "cost", "payout",
+                 "others_A", "b_cost_round", "reveal")
+
+    def __init__(self, participant_id, choice, created_at, cost=None, payout=None,
+                 others_A=None, b_cost_round=None, reveal=None):
+        self.participant_id = participant_id
+        self.choice = choice
+        self.created_at = created_at
+        self.cost = cost
+        self.payout = payout
+        self.others_A = others_A
+        self.b_cost_round = b_cost_round
+        self.reveal = reveal
+
+
+class Phase:
+    __slots__ = ("watch_ends_at", "created_at")
+
+    def __init__(self, watch_ends_at, created_at):
+        self.watch_ends_at = watch_ends_at
+        self.created_at = created_at
+
+
+# -------------------- Engine --------------------
+class GameEngine:
+    """Authoritative in-memory state of one session."""
+
+    def __init__(self, s, participants, decisions, phases, log, costs):
+        self.id = s["id"]
+        self.group_size = int(s["group_size"])
+        self.rounds = int(s["rounds"])
+        self.archived = bool(s["archived"])
+        self.starting_balance = float(s["starting_balance"] or 500)
+        self.watch_seconds = int(s["watch_time"] or s["reveal_window"] or 5)
+        self.reveal_seconds = int(s["reveal_window"] or 5)
+        self.participants = {row["id"]: Participant(row) for row in participants}
+        self.last_join = max((p.join_number or 0 for p in self.participants.values() if p.joined), default=0)
+        self.decisions = {}        # round_number -> {participant_id: Decision}
+        for row in decisions:
+            self.decisions.setdefault(row["round_number"], {})[row["participant_id"]] = Decision(
+                row["participant_id"], row["choice"], row["created_at"], cents(row["total_cost"]),
+                cents(row["payout"]), row["others_A"], cents(row["b_cost_round"]), row["reveal"]
+            )
+        self.phases = {row["round_number"]: Phase(row["watch_ends_at"], row["created_at"]) for row in phases}
+        self.log = log
+        self.a_cost, self.b_cost = costs
+        self.lock = threading.Lock()
+        self._seq = 0              # log position of this engine's last event
+
+    # ---------- events ----------
+    def _emit(self, ev):
+        ev["sid"] = self.id
+        getattr(self, "_on_" + ev["t"])(ev)
+        self._seq = self.log.append(ev)
+
+    def _on_join(self, ev):
+        p = self.participants[ev["pid"]]
+        p.joined = True
+        p.join_number = ev["n"]
+        self.last_join = max(self.last_join, ev["n"] or 0)
+        p.ptype = ev["ptype"]
+        p.created_at = p.created_at or ev["at"]
+
+    def _on_choose(self, ev):
+        self.decisions.setdefault(ev["r"], {})[ev["pid"]] = Decision(ev["pid"], ev["choice"], ev["at"])
+
+    def _on_finalize(self, ev):
+        r = ev["r"]
+        for pid, cost, payout, others_A, b_cost_round in ev["rows"]:
+            d = self.decisions[r][pid]
+            d.cost, d.payout = cents(cost), cents(payout)
+            d.others_A, d.b_cost_round, d.reveal = others_A, cents(b_cost_round), 1
+            self.participants[pid].balance = cents(payout)
+        for p in self.participants.values():
+            if p.current_round == r:
+                p.current_round = r + 1
+                p.ready = False
+        self.phases[r] = Phase(ev["ends"], ev["at"])
+
+    def _on_ready(self, ev):
+        self.participants[ev["pid"]].ready = True
+
+    def _on_phase(self, ev):
+        self.phases[ev["r"]] = Phase(ev["ends"], ev["at"])
+
+    def _on_reveal(self, ev):
+        for d in self.decisions.get(ev["r"], {}).values():
+            d.reveal = 1
+
+    # ---------- commands ----------
+    # join, choose and confirm_ready wait for the fsync outside the lock, so
+    # the other participants' writes join the same one. A repeated command
+    # waits too: the first attempt may not be on disk yet.
+    def join(self, pid, now):
+        """Mark `pid` joined, assigning join number and type like the SQL path did."""
+        with self.lock:
+            p = self.participants[pid]
+            if not p.joined:
+                n = self.last_join + 1
+            else:
+                n = p.join_number
+            ptype = p.ptype or (((n or 1) - 1) % 6) + 1
+            ev = {"t": "join", "pid": pid, "n": n, "ptype": ptype, "at": _iso(now)}
+            if not p.joined and n == self.group_size:
+                ev["opened"] = ev["at"]       # round 1 opens with the last join
+            self._emit(ev)
+            seq = self._seq
+        self.log.sync(seq)
+
+    def choose(self, pid, choice, now):
+        """Record a decision. Returns (round, inserted, finalized_watch_ends or None)."""
+        with self.lock:
+            r = self.participants[pid].current_round
+            decided = self.decisions.get(r, {})
+            if pid in decided:
+                result = r, False, None
+            else:
+                self._emit({"t": "choose", "pid": pid, "r": r, "choice": choice, "at": _iso(now),
+                            "decided": len(decided) + 1})
+                result = r, True, self._finalize(r, now)
+            seq = self._seq
+        self.log.sync(seq)
+        return result
+
+    def finalize_if_complete(self, r, now):
+        """Finalize round `r` if everybody decided but it was never settled (e.g. after a crash)."""
+        with self.lock:
+            return self._finalize(r, now)
+
+    def _settled(self, r):
+        decided = self.decisions.get(r, {})
+        return len(decided) >= self.group_size and all(d.cost is not None for d in decided.values())
+
+    def _finalize(self, r, now):
+        # Like app._finalize_round: settle once everybody decided, whether or
+        # not a phase row exists (legacy rows; the finalize event replaces it).
+        decided = self.decisions.get(r, {})
+        if len(decided) < self.group_size:
+            return None
+        if all(d.cost is not None for d in decided.values()):
+            return None
+        players = sorted((self.participants[pid] for pid in decided), key=Participant.sort_key)
+        total_A = sum(1 for d in decided.values() if d.choice == "A")
+        M = self.starting_balance
+        rows = []
+        for p in players:
+            ptype = p.ptype or 1
+            if decided[p.id].choice == "A":
+                cost, others_A, b_cost_round = self.a_cost(ptype), max(0, total_A - 1), None
+            else:
+                others_A = total_A
+                cost = b_cost_round = self.b_cost(ptype, others_A, self.group_size)
+            rows.append([p.id, cost, max(M - float(cost), 0), others_A, b_cost_round])
+        ends = now + _seconds(self.watch_seconds)
+        self._emit({"t": "finalize", "r": r, "M": M, "rows": rows,
+                    "at": _iso(now), "ends": _iso(ends)})
+        return ends
+
+    def confirm_ready(self, pid, now):
+        with self.lock:
+            p = self.participants[pid]
+            if not p.ready:
+                ev = {"t": "ready", "pid": pid, "r": p.current_round}
+                if self._ready_count() + 1 >= self.group_size:
+                    ev["opened"] = _iso(now)  # the last confirmation opens the round
+                self._emit(ev)
+            seq = self._seq
+        self.log.sync(seq)
+
+    def open_phase(self, r, now):
+        """Watch deadline of round `r`, opening it if missing. Returns (ends_at, opened).
+
+        (None, False) while round `r` is not settled: a phase opened early
+        would show unsettled decisions.
+        """
+        with self.lock:
+            if not self._settled(r):
+                return None, False
+            ph = self.phases.get(r)
+            if ph:
+                return ph.watch_ends_at, False
+            ends = now + _seconds(self.reveal_seconds)
+            self._emit({"t": "phase", "r": r, "at": _iso(now), "ends": _iso(ends)})
+            return _iso(ends), True
+
+    def reveal(self, r):
+        """Mark the decisions of settled round `r` revealed; False if it is not settled."""
+        with self.lock:
+            if not self._settled(r):
+                return False
+            if any(d.reveal != 1 for d in self.decisions.get(r, {}).values()):
+                self._emit({"t": "reveal", "r": r})
+            return True
+
+    # ---------- reads ----------
+    def _ordered(self):
+        return sorted(self.participants.values(), key=Participant.sort_key)
+
+    def _ready_count(self):
+        return sum(1 for p in self.participants.values() if p.ready)
+
+    def _is_reset(self, pid):
+        p = self.participants.get(pid) if pid else None
+        return bool(p and not p.joined)
+
+    def overlay(self, row):
+        """Participant row with the fields the engine owns brought up to date."""
+        p = self.participants.get(row["id"])
+        if p is None:
+            return row
+        return {**row, "joined": int(p.joined), "join_number": p.join_number, "ptype": p.ptype,
+                "current_round": p.current_round, "balance": money(p.balance), "ready_for_next": int(p.ready)}
+
+    def state(self, pid):
+        """Same decision table as app.current_state, from memory."""
+        p = self.participants.get(pid)
+        if not p:
+            return "lobby"
+        if self.archived:
+            return "done"
+        if sum(1 for q in self.participants.values() if q.joined) < self.group_size:
+            return "lobby"
+        r = p.current_round
+        if r > self.rounds:
+            return "done" if self._ready_count() >= self.group_size else "reveal"
+        if r > 1 and self._ready_count() < self.group_size:
+            return "reveal"
+        if pid not in self.decisions.get(r, {}):
+            return "round"
+        if r not in self.phases:
+            return "wait"
+        return "reveal"
+
+    def decided_count(self, r):
+        return len(self.decisions.get(r, {}))
+
+    def lobby_status(self, pid):
+        joined = sum(1 for p in self.participants.values() if p.joined)
+        return {
+            "joined": joined,
+            "group_size": self.group_size,
+            "ready": joined >= self.group_size,
+            "reset": self._is_reset(pid),
+        }
+
+    def round_status(self, pid, r):
+        if self._is_reset(pid):
+            return {"reset": True}
+        decided = self.decisions.get(r, {})
+        ready = len(decided) >= self.group_size
+        ordered = [p for p in self._ordered() if p.id in decided]
+        players = []
+        watch_ends_at = None
+        if ready:
+            ph = self.phases.get(r)
+            watch_ends_at = ph.watch_ends_at if ph else None
+            players = [{
+                "player_no": p.join_number,
+                "choice": decided[p.id].choice,
+                "cost": money(decided[p.id].cost),
+                "payout": money(decided[p.id].payout),
+            } for p in ordered]
+        return {
+            "decided": len(decided),
+            "ready": ready,
+            "decided_players": [p.join_number for p in ordered],
+            "watch_ends_at": watch_ends_at,
+            "players": players,
+        }
+
+    def reveal_players(self, r, me_id):
+        decided = self.decisions.get(r, {})
+        players, me = [], None
+        for p in self._ordered():
+            d = decided.get(p.id)
+            obj = {
+                "code": p.code,
+                "player_no": p.join_number,
+                "choice": d.choice if d else None,
+                "payout": money(d.payout) if d else None,
+            }
+            players.append(obj)
+            if p.id == me_id:
+                me = obj
+        return players, me
+
+    def ready_status(self, pid, me_id):
+        if self._is_reset(pid):
+            return {"reset": True}
+        players = [{"player_no": p.join_number, "ready": p.ready} for p in self._ordered()]
+        ready_count = self._ready_count()
+        me = self.participants.get(me_id) if me_id else None
+        return {
+            "ready_count": ready_count,
+            "group_size": self.group_size,
+            "all_ready": ready_count >= self.group_size,
+            "me_ready": bool(me and me.ready),
+            "players": players,
+        }
+
+
+def _seconds(n):
+    return datetime.timedelta(seconds=n)
+
+
+def _iso(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def load_engine(con, sid, log, costs):
+    """Build the engine of `sid` from MySQL; None if the session does not exist."""
+    cursor = con.cursor()
+    try:
+        cursor.execute("SELECT * FROM sessions WHERE id=%s", (sid,))
+        s = cursor.fetchone()
+        if not s:
+            return None
+        cursor.execute(
+            "SELECT id, code, joined, join_number, ptype, current_round, balance, ready_for_next, created_at "
+            "FROM participants WHERE session_id=%s",
+            (sid,)
+        )
+        participants = cursor.fetchall()
+        cursor.execute(
+            "SELECT participant_id, round_number, choice, created_at, total_cost, payout, "
+            "others_A, b_cost_round, reveal FROM decisions WHERE session_id=%s",
+            (sid,)
+        )
+        decisions = cursor.fetchall()
+        cursor.execute(
+            "SELECT round_number, watch_ends_at, created_at FROM round_phases WHERE session_id=%s",
+            (sid,)
+        )
+        phases = cursor.fetchall()
+    finally:
+        cursor.close()
+    return GameEngine(s, participants, decisions, phases, log, costs)
+
+
+# -------------------- Persistence --------------------
+def _persist_join(cursor, ev):
+    cursor.execute(
+        "UPDATE participants SET joined=1, join_number=%s, ptype=%s, created_at=COALESCE(created_at, %s) WHERE id=%s",
+        (ev["n"], ev["ptype"], ev["at"], ev["pid"])
+    )
+    if ev["n"]:
+        cursor.execute(
+            "INSERT INTO join_counters (session_id, last_join) VALUES (%s,%s) "
+            "ON DUPLICATE KEY UPDATE last_join = GREATEST(last_join, VALUES(last_join))",
+            (ev["sid"], ev["n"])
+        )
+    if ev.get("opened"):
+        analytics.open_round(cursor, ev["sid"], 1, ev["opened"])
+
+def _persist_choose(cursor, ev):
+    cursor.execute(
+        "INSERT IGNORE INTO decisions (session_id, participant_id, round_number, choice, created_at) "
+        "VALUES (%s,%s,%s,%s,%s)",
+        (ev["sid"], ev["pid"], ev["r"], ev["choice"], ev["at"])
+    )
+    cursor.execute(
+        "INSERT INTO round_progress (session_id, round_number, decided) VALUES (%s,%s,%s) "
+        "ON DUPLICATE KEY UPDATE decided = GREATEST(decided, VALUES(decided))",
+        (ev["sid"], ev["r"], ev["decided"])
+    )
+
+def _persist_finalize(cursor, ev):
+    r, M = ev["r"], ev["M"]
+    cursor.executemany(
+        """UPDATE decisions
+           SET a_cost=%s, b_cost=%s, total_cost=%s,
+               payout=%s, base_payout=%s, others_A=%s, b_cost_round=%s, reveal=1
+           WHERE participant_id=%s AND round_number=%s AND total_cost IS NULL""",
+        [(None if b_round is not None else cost, cost if b_round is not None else None, cost,
+          payout, M, others_A, b_round, pid, r)
+         for pid, cost, payout, others_A, b_round in ev["rows"]]
+    )
+    cursor.executemany(
+        "UPDATE participants SET balance=%s WHERE id=%s",
+        [(payout, pid) for pid, _, payout, _, _ in ev["rows"]]
+    )
+    cursor.execute(
+        "UPDATE participants SET current_round = current_round + 1, ready_for_next = 0 WHERE session_id=%s AND current_round=%s",
+        (ev["sid"], r)
+    )
+    # A reveal poll may have opened the phase before the last decision
+    # (legacy clients); the settled deadline replaces it, as in SQL mode.
+    cursor.execute(
+        """REPLACE INTO round_phases
+           (session_id,round_number,decision_ends_at,watch_ends_at,created_at,phase)
+           VALUES (%s,%s,%s,%s,%s,'watch')""",
+        (ev["sid"], r, ev["at"], ev["ends"], ev["at"])
+    )
+    analytics.write_round_summary(cursor, ev["sid"], r, ev["at"])
+
+def _persist_ready(cursor, ev):
+    cursor.execute("UPDATE participants SET ready_for_next=1 WHERE id=%s", (ev["pid"],))
+    if ev.get("opened"):
+        analytics.open_round(cursor, ev["sid"], ev["r"], ev["opened"])
+
+def _persist_phase(cursor, ev):
+    cursor.execute(
+        """INSERT IGNORE INTO round_phases
+           (session_id,round_number,decision_ends_at,watch_ends_at,created_at,phase)
+           VALUES (%s,%s,%s,%s,%s,'watch')""",
+        (ev["sid"], ev["r"], ev["at"], ev["ends"], ev["at"])
+    )
+
+def _persist_reveal(cursor, ev):
+    cursor.execute(
+        "UPDATE decisions SET reveal=1 WHERE session_id=%s AND round_number=%s AND (reveal IS NULL OR reveal!=1)",
+        (ev["sid"], ev["r"])
+    )
+
+PERSIST = {
+    "join": _persist_join,
+    "choose": _persist_choose,
+    "finalize": _persist_finalize,
+    "ready": _persist_ready,
+    "phase": _persist_phase,
+    "reveal": _persist_reveal,
+}
+
+def persist(cursor, events):
+    """Apply `events` in order. Events of a session that is gone or marked for
+    reset/delete are dropped; the share lock keeps the mark from being set
+    while this transaction runs (see app.close_session). Each session written
+    is noted in session_changes for incremental backups (see app.touch_session)."""
+    live = {}
+    for ev in events:
+        sid = ev["sid"]
+        if sid not in live:
+            cursor.execute("SELECT status FROM sessions WHERE id=%s LOCK IN SHARE MODE", (sid,))
+            s = cursor.fetchone()
+            live[sid] = bool(s) and not s["status"]
+        if live[sid]:
+            PERSIST[ev["t"]](cursor, ev)
+    stored = _iso(datetime.datetime.now(datetime.timezone.utc))
+    for sid in [sid for sid, ok in live.items() if ok]:
+        cursor.execute(
+            "INSERT INTO session_changes (session_id, changed_at) VALUES (%s,%s) "
+            "ON DUPLICATE KEY UPDATE changed_at=VALUES(changed_at)",
+            (sid, stored)
+        )
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class LogBusy(Exception):
+    """An event was not fsynced in time; the caller must not report it recorded."""
+
+
+class EventLog:
+    """Append-only event file with batched write-behind into MySQL.
+
+    Pending events are fsynced as soon as the writer gets to them (group
+    fsync: whatever arrived during the previous one shares the next), and
+    stored in MySQL once `batch` of them are waiting, `interval` has passed
+    since the oldest, or a flush asks for it.
+    """
+
+    def __init__(self, directory, connect, interval=0.02, batch=256, logger=None, on_stored=None):
+        self.directory = directory
+        self.connect = connect
+        self.interval = interval
+        self.batch = batch
+        self.logger = logger
+        self.on_stored = on_stored    # on_stored(events), after they are committed
+        self.after_fork()
+
+    def after_fork(self):
+        self._pending = []         # appended, not yet in the file
+        self._unsaved = []         # in the file, not yet in MySQL
+        self._appended = 0
+        self._synced = 0
+        self._persisted = 0
+        self._since = 0.0          # monotonic time the oldest unsaved event was written
+        self._flushing = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._file = None
+        self._con = None
+        self._recovered = False
+        self._start_lock = threading.Lock()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"events-{os.getpid()}.log")
+
+    def append(self, ev) -> int:
+        """Queue `ev`; returns its sequence number for sync()."""
+        with self._cond:
+            self._pending.append(ev)
+            self._appended += 1
+            # The writer drains everything pending before it sleeps, so only
+            # the first event needs to wake it.
+            if len(self._pending) == 1:
+                self._cond.notify_all()
+            self._ensure_thread()
+            return self._appended
+
+    def sync(self, seq, timeout=10.0):
+        """Wait until event `seq` (and everything before it) is fsynced; LogBusy on timeout."""
+        with self._cond:
+            if self._synced >= seq:
+                return
+            self._ensure_thread()
+            if not self._cond.wait_for(lambda: self._synced >= seq, timeout):
+                raise LogBusy(f"event log not synced after {timeout}s")
+
+    def flush(self, timeout=5.0) -> bool:
+        """Wait until every event appended so far is stored in MySQL."""
+        with self._cond:
+            target = self._appended
+            if self._persisted >= target:
+                return True
+            self._ensure_thread()
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                return self._cond.wait_for(lambda: self._persisted >= target, timeout)
+            finally:
+                self._flushing -= 1
+
+    def backlog(self) -> int:
+        return self._appended - self._persisted
+
+    def start(self):
+        """Replay logs left behind by a crash, then start the writer.
+
+        Recovery runs in the caller, so no engine is loaded from MySQL before
+        the events of a crashed run are back in it.
+        """
+        if not self._recovered:
+            with self._start_lock:
+                if not self._recovered:
+                    os.makedirs(self.directory, exist_ok=True)
+                    self.recover()
+                    self._recovered = True
+        with self._cond:
+            self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="engine-log", daemon=True)
+            self._thread.start()
+
+    def recover(self):
+        """Replay log files left behind by dead processes into MySQL.
+
+        A file carrying our own pid is from an earlier run that had the same
+        pid (pid 1 in a container); it is replayed too as long as this
+        process has not opened its own log yet.
+        """
+        for path in glob.glob(os.path.join(self.directory, "events-*.log*")):
+            name = os.path.basename(path)
+            owner = int(re.findall(r"\d+", name)[-1])
+            if owner == os.getpid():
+                if self._file is not None:
+                    continue
+            elif _pid_alive(owner):
+                continue
+            base = re.match(r"events-\d+", name).group(0)
+            claimed = os.path.join(self.directory, f"{base}.log.{os.getpid()}.replay")
+            try:
+                os.rename(path, claimed)   # atomic claim; another worker may win
+            except OSError:
+                continue
+            with open(claimed, encoding="utf-8") as f:
+                events = [json.loads(line) for line in f if line.strip()]
+            if events:
+                self._store(events)
+            os.unlink(claimed)
+        if self._con is not None:
+            # Opened in the caller's thread; the writer thread opens its own.
+            self._con.close()
+            self._con = None
+
+    def _store_due(self):
+        return bool(self._unsaved) and (
+            self._flushing or len(self._unsaved) >= self.batch
+            or time.monotonic() - self._since >= self.interval)
+
+    def _store_wait(self):
+        if not self._unsaved:
+            return None
+        return max(0.0, self.interval - (time.monotonic() - self._since))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._store_due():
+                    self._cond.wait(self._store_wait())
+                batch, self._pending = self._pending, []
+            try:
+                if batch:
+                    self._write(batch)
+                    if not self._unsaved:
+                        self._since = time.monotonic()
+                    self._unsaved.extend(batch)
+                    with self._cond:
+                        self._synced += len(batch)
+                        self._cond.notify_all()
+                    batch = []
+                if self._store_due():
+                    self._store(self._unsaved)
+                    self._file.seek(0)
+                    self._file.truncate()
+                    done, self._unsaved = len(self._unsaved), []
+                    with self._cond:
+                        self._persisted += done
+                        self._cond.notify_all()
+            except Exception:
+                if batch:
+                    # Not in the file yet: keep it ahead of newer events.
+                    with self._cond:
+                        self._pending[:0] = batch
+                if self.logger:
+                    self.logger.exception("engine log: write-behind failed, retrying")
+                time.sleep(min(1.0, self.interval * 10))
+
+    def _write(self, batch):
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._file = open(self.path, "a+", encoding="utf-8")
+        self._file.write("".join(json.dumps(ev, separators=(",", ":")) + "\n" for ev in batch))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _store(self, events):
+        if self._con is None:
+            self._con = self.connect()
+        cursor = self._con.cursor()
+        try:
+            persist(cursor, events)
+            self._con.commit()
+        except Exception:
+            try:
+                self._con.close()
+            except Exception:
+                pass
+            self._con = None
+            raise
+        finally:
+            cursor.close()
+        if self.on_stored:
+            try:
+                self.on_stored(events)
+            except Exception:
+                if self.logger:
+                    self.logger.exception("engine log: on_stored hook failed")
+
+
+class Engines:
+    """Registry of loaded engines in this process."""
+
+    def __init__(self, log, costs):
+        self.log = log
+        self.costs = costs
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def get(self, sid, connect):
+        """Engine of `sid`; `connect()` supplies a connection only to load a missing one."""
+        eng = self._engines.get(sid)
+        if eng is None:
+            # Crash recovery must be finished before anything is loaded, and
+            # an engine dropped a moment ago may still have events in flight.
+            self.log.start()
+            self.log.flush()
+            eng = load_engine(connect(), sid, self.log, self.costs)
+            if eng is None:
+                return None
+            with self._lock:
+                eng = self._engines.setdefault(sid, eng)
+        return eng
+
+    def drop(self, sid):
+        """Forget `sid` (its rows were changed outside the engine) after flushing pending events."""
+        with self._lock:
+            self._engines.pop(sid, None)
+        self.log.flush()
+
+    def start(self):
+        """Replay logs left by a crash, then start the write-behind thread."""
+        self.log.start()
+
+    def __len__(self):
+        return len(self._engines)
+
+    def after_fork(self):
+        self._engines = {}
+        self._lock = threading.Lock()
+        self.log.after_fork()
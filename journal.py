@@ -0,0 +1,226 @@
+"""
+Group commit for the participant write path (/join, /choose, /confirm_ready
+and round finalization).
+
+Every session has its own lane: an ordered queue of commands with a single
+writer. Request threads submit a command and block on the returned Future.
+Writer threads (`threads`, default 1) repeatedly claim all runnable lanes,
+take up to `max_batch` queued commands, append them to the game_events
+journal, apply each lane's commands in order to the derived tables
+(participants, decisions, round_progress, round_phases) and commit all of it
+in a single transaction. A lane is claimed by at most one writer at a time,
+so writes to one session never race each other on row locks, while
+different sessions still share one commit. A burst of clicks at round start
+costs one fsync instead of one per click. Futures are resolved only after
+the commit, so a caller never reports success for a write that is not
+durable.
+
+If a batch fails as a whole (deadlock, lost connection), it is retried once
+and then committed command by command, so one bad command only fails its
+own caller. Failed batch attempts are logged and counted in stats().
+
+apply() may return Discarded(result) for a command that must leave no trace
+(its session is being reset or deleted): it is left out of game_events and
+its caller gets `result`.
+"""
+import collections
+import json
+import threading
+import time
+from concurrent.futures import Future
+
+
+class Discarded:
+    """apply() result for a command that is not journaled."""
+
+    __slots__ = ("result",)
+
+    def __init__(self, result=None):
+        self.result = result
+
+
+class _Lane:
+    """Pending commands of one session."""
+
+    __slots__ = ("queue", "busy")
+
+    def __init__(self):
+        self.queue = collections.deque()   # (event, future, enqueued_at)
+        self.busy = False
+
+
+class GroupCommitter:
+    """Per-session single-writer lanes committed in shared batches."""
+
+    def __init__(self, connect, apply, max_batch=64, max_wait=0.005, threads=1, logger=None):
+        self.connect = connect
+        self.apply = apply            # apply(cursor, event) -> result for the caller
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.threads = max(1, threads)
+        self.logger = logger
+        self.batches = 0
+        self.events = 0
+        self.retries = 0              # failed batch attempts
+        self.after_fork()
+
+    def after_fork(self):
+        self._lanes = {}               # session_id -> _Lane
+        self._runnable = collections.deque()
+        self._queued = 0
+        self._cond = threading.Condition()
+        self._workers = []
+        self._local = threading.local()
+        self._latency = collections.deque(maxlen=1024)   # seconds, submit -> commit
+
+    def submit(self, kind, session_id, participant_id=None, **payload) -> Future:
+        fut = Future()
+        ev = {"kind": kind, "sid": session_id, "pid": participant_id, **payload}
+        with self._cond:
+            lane = self._lanes.get(session_id)
+            if lane is None:
+                lane = self._lanes[session_id] = _Lane()
+            if not lane.queue and not lane.busy:
+                self._runnable.append(session_id)
+            lane.queue.append((ev, fut, time.monotonic()))
+            self._queued += 1
+            self._ensure_workers()
+            self._cond.notify()
+        return fut
+
+    def stats(self) -> dict:
+        with self._cond:
+            depths = [len(lane.queue) for lane in self._lanes.values()]
+            lat = sorted(self._latency)
+
+        def pct(q):
+            return round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 2) if lat else 0.0
+
+        return {
+            "batches": self.batches,
+            "events": self.events,
+            "avg_batch": round(self.events / self.batches, 2) if self.batches else 0.0,
+            "retries": self.retries,
+            "queued": sum(depths),
+            "sessions_queued": sum(1 for d in depths if d),
+            "max_session_depth": max(depths, default=0),
+            "latency_ms": {"p50": pct(0.5), "p95": pct(0.95), "max": pct(1.0)},
+        }
+
+    def _ensure_workers(self):
+        self._workers = [t for t in self._workers if t.is_alive()]
+        while len(self._workers) < self.threads:
+            t = threading.Thread(target=self._run, name="group-commit", daemon=True)
+            t.start()
+            self._workers.append(t)
+
+    def _claim(self):
+        """Take runnable lanes (marking them busy) and up to max_batch of their commands."""
+        claimed = []   # (session_id, [(event, future, enqueued_at), ...])
+        room = self.max_batch
+        while self._runnable and room > 0:
+            sid = self._runnable.popleft()
+            lane = self._lanes[sid]
+            lane.busy = True
+            items = []
+            while lane.queue and room > 0:
+                items.append(lane.queue.popleft())
+                room -= 1
+            self._queued -= len(items)
+            claimed.append((sid, items))
+        return claimed
+
+    def _release(self, claimed):
+        for sid, _ in claimed:
+            lane = self._lanes[sid]
+            lane.busy = False
+            if lane.queue:
+                self._runnable.append(sid)
+            else:
+                del self._lanes[sid]
+        self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._runnable:
+                    self._cond.wait()
+                # Give concurrent callers a moment to join this batch.
+                deadline = time.monotonic() + self.max_wait
+                while self._queued < self.max_batch:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                    if not self._runnable:
+                        break
+                claimed = self._claim()
+            if not claimed:
+                continue
+            try:
+                self._commit([item for _, items in claimed for item in items])
+            finally:
+                with self._cond:
+                    self._release(claimed)
+
+    def _commit(self, batch):
+        for attempt in range(2):
+            try:
+                results = self._transaction([ev for ev, _, _ in batch])
+            except Exception:
+                with self._cond:
+                    self.retries += 1
+                if self.logger:
+                    self.logger.warning(
+                        "group commit: batch of %d failed, %s", len(batch),
+                        "committing one by one" if attempt else "retrying", exc_info=True)
+                continue
+            for (_, fut, t0), result in zip(batch, results):
+                self._resolve(fut, t0, result)
+            return
+        # Isolate the failing command(s); lane order is kept.
+        for ev, fut, t0 in batch:
+            try:
+                self._resolve(fut, t0, self._transaction([ev])[0])
+            except Exception as e:
+                if self.logger:
+                    self.logger.exception("group commit: %s event failed", ev["kind"])
+                fut.set_exception(e)
+
+    def _resolve(self, fut, t0, result):
+        self._latency.append(time.monotonic() - t0)
+        fut.set_result(result)
+
+    def _transaction(self, events):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = self._local.con = self.connect()
+        cursor = con.cursor()
+        try:
+            results = [self.apply(cursor, ev) for ev in events]
+            kept = [ev for ev, result in zip(events, results) if not isinstance(result, Discarded)]
+            if kept:
+                cursor.executemany(
+                    "INSERT INTO game_events (session_id, participant_id, kind, payload, created_at) "
+                    "VALUES (%s,%s,%s,%s,%s)",
+                    [(ev["sid"], ev["pid"], ev["kind"], json.dumps(ev, separators=(",", ":")), ev.get("at"))
+                     for ev in kept]
+                )
+            results = [r.result if isinstance(r, Discarded) else r for r in results]
+            con.commit()
+        except Exception:
+            try:
+                con.rollback()
+            except Exception:
+                try:
+                    con.close()
+                except Exception:
+                    pass
+                self._local.con = None
+            raise
+        finally:
+            cursor.close()
+        with self._cond:
+            self.batches += 1
+            self.events += len(events)
+        return results
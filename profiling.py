@@ -0,0 +1,193 @@
+"""
+Production profiling for a running server.
+
+StackSampler takes snapshots of every thread's Python stack at a fixed
+interval (sys._current_frames, no tracing hooks) and folds them into the
+collapsed-stack format that flamegraph.pl, speedscope and inferno read:
+one line per distinct stack, frames joined by ";", then the sample count.
+start() runs a sample in its own thread, so no request waits for it.
+
+RouteProfiler runs cProfile on one request in every K of a chosen route
+and accumulates the results per route. Routes that are not switched on
+cost one dict lookup per request; at most one request per process is
+traced at a time, so the profiler never stacks up on a busy server.
+"""
+import cProfile
+import collections
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+
+# Leaf frames of threads that are parked, not working (waitress idle workers,
+# the accept loop, condition waits, queue gets). Dropped unless idle=True.
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("socket.py", "accept"),
+    ("queue.py", "get"),
+    ("wasyncore.py", "poll"),
+}
+
+
+def _thread_label(name):
+    # waitress-0 ... waitress-47 become one root frame
+    return re.sub(r"\d+", "N", name or "thread")
+
+
+class StackSampler:
+    """Wall-clock stack sampler over all threads of this process."""
+
+    def __init__(self):
+        self._busy = threading.Lock()
+        self._last = None          # (counts, ticks, finished_at) of the last start()
+        self.ends_at = 0.0         # time.time() the running sample ends
+
+    @property
+    def running(self) -> bool:
+        return self._busy.locked()
+
+    def sample(self, seconds, interval=0.01, idle=False):
+        """Sample for `seconds`; returns (Counter of collapsed stacks, number of ticks).
+
+        Raises RuntimeError if another sample is already running.
+        """
+        if not self._busy.acquire(blocking=False):
+            raise RuntimeError("a sample is already running")
+        try:
+            return self._sample(seconds, interval, idle)
+        finally:
+            self._busy.release()
+
+    def start(self, seconds, interval=0.01, idle=False) -> float:
+        """Sample for `seconds` in a background thread; returns ends_at.
+
+        The outcome is available from last() once `running` is False.
+        Raises RuntimeError if another sample is already running.
+        """
+        if not self._busy.acquire(blocking=False):
+            raise RuntimeError("a sample is already running")
+        self._last = None
+        self.ends_at = time.time() + seconds
+
+        def run():
+            try:
+                counts, ticks = self._sample(seconds, interval, idle)
+                self._last = (counts, ticks, time.time())
+            finally:
+                self._busy.release()
+
+        threading.Thread(target=run, name="stack-sampler", daemon=True).start()
+        return self.ends_at
+
+    def last(self):
+        """(counts, ticks, finished_at) of the last finished start(), or None."""
+        return None if self.running else self._last
+
+    def _sample(self, seconds, interval, idle):
+        me = threading.get_ident()
+        counts = collections.Counter()
+        ticks = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = self._stack(frame, idle)
+                if stack:
+                    counts[_thread_label(names.get(ident)) + ";" + stack] += 1
+            ticks += 1
+            time.sleep(interval)
+        return counts, ticks
+
+    @staticmethod
+    def _stack(frame, idle):
+        code = frame.f_code
+        if not idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+            return None
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(frames))
+
+    @staticmethod
+    def collapsed(counts) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+
+
+class RouteProfiler:
+    """cProfile one request in every K per route, accumulated per route."""
+
+    def __init__(self):
+        self.every = {}                       # route rule -> K
+        self._seen = collections.Counter()
+        self._profiled = collections.Counter()
+        self._stats = {}                      # route rule -> pstats.Stats
+        self._busy = threading.Lock()         # one traced request per process
+        self._lock = threading.Lock()
+
+    def configure(self, rule, every):
+        """Profile every `every`-th request of `rule` (0 switches it off).
+
+        Switching a route on starts its statistics afresh.
+        """
+        with self._lock:
+            if every:
+                self.every[rule] = every
+                self._seen.pop(rule, None)
+                self._profiled.pop(rule, None)
+                self._stats.pop(rule, None)
+            else:
+                self.every.pop(rule, None)
+
+    def start(self, rule):
+        """A running profiler if this request is sampled, else None."""
+        k = self.every.get(rule)
+        if not k:
+            return None
+        with self._lock:
+            self._seen[rule] += 1
+            if self._seen[rule] % k:
+                return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        prof = cProfile.Profile()
+        prof.enable()
+        return prof
+
+    def stop(self, rule, prof):
+        prof.disable()
+        self._busy.release()
+        with self._lock:
+            if rule in self._stats:
+                self._stats[rule].add(prof)
+            else:
+                self._stats[rule] = pstats.Stats(prof)
+            self._profiled[rule] += 1
+
+    def status(self):
+        with self._lock:
+            rules = set(self.every) | set(self._stats)
+            return {
+                rule: {"every": self.every.get(rule, 0), "seen": self._seen[rule], "profiled": self._profiled[rule]}
+                for rule in sorted(rules)
+            }
+
+    def report(self, rule, sort="cumulative", limit=40):
+        """pstats text for `rule`, or None if nothing was profiled yet."""
+        with self._lock:
+            stats = self._stats.get(rule)
+            if stats is None:
+                return None
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats(sort).print_stats(limit)
+            stats.stream = sys.stdout
+        return out.getvalue()
@@ -0,0 +1,222 @@
+"""
+Replay a traffic recording (RECORD_TRAFFIC, see app.py) against a server.
+
+    python replay.py traffic.jsonl --url http://127.0.0.1:8000
+    python replay.py traffic.jsonl --url http://127.0.0.1:8000 --speed 4
+
+Every recorded session is created again through /admin/bulk_create with
+its group size and number of rounds; recorded participants get the new
+codes in the order they joined. Each participant (and the admin) is one
+client with its own cookies that sends its requests in recorded order, at
+the recorded offsets divided by --speed. Requests without a participant
+(join page, assets before joining) run on one anonymous client.
+
+Admin writes (login, create, reset, archive, delete) are not replayed; the
+admin polls are. Query parameter participant_id is dropped, the new ids are
+not known to the client.
+
+Prints, per route, the number of requests, errors and the replayed latency
+percentiles next to the recorded median.
+"""
+import argparse
+import collections
+import http.cookiejar
+import json
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ADMIN_WRITES = ("/admin_login", "/admin", "/admin/bulk_create", "/admin/reset_session",
+                "/admin/archive_session", "/admin/delete_session")
+
+
+def load(path):
+    events, sessions = [], {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            if "session" in rec:
+                sessions[rec["session"]] = rec
+            else:
+                events.append(rec)
+    events.sort(key=lambda e: e["t"])
+    return events, sessions
+
+
+class Client:
+    """One browser, with its own cookie jar."""
+
+    def __init__(self, base):
+        self.base = base.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            _NoRedirect(),
+        )
+
+    def send(self, method, path, form=None, body=None):
+        data, headers = None, {}
+        if body is not None:
+            data, headers["Content-Type"] = json.dumps(body).encode(), "application/json"
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        req = urllib.request.Request(self.base + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=30) as r:
+                payload = r.read()
+                return r.status, payload
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # A browser would follow, but the follow-up request is recorded on its own.
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def create_sessions(admin, events, sessions):
+    """New session id and codes for every recorded session alias."""
+    members = collections.defaultdict(list)   # session alias -> participant aliases, join order
+    rounds = collections.defaultdict(int)
+    for e in events:
+        if e["r"] == "/join" and e["m"] == "POST" and e.get("s") and e.get("p"):
+            if e["p"] not in members[e["s"]]:
+                members[e["s"]].append(e["p"])
+        if e.get("s") and (e.get("q") or {}).get("round"):
+            rounds[e["s"]] = max(rounds[e["s"]], int(e["q"]["round"]))
+    mapping, codes = {}, {}
+    for alias, joined in members.items():
+        meta = sessions.get(alias, {})
+        spec = {
+            "count": 1,
+            "name": "replay " + alias,
+            "group_size": meta.get("group_size") or len(joined),
+            "rounds": meta.get("rounds") or max(rounds[alias], 1),
+        }
+        status, payload = admin.send("POST", "/admin/bulk_create", body=spec)
+        if status != 200:
+            sys.exit(f"bulk_create for {alias} failed: {status} {payload[:200]!r}")
+        created = json.loads(payload)["sessions"][0]
+        mapping[alias] = created["id"]
+        for p, code in zip(joined, created["codes"]):
+            codes[p] = code
+    return mapping, codes
+
+
+_RULE_ARG = re.compile(r"<(?:[^:<>]+:)?(\w+)>")
+
+
+def build_request(e, mapping, codes):
+    """(method, path, form, json body) of a recorded event on the new server, or None."""
+    args = dict(e.get("a") or {})
+    if "session_id" in args:
+        if args["session_id"] not in mapping:
+            return None
+        args["session_id"] = mapping[args["session_id"]]
+    path = _RULE_ARG.sub(lambda m: urllib.parse.quote(str(args.get(m.group(1), ""))), e["r"])
+    query = {}
+    for k, v in (e.get("q") or {}).items():
+        if k == "session_id":
+            if v not in mapping:
+                return None
+            query[k] = mapping[v]
+        elif k != "participant_id":
+            query[k] = v
+    if query:
+        path += "?" + urllib.parse.urlencode(query)
+    form = None
+    if e["r"] == "/join" and e["m"] == "POST":
+        if e.get("p") not in codes:
+            return None
+        form = {"code": codes[e["p"]]}
+    return e["m"], path, form, e.get("b")
+
+
+def run_actor(client, items, start, speed, mapping, codes, results, lock):
+    for e in items:
+        req = build_request(e, mapping, codes)
+        if req is None:
+            continue
+        delay = start + e["offset"] / speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        t = time.perf_counter()
+        try:
+            status, _ = client.send(*req)
+        except OSError:
+            status = 0
+        ms = (time.perf_counter() - t) * 1000
+        with lock:
+            results[e["r"]].append((status, ms, e.get("ms")))
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a RECORD_TRAFFIC log against a server.")
+    parser.add_argument("log")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression factor")
+    parser.add_argument("--admin-password", default=os.environ.get("ADMIN_PASSWORD"))
+    args = parser.parse_args()
+    if not args.admin_password:
+        sys.exit("--admin-password or ADMIN_PASSWORD is required to recreate the sessions")
+
+    events, sessions = load(args.log)
+    if not events:
+        sys.exit("empty recording")
+    admin = Client(args.url)
+    admin.send("POST", "/admin_login", form={"password": args.admin_password})
+    mapping, codes = create_sessions(admin, events, sessions)
+
+    first = events[0]["t"]
+    actors = collections.defaultdict(list)
+    for e in events:
+        if e.get("adm") and not e.get("p"):
+            if (e["m"] == "POST" and e["r"] in ADMIN_WRITES) or e["r"] == "/admin_login":
+                continue
+            key = "admin"
+        else:
+            key = e.get("p") or "anonymous"
+        actors[key].append({**e, "offset": e["t"] - first})
+
+    results, lock = collections.defaultdict(list), threading.Lock()
+    start = time.monotonic() + 0.5
+    threads = [
+        threading.Thread(target=run_actor, daemon=True, args=(
+            admin if key == "admin" else Client(args.url), items, start, args.speed,
+            mapping, codes, results, lock))
+        for key, items in actors.items()
+    ]
+    print(f"replaying {len(events)} requests of {len(actors)} clients in {len(mapping)} sessions "
+          f"at {args.speed:g}x ({(events[-1]['t'] - first) / args.speed:.1f} s)")
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(f"{'route':<32} {'n':>6} {'err':>5} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'rec p50':>8}")
+    for route in sorted(results):
+        rows = results[route]
+        ms = [r[1] for r in rows]
+        recorded = [r[2] for r in rows if r[2] is not None]
+        errors = sum(1 for r in rows if r[0] == 0 or r[0] >= 500)
+        print(f"{route:<32} {len(rows):>6} {errors:>5} {pct(ms, 0.5):>8.1f} {pct(ms, 0.95):>8.1f} "
+              f"{max(ms):>8.1f} {statistics.median(recorded) if recorded else 0:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Pre-fork launcher: several waitress worker processes share one listening
+socket, so JSON encoding, Jinja rendering and MySQL protocol parsing spread
+across CPU cores instead of one GIL.
+
+    WORKERS=4 THREADS=16 PORT=8000 python serve_multi.py
+
+Each worker has its own connection pool (DB_POOL_SIZE) and phase scheduler.
+In-memory state is kept in sync through the coordination hub that this
+process runs on a unix socket (see coordination.py). Dead workers are
+restarted; SIGTERM/SIGINT stop all of them.
+
+With SESSION_AFFINITY=1 each worker listens on its own loopback port
+(PORT+1 ... PORT+WORKERS) and this process serves PORT with the dispatcher
+from dispatcher.py, which pins every game session to one worker.
+"""
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+os.chdir(APP_DIR)
+sys.path.insert(0, APP_DIR)
+
+os.environ.setdefault("THREADS", "16")
+os.environ.setdefault(
+    "COORD_SOCKET", os.path.join(tempfile.gettempdir(), f"vgame-coord-{os.getpid()}.sock")
+)
+
+import coordination
+from app import app, init_db, phase_scheduler, session_janitor, engines, bus, GAME_ENGINE, SESSION_AFFINITY
+from dispatcher import Dispatcher
+from waitress import serve
+
+
+def run_worker(sock, threads):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    bus.start()
+    phase_scheduler.start()
+    session_janitor.start()
+    engines.start()
+    serve(app, sockets=[sock], threads=threads)
+    os._exit(0)
+
+
+def listen(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    return sock
+
+
+def main():
+    host = os.environ.get("HOST", "127.0.0.1")
+    port = int(os.environ.get("PORT", "8000"))
+    workers = int(os.environ.get("WORKERS", str(os.cpu_count() or 2)))
+    threads = int(os.environ["THREADS"])
+    coord_path = os.environ["COORD_SOCKET"]
+
+    if GAME_ENGINE and not SESSION_AFFINITY and workers > 1:
+        # Every worker would load the same session into its own engine.
+        sys.exit("GAME_ENGINE=1 with several workers needs SESSION_AFFINITY=1")
+
+    init_db()
+    hub = coordination.run_hub(coord_path)
+
+    if SESSION_AFFINITY:
+        # One loopback socket per worker slot; a respawned worker reuses its slot.
+        socks = [listen("127.0.0.1", port + 1 + i) for i in range(workers)]
+    else:
+        socks = [listen(host, port)] * workers
+
+    children = {}   # pid -> worker slot
+    stopping = False
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(socks[slot], threads)
+        children[pid] = slot
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def supervise():
+        while children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            slot = children.pop(pid, None)
+            if not stopping and slot is not None:
+                time.sleep(0.5)
+                spawn(slot)
+        hub.shutdown()
+        if os.path.exists(coord_path):
+            os.unlink(coord_path)
+
+    for slot in range(workers):
+        spawn(slot)
+    print(f"serving on http://{host}:{port} with {workers} workers x {threads} threads"
+          + (" (session affinity)" if SESSION_AFFINITY else ""), flush=True)
+
+    if SESSION_AFFINITY:
+        def stop_all(signum, frame):
+            stop(signum, frame)
+            os._exit(0)
+        signal.signal(signal.SIGTERM, stop_all)
+        threading.Thread(target=supervise, name="supervisor", daemon=True).start()
+        nodes = [("127.0.0.1", port + 1 + i) for i in range(workers)]
+        serve(Dispatcher(nodes), host=host, port=port, threads=threads)
+        stop_all(None, None)
+    else:
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        supervise()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,13 @@ APP_DIR = os.path.dirname(os.path.abspath(__file__))
 os.chdir(APP_DIR)
 sys.path.insert(0, APP_DIR)
 
-from app import app, init_db
+from app import app, init_db, phase_scheduler, session_janitor, engines
 from waitress import serve
 
 init_db()
+phase_scheduler.start()
+session_janitor.start()
+engines.start()
 
 port = int(os.environ.get("PORT", "8000"))
 threads = int(os.environ.get("THREADS", "48"))
@@ -0,0 +1,32 @@
+// Admin overview (templates/admin.html): reload when the session lists change,
+// update the progress of running resets/deletes in place.
+
+(function () {
+  const initialState = JSON.parse(document.getElementById("session-lists").dataset.state);
+
+  function arraysEqual(a, b) {
+    if (a.length !== b.length) return false;
+    for (let i = 0; i < a.length; i++) {
+      if (a[i] !== b[i]) return false;
+    }
+    return true;
+  }
+
+  async function checkForChanges() {
+    const data = await pollJSON("/admin/sessions_overview");
+    const closing = data.closing || [];
+    if (!arraysEqual(data.active, initialState.active) ||
+        !arraysEqual(data.done, initialState.done) ||
+        !arraysEqual(data.archived, initialState.archived) ||
+        !arraysEqual(closing.map(c => c.id), initialState.closing)) {
+      location.reload();
+    }
+    closing.forEach(c => {
+      const cell = document.querySelector(`[data-progress="${c.id}"]`);
+      if (cell) cell.textContent = `${c.done} / ${c.total} Zeilen`;
+    });
+    return data;
+  }
+
+  startPolling(checkForChanges, {interval: 3000});
+})();
@@ -0,0 +1,38 @@
+// Live participant table of the admin session view (templates/admin_session.html).
+
+(function () {
+  const page = document.getElementById("session-page");
+  const sid = page.dataset.session;
+  const rowsTbody = document.getElementById("rows");
+  const decidedCountSpan = document.getElementById("decided_count");
+  const readyCountSpan = document.getElementById("ready_count");
+  const roundDisp = document.getElementById("round_disp");
+
+  async function poll() {
+    const url = page.dataset.statusUrl + "?session_id=" + encodeURIComponent(sid);
+    const data = await pollJSON(url);
+
+    decidedCountSpan.textContent = data.decided_count ?? 0;
+    readyCountSpan.textContent = data.ready_count ?? 0;
+    roundDisp.textContent = data.session?.current_round ?? page.dataset.round;
+
+    rowsTbody.innerHTML = "";
+    (data.participants || []).forEach((p, idx) => {
+      const tr = document.createElement("tr");
+      tr.innerHTML = `
+        <td>${idx+1}</td>
+        <td>${p.code}</td>
+        <td>${p.round_display}</td>
+        <td>${p.decided ? "✓" : "–"}</td>
+        <td>${p.choice ?? "–"}</td>
+        <td class="${p.ready_for_next ? "ready-yes" : ""}">${p.ready_for_next ? "✓" : "–"}</td>
+        <td>${p.balance == null ? "" : Number(p.balance).toFixed(2)}</td>
+      `;
+      rowsTbody.appendChild(tr);
+    });
+
+    return data;
+  }
+
+  startPolling(poll, {interval: 1000});
+})();
@@ -0,0 +1,18 @@
+// Join page (templates/join.html): the code field unlocks once consent is given.
+
+(function () {
+  const checkbox = document.getElementById("accept-checkbox");
+  const codeSection = document.getElementById("code-section");
+  const codeInput = document.getElementById("code-input");
+
+  checkbox.addEventListener("change", function () {
+    if (this.checked) {
+      codeSection.style.opacity = "1";
+      codeSection.style.pointerEvents = "auto";
+      codeInput.focus();
+    } else {
+      codeSection.style.opacity = "0.4";
+      codeSection.style.pointerEvents = "none";
+    }
+  });
+})();
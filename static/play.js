@@ -0,0 +1,178 @@
+// Single-page participant client for /play.
+//
+// The page is rendered once per session. Every phase (lobby, round, wait,
+// reveal, done) is a <section data-phase> that is shown or hidden from the
+// /state feed; choices and ready confirmations are plain JSON POSTs followed
+// by an immediate re-poll. Polling itself is paced by poll.js.
+
+(function () {
+  const root = document.getElementById("play");
+  const sid = root.dataset.session;
+  const me = Number(root.dataset.player) || null;
+  let resultsRound = 0;     // round whose result table is already rendered
+  let poller = null;
+  let current = null;
+
+  function fields(name) {
+    return root.querySelectorAll(`[data-field="${name}"]`);
+  }
+
+  function setText(name, value) {
+    fields(name).forEach(el => { el.textContent = value; });
+  }
+
+  function fmt(x) { return Number(x || 0).toFixed(0); }
+
+  // 503 + Retry-After: the write journal is backed up. The write may still
+  // land, but /choose and /confirm_ready are idempotent, so send it again.
+  async function post(url, init) {
+    for (let attempt = 0; ; attempt++) {
+      const r = await fetch(url, Object.assign({method: "POST"}, init));
+      if (r.status !== 503 || attempt >= 5) return r;
+      const ms = (Number(r.headers.get("Retry-After")) || 1) * 1000;
+      await new Promise(done => setTimeout(done, ms * (0.8 + Math.random() * 0.4)));
+    }
+  }
+
+  function show(state) {
+    if (state === current) return;
+    current = state;
+    root.querySelectorAll("[data-phase]").forEach(el => {
+      el.hidden = el.dataset.phase !== state;
+    });
+    root.querySelectorAll("[data-choice]").forEach(b => { b.disabled = false; });
+  }
+
+  function renderResults(players) {
+    const tbody = fields("results")[0];
+    tbody.innerHTML = "";
+    let a = 0, b = 0;
+    players.forEach(p => {
+      if (p.choice === "A") a += 1;
+      if (p.choice === "B") b += 1;
+      const tr = document.createElement("tr");
+      if (me && p.player_no === me) tr.className = "me";
+      tr.innerHTML = `
+        <td>Spieler ${p.player_no || "?"}</td>
+        <td class="mono">${p.choice || "-"}</td>
+        <td class="mono">${fmt(p.cost)}</td>
+        <td class="mono">${fmt(p.payout)}</td>`;
+      tbody.appendChild(tr);
+    });
+    setText("a_count", a);
+    setText("b_count", b);
+  }
+
+  function renderReady(d) {
+    setText("ready_count", d.ready_count);
+    const box = fields("ready_players")[0];
+    box.innerHTML = "";
+    (d.players || []).forEach(p => {
+      const span = document.createElement("span");
+      span.style.cssText = `
+        padding: 4px 10px;
+        border-radius: 6px;
+        font-size: 0.9rem;
+        background: ${p.ready ? "#166534" : "#1e2b43"};
+        color: ${p.ready ? "#4ade80" : "#aab7d4"};
+        border: 1px solid ${p.ready ? "#22c55e" : "#2d3f5f"};
+      `;
+      span.textContent = `Spieler ${p.player_no}: ${p.ready ? "✓" : "…"}`;
+      box.appendChild(span);
+    });
+    root.querySelector('[data-action="ready"]').hidden = !!d.me_ready;
+    fields("already_ready")[0].hidden = !d.me_ready;
+    root.querySelectorAll("[data-last]").forEach(el => {
+      el.hidden = el.dataset.last !== (d.is_last_round ? "1" : "0");
+    });
+  }
+
+  const render = {
+    lobby(d) {
+      setText("joined", d.joined);
+    },
+    round(d) {
+      setText("round", d.round);
+      setText("decided", d.decided ?? 0);
+      setText("decided_players", (d.decided_players && d.decided_players.length)
+        ? d.decided_players.join(", ") : "–");
+    },
+    wait(d) {
+      setText("round", d.round);
+      setText("decided", d.decided ?? 0);
+    },
+    reveal(d) {
+      setText("round", d.round);
+      if (d.results) {
+        renderResults(d.results);
+        resultsRound = d.round;
+      }
+      renderReady(d);
+    },
+  };
+
+  async function finish() {
+    poller.stop();
+    const r = await fetch("/done", {method: "POST"});
+    const d = r.ok ? await r.json() : {};
+    setText("code", d.code || "–");
+    setText("balance", d.balance == null ? "–" : Number(d.balance).toFixed(2));
+    show("done");
+    setTimeout(() => { window.location.href = "/join"; }, 10000);
+  }
+
+  async function tick() {
+    const d = await pollJSON(`/state?session_id=${encodeURIComponent(sid)}&results=${resultsRound}`);
+    if (d.reset || d.state === "join") {
+      window.location.href = "/join";
+      return d;
+    }
+    if (d.state === "done") {
+      finish();
+      return d;
+    }
+    show(d.state);
+    render[d.state](d);
+    return d;
+  }
+
+  function refresh() {
+    if (poller) poller.stop();
+    poller = startPolling(tick);
+  }
+
+  root.querySelectorAll("[data-choice]").forEach(btn => {
+    btn.onclick = async () => {
+      root.querySelectorAll("[data-choice]").forEach(b => { b.disabled = true; });
+      try {
+        const r = await post("/choose", {
+          headers: {"Content-Type": "application/json"},
+          body: JSON.stringify({choice: btn.dataset.choice}),
+        });
+        if (r.ok || r.status === 409) {
+          show("wait");
+          refresh();
+          return;
+        }
+        alert("Senden fehlgeschlagen.");
+      } catch (e) {
+        alert("Netzwerkfehler.");
+      }
+      root.querySelectorAll("[data-choice]").forEach(b => { b.disabled = false; });
+    };
+  });
+
+  root.querySelector('[data-action="ready"]').onclick = async (ev) => {
+    const btn = ev.currentTarget;
+    btn.disabled = true;
+    const r = await post("/confirm_ready");
+    btn.disabled = false;
+    if (r.ok) {
+      btn.hidden = true;
+      fields("already_ready")[0].hidden = false;
+      refresh();
+    }
+  };
+
+  refresh();
+})();
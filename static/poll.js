@@ -0,0 +1,65 @@
+// Adaptive status polling.
+//
+// The status endpoints return a `retry_after_ms` hint (phase, time to the
+// next deadline, server load). startPolling() follows that hint, adds
+// +-20% jitter so a group does not poll in lockstep after a phase change,
+// and backs off exponentially while requests fail.
+//
+// Long-poll: the ASGI server (asgi.py) tags status answers with an ETag.
+// Once a URL has one, the next poll asks with ?wait=1 and If-None-Match,
+// the server holds it until the answer changes, and the poll after it goes
+// out right away. Servers without the ETag never see either.
+
+const pollETags = new Map();      // url -> ETag of its last answer
+const longPolled = new WeakSet();  // answers that came back from a held request
+
+async function pollJSON(url) {
+  const etag = pollETags.get(url);
+  const headers = etag ? {"If-None-Match": etag} : {};
+  const target = etag ? url + (url.includes("?") ? "&" : "?") + "wait=1" : url;
+  const r = await fetch(target, {cache: "no-store", headers});
+  if (!r.ok) {
+    pollETags.delete(url);
+    const err = new Error("poll failed: " + r.status);
+    const ra = r.headers.get("Retry-After");
+    if (ra) err.retryAfterMs = Number(ra) * 1000;
+    throw err;
+  }
+  const next = r.headers.get("ETag");
+  if (next) pollETags.set(url, next);
+  else pollETags.delete(url);
+  const data = await r.json();
+  if (etag && data && typeof data === "object") longPolled.add(data);
+  return data;
+}
+
+function startPolling(tick, opts) {
+  opts = opts || {};
+  const fallback = opts.interval || 2000;
+  const minMs = opts.minMs || 250;
+  const maxMs = opts.maxMs || 30000;
+  let failures = 0;
+  let timer = null;
+  let stopped = false;
+
+  async function run() {
+    if (stopped) return;
+    let delay;
+    try {
+      const data = await tick();
+      failures = 0;
+      delay = longPolled.has(data) ? minMs : (data && data.retry_after_ms) || fallback;
+    } catch (e) {
+      failures += 1;
+      delay = Math.max(e.retryAfterMs || 0, fallback * Math.pow(2, failures));
+    }
+    if (stopped) return;
+    delay = Math.min(maxMs, Math.max(minMs, delay * (0.8 + Math.random() * 0.4)));
+    timer = setTimeout(run, delay);
+  }
+
+  run();
+  return {
+    stop() { stopped = true; clearTimeout(timer); },
+  };
+}
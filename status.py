@@ -0,0 +1,239 @@
+"""
+Queries and payloads of the participant and admin status polls (/state,
+lobby_status, round_status, ready_status, admin/session_status), shared by
+the Flask views (app.py) and the asyncio handlers (asgi.py).
+
+Each builder is a generator that yields the queries it needs as
+(method, sql, args) with method "fetchone", "fetchall" or "rows", gets each
+result sent back and returns the payload. run() drives one on a
+synchronous connection, run_async() on an async database with the same
+three methods (asgi.AioMySQLDB, asgi.ThreadedDB). So there is one copy of
+the SQL and the payload shapes for both servers.
+
+A round that has all its decisions but no round_phases row yet is settled
+by the journal; the caller has to queue that (app.py does, asgi.py hands
+the request to the Flask view). The builders return Unsettled(sid, r) for
+it unless `defer_unsettled` is False, in which case the round is shown
+without a watch deadline.
+"""
+import storage
+
+
+class Unsettled:
+    """Builder result: round `r` of session `sid` is complete but not settled."""
+
+    __slots__ = ("sid", "r")
+
+    def __init__(self, sid, r):
+        self.sid = sid
+        self.r = r
+
+
+QUERIES = {
+    "fetchone": lambda con, sql, args: con.execute(sql, args).fetchone(),
+    "fetchall": lambda con, sql, args: con.execute(sql, args).fetchall(),
+    "rows": lambda con, sql, args: con.rows(sql, args),
+}
+
+
+def run(con, builder):
+    """Run `builder` on the synchronous connection `con`; its payload."""
+    try:
+        step = next(builder)
+        while True:
+            method, sql, args = step
+            step = builder.send(QUERIES[method](con, sql, args))
+    except StopIteration as done:
+        return done.value
+
+
+async def run_async(db, builder):
+    """Run `builder` on an async database (fetchone/fetchall/rows coroutines); its payload."""
+    try:
+        step = next(builder)
+        while True:
+            method, sql, args = step
+            step = builder.send(await getattr(db, method)(sql, args))
+    except StopIteration as done:
+        return done.value
+
+
+class StatusQueries:
+    """The status payloads of sessions kept in the database.
+
+    `retry_after_ms(kind)` supplies the poll interval hint of each payload.
+    Subclasses may answer state/lobby/round/ready from elsewhere (app.py's
+    engine sessions); feed() composes whatever they return.
+    """
+
+    def __init__(self, retry_after_ms):
+        self.retry_after_ms = retry_after_ms
+
+    def reset_for(self, pid):
+        """True if `pid` was un-joined by a reset since it last looked."""
+        if not pid:
+            return False
+        p = yield "fetchone", "SELECT joined FROM participants WHERE id=%s", (pid,)
+        return bool(p) and not p["joined"]
+
+    def state(self, p, s):
+        """Phase of participant row `p` in session row `s` (lobby, round, wait, reveal, done)."""
+        if s["archived"]:
+            return "done"
+        sid, r = s["id"], p["current_round"]
+        joined = (yield "fetchone",
+                  "SELECT COUNT(*) c FROM participants WHERE session_id=%s AND joined=1", (sid,))["c"]
+        if joined < s["group_size"]:
+            return "lobby"
+        if r > 1:
+            all_ready = (yield "fetchone",
+                         "SELECT COUNT(*) c FROM participants WHERE session_id=%s AND ready_for_next=1",
+                         (sid,))["c"] >= s["group_size"]
+            if r > s["rounds"]:
+                return "done" if all_ready else "reveal"
+            if not all_ready:
+                return "reveal"
+        if not (yield "fetchone",
+                "SELECT 1 FROM decisions WHERE participant_id=%s AND round_number=%s", (p["id"], r)):
+            return "round"
+        if not (yield "fetchone",
+                "SELECT watch_ends_at FROM round_phases WHERE session_id=%s AND round_number=%s", (sid, r)):
+            return "wait"
+        return "reveal"
+
+    def lobby(self, sid, pid):
+        s = yield "fetchone", "SELECT id, group_size FROM sessions WHERE id=%s", (sid,)
+        if not s:
+            return None
+        joined = (yield "fetchone",
+                  "SELECT COUNT(*) c FROM participants WHERE session_id=%s AND joined=1", (sid,))["c"]
+        return {
+            "joined": joined,
+            "group_size": s["group_size"],
+            "ready": joined >= s["group_size"],
+            "reset": (yield from self.reset_for(pid)),
+            "retry_after_ms": self.retry_after_ms("lobby"),
+        }
+
+    def round(self, sid, r, pid, defer_unsettled=True):
+        s = yield "fetchone", "SELECT id, group_size FROM sessions WHERE id=%s", (sid,)
+        if not s:
+            return None
+        if (yield from self.reset_for(pid)):
+            return {"reset": True}
+
+        decided = (yield "fetchone",
+                   "SELECT COUNT(*) c FROM decisions WHERE session_id=%s AND round_number=%s", (sid, r))["c"]
+        ready = decided >= s["group_size"]
+        players, watch_ends_at = [], None
+        if ready:
+            rp = yield ("fetchone",
+                        "SELECT watch_ends_at FROM round_phases WHERE session_id=%s AND round_number=%s", (sid, r))
+            if not rp and defer_unsettled:
+                return Unsettled(sid, r)
+            watch_ends_at = rp["watch_ends_at"] if rp else None
+            players = [{
+                "player_no": player_no,
+                "choice": choice,
+                "cost": storage.money(cost),
+                "payout": storage.money(payout),
+            } for player_no, choice, cost, payout in (yield "rows", f"""
+                 SELECT p.join_number, d.choice, {storage.cents_sql("d.total_cost")}, {storage.cents_sql("d.payout")}
+                 FROM decisions d JOIN participants p ON p.id=d.participant_id
+                 WHERE d.session_id=%s AND d.round_number=%s ORDER BY p.join_number
+            """, (sid, r))]
+
+        decided_players = [row["join_number"] for row in (yield "fetchall",
+            "SELECT p.join_number FROM decisions d JOIN participants p ON p.id=d.participant_id "
+            "WHERE d.session_id=%s AND d.round_number=%s ORDER BY p.join_number",
+            (sid, r))]
+        return {
+            "decided": decided,
+            "ready": ready,
+            "decided_players": decided_players,
+            "watch_ends_at": watch_ends_at,
+            "players": players,
+            "retry_after_ms": self.retry_after_ms("round"),
+        }
+
+    def ready(self, sid, pid, me):
+        """Who is ready for the next round; `me` is the caller's participant id."""
+        s = yield "fetchone", "SELECT id, group_size FROM sessions WHERE id=%s", (sid,)
+        if not s:
+            return None
+        if (yield from self.reset_for(pid)):
+            return {"reset": True}
+        rows = yield ("fetchall",
+                      "SELECT p.id, p.join_number, p.ready_for_next FROM participants p "
+                      "WHERE p.session_id=%s ORDER BY p.join_number", (sid,))
+        ready_count = sum(1 for row in rows if row["ready_for_next"])
+        return {
+            "ready_count": ready_count,
+            "group_size": s["group_size"],
+            "all_ready": ready_count >= s["group_size"],
+            "me_ready": any(bool(row["ready_for_next"]) for row in rows if me and row["id"] == me),
+            "players": [{"player_no": row["join_number"], "ready": bool(row["ready_for_next"])} for row in rows],
+            "retry_after_ms": self.retry_after_ms("ready"),
+        }
+
+    def feed(self, p, results_seen=None, defer_unsettled=True):
+        """The /state payload of participant row `p` (id, session_id, current_round).
+
+        `results_seen` is the round whose result table the client already has.
+        """
+        if not p:
+            return {"state": "join"}
+        sid = p["session_id"]
+        s = yield "fetchone", "SELECT id, group_size, rounds, archived FROM sessions WHERE id=%s", (sid,)
+        if not s:
+            return {"state": "join"}
+        state = yield from self.state(p, s)
+        r = p["current_round"]
+        payload = {"state": state, "rounds": s["rounds"]}
+        if state == "lobby":
+            payload.update((yield from self.lobby(sid, p["id"])))
+        elif state in ("round", "wait"):
+            part = yield from self.round(sid, r, p["id"], defer_unsettled)
+            if isinstance(part, Unsettled):
+                return part
+            payload.update(part, round=r)
+        elif state == "reveal":
+            r -= 1
+            payload.update((yield from self.ready(sid, p["id"], p["id"])), round=r, is_last_round=r >= s["rounds"])
+            if results_seen != str(r) and not payload.get("reset"):
+                results = yield from self.round(sid, r, None, defer_unsettled)
+                if isinstance(results, Unsettled):
+                    return results
+                payload["results"] = results["players"]
+        return payload
+
+    def admin_session(self, sid):
+        """Per-participant progress of the session's current round for the admin page."""
+        srow = yield "fetchone", "SELECT id, rounds FROM sessions WHERE id=%s", (sid,)
+        if not srow:
+            return {"participants": [], "decided_count": 0, "session": None}
+        r = (yield "fetchone",
+             "SELECT MIN(current_round) AS r FROM participants WHERE session_id=%s", (sid,))["r"] or 1
+        rows = yield "rows", f"""SELECT p.id, p.code, p.join_number, {storage.cents_sql("p.balance")}, p.current_round,
+                       p.ready_for_next, d.id, d.choice
+                FROM participants p
+                LEFT JOIN decisions d ON d.participant_id=p.id AND d.round_number=%s
+                WHERE p.session_id=%s ORDER BY p.join_number, p.code""", (r, sid)
+        rounds = srow["rounds"]
+        participants = [{
+            "id": pid,
+            "code": code,
+            "player_no": player_no,
+            "balance": storage.money(balance),
+            "round_display": min(current_round, rounds),
+            "decided": decision_id is not None,
+            "choice": choice,
+            "ready_for_next": bool(ready),
+        } for pid, code, player_no, balance, current_round, ready, decision_id, choice in rows]
+        return {
+            "participants": participants,
+            "decided_count": sum(1 for x in participants if x["decided"]),
+            "ready_count": sum(1 for x in participants if x["ready_for_next"]),
+            "session": {"id": srow["id"], "current_round": min(r, rounds)},
+            "retry_after_ms": self.retry_after_ms("admin"),
+        }
@@ -0,0 +1,390 @@
+"""
+Storage backends behind app.db().
+
+MySQLBackend talks to the production server through PyMySQL. SQLiteBackend
+runs the same app on a local file, for small labs without a database
+server, for demos and for benchmarks. It uses a WAL journal, busy_timeout,
+synchronous=NORMAL and one connection per thread.
+
+Application SQL is written in the MySQL dialect. Connection and Cursor wrap
+the driver objects and give both backends the same interface:
+con.execute(...).fetchone(), dict rows, rowcount and iteration. For SQLite
+the statements are translated here and only here (SQLiteDialect). Idioms
+with no textual translation have helpers: Connection.columns() replaces
+SHOW COLUMNS, and Cursor.bump() replaces LAST_INSERT_ID() counters.
+
+Hot read paths can skip the dict rows: Connection.rows() returns plain
+tuples, and money columns selected through cents_sql() arrive as integer
+cents instead of Decimal objects (see cents() and money()).
+"""
+import functools
+import re
+import sqlite3
+import threading
+
+try:
+    import pymysql
+    from pymysql.cursors import DictCursor, SSDictCursor
+except ImportError:  # SQLite-only installs
+    pymysql = None
+
+IntegrityError = (sqlite3.IntegrityError,) + ((pymysql.IntegrityError,) if pymysql else ())
+OperationalError = (sqlite3.OperationalError,) + ((pymysql.OperationalError,) if pymysql else ())
+
+
+# -------------------- Dialects --------------------
+class MySQLDialect:
+    name = "mysql"
+
+    def translate(self, sql):
+        return [sql]
+
+    def bump_sql(self, table, keys, column):
+        cols = ",".join(keys)
+        marks = ",".join(["%s"] * len(keys))
+        return (
+            f"INSERT INTO {table} ({cols},{column}) VALUES ({marks},LAST_INSERT_ID(1)) "
+            f"ON DUPLICATE KEY UPDATE {column} = LAST_INSERT_ID({column} + 1)"
+        )
+
+
+class SQLiteDialect:
+    name = "sqlite"
+
+    _CREATE = re.compile(r"^\s*CREATE TABLE IF NOT EXISTS (\w+)\s*\((.*)\)\s*(?:ENGINE=.*)?$", re.S | re.I)
+    _INDEX = re.compile(r"^(?:INDEX|KEY)\s+(\w+)\s*(\(.*\))$", re.S | re.I)
+    _UNIQUE = re.compile(r"^UNIQUE\s+(?:KEY|INDEX)\s+\w+\s*(\(.*\))$", re.S | re.I)
+    _AUTO = re.compile(r"\b(?:BIG)?INT\s+PRIMARY KEY\s+AUTO_INCREMENT\b", re.I)
+    # SQLite is rarely built with UPDATE/DELETE ... LIMIT; a rowid subquery does the same
+    _DELETE_LIMIT = re.compile(r"^\s*DELETE FROM (\w+) WHERE (.*) LIMIT (\S+)\s*$", re.S | re.I)
+    _UPDATE_LIMIT = re.compile(r"^\s*UPDATE (\w+) SET (.*?) WHERE (.*) LIMIT (\S+)\s*$", re.S | re.I)
+
+    def translate(self, sql):
+        return self._translate(sql)
+
+    @functools.lru_cache(maxsize=1024)
+    def _translate(self, sql):
+        if self._CREATE.match(sql):
+            return self._create_table(sql)
+        if re.match(r"^\s*START TRANSACTION\b", sql, re.I):
+            return ["BEGIN IMMEDIATE"]
+        head, sep, tail = sql.partition("ON DUPLICATE KEY UPDATE")
+        if sep:
+            tail = re.sub(r"\bVALUES\((\w+)\)", r"excluded.\1", tail)
+            sql = head + "ON CONFLICT DO UPDATE SET" + tail
+        m = self._DELETE_LIMIT.match(sql)
+        if m:
+            table, cond, n = m.groups()
+            sql = f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {cond} LIMIT {n})"
+        m = self._UPDATE_LIMIT.match(sql)
+        if m:
+            table, assign, cond, n = m.groups()
+            sql = f"UPDATE {table} SET {assign} WHERE rowid IN (SELECT rowid FROM {table} WHERE {cond} LIMIT {n})"
+        sql = sql.replace("%s", "?")
+        sql = re.sub(r"\bINSERT IGNORE\b", "INSERT OR IGNORE", sql)
+        sql = re.sub(r"\s+(?:FOR UPDATE|LOCK IN SHARE MODE)\b", "", sql)
+        sql = re.sub(r"\bGREATEST\(", "MAX(", sql)
+        sql = re.sub(r"\bLEAST\(", "MIN(", sql)
+        sql = re.sub(r"\bAS SIGNED\)", "AS INTEGER)", sql)
+        return [sql]
+
+    def _create_table(self, sql):
+        m = self._CREATE.match(sql)
+        table, body = m.group(1), m.group(2)
+        parts, extra = [], []
+        for part in _split_top_level(body):
+            part = part.strip()
+            mu = self._UNIQUE.match(part)
+            mi = self._INDEX.match(part)
+            if mu:
+                parts.append(f"UNIQUE {mu.group(1)}")
+            elif mi:
+                # SQLite index names are global, not per table
+                extra.append(f"CREATE INDEX IF NOT EXISTS {table}_{mi.group(1)} ON {table} {mi.group(2)}")
+            else:
+                parts.append(self._AUTO.sub("INTEGER PRIMARY KEY AUTOINCREMENT", part))
+        create = f"CREATE TABLE IF NOT EXISTS {table} (\n    " + ",\n    ".join(parts) + "\n)"
+        return [create] + extra
+
+    def bump_sql(self, table, keys, column):
+        cols = ",".join(keys)
+        marks = ",".join(["?"] * len(keys))
+        return (
+            f"INSERT INTO {table} ({cols},{column}) VALUES ({marks},1) "
+            f"ON CONFLICT DO UPDATE SET {column} = {column} + 1 RETURNING {column}"
+        )
+
+
+def _split_top_level(body):
+    """Split a column list on commas outside parentheses."""
+    parts, depth, cur = [], 0, []
+    for ch in body:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append("".join(cur))
+            cur = []
+        else:
+            cur.append(ch)
+    if "".join(cur).strip():
+        parts.append("".join(cur))
+    return parts
+
+
+# -------------------- Money --------------------
+# Amounts are DECIMAL(10,2) columns. Hot paths carry them as integer cents:
+# no Decimal object per row, exact sums, and a plain JSON number at the end.
+def cents_sql(expr):
+    """SELECT expression yielding the money value `expr` as integer cents."""
+    return f"CAST(ROUND({expr} * 100) AS SIGNED)"
+
+
+def cents(x):
+    """Decimal, float, int or numeric string amount as integer cents."""
+    return None if x is None else int(round(float(x) * 100))
+
+
+def money(c):
+    """Integer cents as the number shown to clients (int when whole)."""
+    if c is None:
+        return None
+    return c // 100 if c % 100 == 0 else c / 100
+
+
+# -------------------- Wrappers --------------------
+class Cursor:
+    """Driver cursor with dict rows and dialect translation."""
+
+    def __init__(self, raw, con):
+        self._raw = raw
+        self._con = con
+
+    def execute(self, sql, args=None):
+        dialect = self._con.dialect
+        if dialect.name == "sqlite" and re.match(r"^\s*START TRANSACTION\b", sql, re.I):
+            # MySQL semantics: START TRANSACTION implicitly commits the open one.
+            self._con.raw.commit()
+        for stmt in dialect.translate(sql):
+            if args is None:
+                self._raw.execute(stmt)
+            else:
+                self._raw.execute(stmt, args)
+        return self
+
+    def executemany(self, sql, seq):
+        (stmt,) = self._con.dialect.translate(sql)
+        self._raw.executemany(stmt, seq)
+        return self
+
+    def bump(self, table, key, column) -> int:
+        """Atomically add 1 to a counter row (created at 1) and return the new value."""
+        self._raw.execute(self._con.dialect.bump_sql(table, list(key), column), tuple(key.values()))
+        if self._con.dialect.name == "mysql":
+            return self._raw.lastrowid
+        return self._raw.fetchone()[column]
+
+    def fetchone(self):
+        return self._raw.fetchone()
+
+    def fetchall(self):
+        return self._raw.fetchall()
+
+    def __iter__(self):
+        return iter(self._raw.fetchall())
+
+    @property
+    def rowcount(self):
+        return self._raw.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._raw.lastrowid
+
+    def close(self):
+        self._raw.close()
+
+
+class Connection:
+    """Backend-neutral connection used throughout app.py."""
+
+    def __init__(self, raw, dialect, backend):
+        self.raw = raw
+        self.dialect = dialect
+        self.backend = backend
+
+    def cursor(self):
+        return Cursor(self.raw.cursor(), self)
+
+    def execute(self, sql, args=None):
+        return self.cursor().execute(sql, args)
+
+    def columns(self, table):
+        """Column info as SHOW COLUMNS rows: Field, Type, Null, Default."""
+        cursor = self.raw.cursor()
+        try:
+            if self.dialect.name == "mysql":
+                cursor.execute(f"SHOW COLUMNS FROM {table}")
+                return list(cursor.fetchall())
+            cursor.execute(f"PRAGMA table_info({table})")
+            return [{
+                "Field": row["name"],
+                "Type": row["type"],
+                "Null": "NO" if row["notnull"] else "YES",
+                "Default": row["dflt_value"],
+            } for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    def tables(self):
+        """Names of all tables in the database."""
+        cursor = self.raw.cursor()
+        try:
+            if self.dialect.name == "mysql":
+                cursor.execute("SHOW TABLES")
+                return sorted(next(iter(row.values())) for row in cursor.fetchall())
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name")
+            return [row["name"] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    def begin_snapshot(self):
+        """Open a read-only transaction that sees one consistent point in time
+        and takes no locks writers would wait for."""
+        if self.dialect.name == "mysql":
+            self.raw.rollback()
+            cursor = self.raw.cursor()
+            cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+            cursor.close()
+        else:
+            # A deferred WAL read transaction pins its snapshot at the first read.
+            self.raw.rollback()
+            self.raw.execute("BEGIN DEFERRED")
+            self.raw.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+
+    def rows(self, sql, args=None):
+        """Result of a SELECT as a list of tuples in column order."""
+        (stmt,) = self.dialect.translate(sql)
+        if self.dialect.name == "mysql":
+            cursor = self.raw.cursor(pymysql.cursors.Cursor)
+        else:
+            cursor = self.raw.cursor()
+            cursor.row_factory = None
+        try:
+            if args is None:
+                cursor.execute(stmt)
+            else:
+                cursor.execute(stmt, args)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def stream(self, sql, args=None, size=1000):
+        """Yield the result of a SELECT in lists of up to `size` rows without
+        buffering the whole result set (server-side cursor on MySQL)."""
+        (stmt,) = self.dialect.translate(sql)
+        if self.dialect.name == "mysql":
+            cursor = self.raw.cursor(SSDictCursor)
+        else:
+            cursor = self.raw.cursor()
+        try:
+            if args is None:
+                cursor.execute(stmt)
+            else:
+                cursor.execute(stmt, args)
+            while True:
+                rows = cursor.fetchmany(size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def ping(self):
+        self.backend.ping(self)
+
+    def close(self):
+        self.backend.release(self)
+
+
+# -------------------- Backends --------------------
+class MySQLBackend:
+    name = "mysql"
+    pooled = True
+
+    def __init__(self, **params):
+        if pymysql is None:
+            raise RuntimeError("DB_BACKEND=mysql needs PyMySQL (pip install PyMySQL)")
+        self.params = params
+        self.dialect = MySQLDialect()
+
+    def connect(self):
+        raw = pymysql.connect(
+            cursorclass=DictCursor,
+            charset='utf8mb4',
+            autocommit=False,
+            connect_timeout=10,
+            read_timeout=30,
+            write_timeout=30,
+            **self.params
+        )
+        return Connection(raw, self.dialect, self)
+
+    def ping(self, con):
+        con.raw.ping(reconnect=True)
+
+    def release(self, con):
+        con.raw.close()
+
+    def after_fork(self):
+        pass
+
+
+def _dict_row(cursor, row):
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+
+class SQLiteBackend:
+    """One WAL-mode connection per thread on a local database file."""
+
+    name = "sqlite"
+    pooled = False
+
+    def __init__(self, path, busy_timeout_ms=5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.dialect = SQLiteDialect()
+        self._local = threading.local()
+
+    def connect(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            # IMMEDIATE: implicit transactions take the write lock up front and
+            # wait up to busy_timeout for it instead of failing on upgrade.
+            raw = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0,
+                                  isolation_level="IMMEDIATE")
+            raw.row_factory = _dict_row
+            raw.execute("PRAGMA journal_mode=WAL")
+            raw.execute("PRAGMA synchronous=NORMAL")
+            raw.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            raw.execute("PRAGMA temp_store=MEMORY")
+            con = self._local.con = Connection(raw, self.dialect, self)
+        return con
+
+    def ping(self, con):
+        pass
+
+    def release(self, con):
+        # The thread keeps its connection; just end any open transaction.
+        con.raw.rollback()
+
+    def after_fork(self):
+        self._local = threading.local()
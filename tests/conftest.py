@@ -0,0 +1,57 @@
+"""Test setup: the app on a throwaway SQLite database."""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="vg-tests-")
+os.environ.update(
+    DB_BACKEND="sqlite",
+    SQLITE_PATH=os.path.join(_tmp, "test.db"),
+    ENGINE_LOG_DIR=os.path.join(_tmp, "engine-log"),
+    ADMIN_PASSWORD="test",
+    SECRET_KEY="test",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app():
+    app_module.init_db()
+    app_module.phase_scheduler.start()
+    app_module.engines.start()
+    return app_module
+
+
+@pytest.fixture
+def admin(app):
+    client = app.app.test_client()
+    client.post("/admin_login", data={"password": "test"})
+    return client
+
+
+@pytest.fixture(params=["sql", "engine"])
+def mode(request, app, monkeypatch):
+    """Run the test against the SQL path and the in-memory engine."""
+    monkeypatch.setattr(app, "GAME_ENGINE", request.param == "engine")
+    return request.param
+
+
+@pytest.fixture
+def new_session(app, admin):
+    """new_session(group_size, rounds) -> (session id, joined player clients)."""
+    def make(group_size=2, rounds=2):
+        r = admin.post("/admin/bulk_create", json={
+            "count": 1, "group_size": group_size, "rounds": rounds, "name": "test"})
+        sess = r.get_json()["sessions"][0]
+        players = []
+        for code in sess["codes"]:
+            client = app.app.test_client()
+            assert client.post("/join", data={"code": code}).status_code == 302
+            players.append(client)
+        return sess["id"], players
+    return make
+
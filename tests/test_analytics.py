@@ -0,0 +1,48 @@
+import analytics
+
+
+def _play(app, sid, players, rounds):
+    for r in range(1, rounds + 1):
+        for i, p in enumerate(players):
+            assert p.post("/choose", json={"choice": "AB"[i % 2]}).status_code == 200
+        for p in players:
+            assert p.post("/confirm_ready").status_code == 200
+    assert app.engines.log.flush()
+
+
+def test_rounds_record_when_they_opened(app, mode, new_session):
+    sid, players = new_session(group_size=2, rounds=2)
+    _play(app, sid, players, rounds=2)
+    opened = dict(app.db().rows(
+        "SELECT round_number, opened_at FROM round_progress WHERE session_id=%s", (sid,)))
+    assert opened[1] and opened[2]
+    assert opened[2] >= opened[1]
+
+
+def test_decision_times_from_round_open(app, new_session):
+    sid, players = new_session(group_size=2, rounds=1)
+    _play(app, sid, players, rounds=1)
+    con = app._connect_db()
+    cursor = con.cursor()
+    decided = con.rows("SELECT id, created_at FROM decisions WHERE session_id=%s ORDER BY id", (sid,))
+    start = app.parse_iso_utc(decided[0][1])
+    # One decision 10 s after the round opened, one stamped before it (skew).
+    cursor.execute("UPDATE round_progress SET opened_at=%s WHERE session_id=%s AND round_number=1",
+                   (app.iso_utc(start - app.timedelta(seconds=10)), sid))
+    cursor.execute("UPDATE decisions SET created_at=%s WHERE id=%s",
+                   (app.iso_utc(start - app.timedelta(seconds=20)), decided[1][0]))
+    cursor.execute("UPDATE decisions SET created_at=%s WHERE id=%s", (app.iso_utc(start), decided[0][0]))
+    analytics.write_round_summary(cursor, sid, 1, decided[0][1])
+    con.commit()
+    row = analytics.round_summary(con, sid, 1)
+    assert row["decide_n"] == 1
+    assert row["decide_sum"] == 10.0 and row["decide_max"] == 10.0
+
+
+def test_aggregate_cache_is_bounded():
+    cache = analytics.AggregateCache(max_entries=2)
+    for since in ("a", "b", "a", "c"):
+        cache.get(("rounds", since), lambda: since)
+    assert len(cache) == 2
+    assert cache.get(("rounds", "a"), lambda: "recomputed") == "a"
+    assert cache.get(("rounds", "b"), lambda: "recomputed") == "recomputed"
@@ -0,0 +1,62 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+BACKUP_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backup_db.py")
+
+
+def _backup(app, backup_dir, *args, db=None):
+    env = dict(os.environ, BACKUP_DIR=str(backup_dir), SQLITE_PATH=db or app.SQLITE_PATH)
+    subprocess.run([sys.executable, BACKUP_DB, *args], env=env, check=True, capture_output=True)
+
+
+def _rows(path, table, sids, col="session_id"):
+    con = sqlite3.connect(path)
+    try:
+        marks = ",".join("?" * len(sids))
+        return sorted(con.execute(f"SELECT * FROM {table} WHERE {col} IN ({marks})", sids).fetchall(),
+                      key=repr)
+    finally:
+        con.close()
+
+
+def _wait_closed(app, sid):
+    for _ in range(200):
+        if sid not in app.closing_sessions:
+            return
+        time.sleep(0.02)
+    raise AssertionError(f"session {sid} still closing")
+
+
+def test_incremental_restores_updates_resets_and_deletes(app, mode, admin, new_session, tmp_path):
+    reset, players_reset = new_session(group_size=2)
+    deleted, players_deleted = new_session(group_size=2)
+    archived, _ = new_session(group_size=2)
+    for players in (players_reset, players_deleted):
+        for i, p in enumerate(players):
+            assert p.post("/choose", json={"choice": "AB"[i % 2]}).status_code == 200
+    assert app.engines.log.flush()
+    _backup(app, tmp_path / "backups", "snapshot")
+
+    # After the full snapshot: a reset, a delete and an update-only change
+    assert admin.post("/admin/reset_session", data={"session_id": reset}).status_code == 302
+    assert admin.post("/admin/delete_session", data={"session_id": deleted}).status_code == 302
+    _wait_closed(app, reset)
+    _wait_closed(app, deleted)
+    assert admin.post("/admin/archive_session", data={"session_id": archived}).status_code == 302
+    assert app.engines.log.flush()
+    _backup(app, tmp_path / "backups", "snapshot", "--since", "last")
+
+    snapshots = sorted(str(p) for p in (tmp_path / "backups").iterdir())
+    assert len(snapshots) == 2 and snapshots[1].endswith("_incr")
+    restored = str(tmp_path / "restored.db")
+    _backup(app, tmp_path / "backups", "restore", *snapshots, db=restored)
+
+    sids = [reset, deleted, archived]
+    assert _rows(restored, "sessions", sids, col="id") == _rows(app.SQLITE_PATH, "sessions", sids, col="id")
+    for table in ("participants", "decisions"):
+        assert _rows(restored, table, sids) == _rows(app.SQLITE_PATH, table, sids), table
+    assert _rows(restored, "sessions", [deleted], col="id") == []
+    assert _rows(restored, "decisions", [reset]) == []
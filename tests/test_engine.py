@@ -0,0 +1,68 @@
+import json
+import os
+
+import engine
+
+
+def _decisions(app, sid, r):
+    assert app.engines.log.flush()
+    return app.db().rows(
+        "SELECT choice, total_cost, payout, reveal FROM decisions WHERE session_id=%s AND round_number=%s",
+        (sid, r))
+
+
+def test_reveal_polled_before_last_decision(app, mode, new_session):
+    sid, (p1, p2) = new_session(group_size=2)
+    url = f"/reveal_status?session_id={sid}&round=1"
+
+    assert p1.post("/choose", json={"choice": "A"}).status_code == 200
+    early = p2.get(url)
+    assert early.status_code == 409
+    assert early.get_json()["err"] == "not_settled"
+    assert all(reveal != 1 for _, _, _, reveal in _decisions(app, sid, 1))
+
+    assert p2.post("/choose", json={"choice": "B"}).status_code == 200
+    body = p2.get(url).get_json()
+    assert body["phase"] == "watch"
+    assert sorted(pl["choice"] for pl in body["players"]) == ["A", "B"]
+    assert all(pl["payout"] is not None for pl in body["players"])
+
+    rows = _decisions(app, sid, 1)
+    assert len(rows) == 2
+    assert all(total is not None and payout is not None and reveal == 1
+               for _, total, payout, reveal in rows)
+    (current,) = {r for (r,) in app.db().rows(
+        "SELECT current_round FROM participants WHERE session_id=%s", (sid,))}
+    assert current == 2
+
+
+def test_open_phase_and_reveal_wait_for_settlement(app, new_session):
+    sid, _ = new_session(group_size=2)
+    eng = app.engines.get(sid, app.db)
+    pids = sorted(eng.participants)
+    now = app.utc_now()
+
+    eng.choose(pids[0], "A", now)
+    assert eng.open_phase(1, now) == (None, False)
+    assert eng.reveal(1) is False
+    assert 1 not in eng.phases
+
+    r, inserted, ends = eng.choose(pids[1], "B", now)
+    assert (r, inserted) == (1, True) and ends
+    ends_at, opened = eng.open_phase(1, now)
+    assert app.parse_iso_utc(ends_at) == ends and not opened
+    assert eng.reveal(1) is True
+    app.engines.drop(sid)
+
+
+def test_write_is_acknowledged_once_fsynced(tmp_path):
+    def unreachable():
+        raise ConnectionError("database down")
+
+    log = engine.EventLog(str(tmp_path), unreachable, interval=60)
+    seq = log.append({"t": "ready", "sid": "s", "pid": 1})
+    log.sync(seq, timeout=5)          # the database is not needed for the ack
+    with open(log.path, encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == [{"t": "ready", "sid": "s", "pid": 1}]
+    assert log.backlog() == 1
+    assert os.path.getsize(log.path) > 0
@@ -0,0 +1,51 @@
+import time
+
+
+def _count(app, table, sid):
+    (n,), = app.db().rows(f"SELECT COUNT(*) FROM {table} WHERE session_id=%s", (sid,))
+    return n
+
+
+def _wait_closed(app, sid):
+    for _ in range(200):
+        if sid not in app.closing_sessions:
+            return
+        time.sleep(0.02)
+    raise AssertionError(f"session {sid} still closing")
+
+
+def _play_round(app, sid, players):
+    for i, p in enumerate(players):
+        assert p.post("/choose", json={"choice": "AB"[i % 2]}).status_code == 200
+    assert app.engines.log.flush()
+
+
+def test_reset_purges_round_data(app, mode, admin, new_session):
+    sid, players = new_session(group_size=2)
+    _play_round(app, sid, players)
+    assert _count(app, "decisions", sid) == 2
+    assert _count(app, "round_phases", sid) == 1
+
+    assert admin.post("/admin/reset_session", data={"session_id": sid}).status_code == 302
+    _wait_closed(app, sid)
+    assert app.engines.log.flush()
+
+    for table in ("decisions", "game_events", "round_payouts", "round_phases"):
+        assert _count(app, table, sid) == 0, table
+    (status,), = app.db().rows("SELECT status FROM sessions WHERE id=%s", (sid,))
+    assert status is None
+    assert app.db().rows(
+        "SELECT DISTINCT joined, current_round FROM participants WHERE session_id=%s", (sid,)) == [(0, 1)]
+
+
+def test_delete_purges_session(app, mode, admin, new_session):
+    sid, players = new_session(group_size=2)
+    _play_round(app, sid, players)
+
+    assert admin.post("/admin/delete_session", data={"session_id": sid}).status_code == 302
+    _wait_closed(app, sid)
+    assert app.engines.log.flush()
+
+    assert _count(app, "participants", sid) == 0
+    assert _count(app, "decisions", sid) == 0
+    assert app.db().rows("SELECT id FROM sessions WHERE id=%s", (sid,)) == []
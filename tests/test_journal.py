@@ -0,0 +1,49 @@
+import logging
+
+import pytest
+
+import journal
+
+
+def test_failing_command_only_fails_its_caller(app, caplog):
+    sid = "journal-test"
+
+    def apply(cursor, ev):
+        if ev["bad"]:
+            raise ValueError("bad command")
+        return ev["n"]
+
+    committer = journal.GroupCommitter(app._connect_db, apply, max_batch=3, max_wait=1.0,
+                                       logger=logging.getLogger("test.journal"))
+    with caplog.at_level(logging.WARNING, logger="test.journal"):
+        futures = [committer.submit("test", sid, n=n, bad=(n == 1)) for n in range(3)]
+        assert futures[0].result(timeout=5) == 0
+        with pytest.raises(ValueError):
+            futures[1].result(timeout=5)
+        assert futures[2].result(timeout=5) == 2
+
+    stats = committer.stats()
+    assert stats["retries"] == 2
+    assert stats["batches"] == 2      # the two good commands, committed one by one
+    assert [r.levelname for r in caplog.records][:2] == ["WARNING", "WARNING"]
+    con = app._connect_db()
+    (n,), = con.rows("SELECT COUNT(*) FROM game_events WHERE session_id=%s", (sid,))
+    assert n == 2
+    con.execute("DELETE FROM game_events WHERE session_id=%s", (sid,))
+    con.commit()
+
+
+def test_writes_to_a_closing_session_are_discarded(app, new_session):
+    sid, (p1, p2) = new_session(group_size=2)
+    con = app._connect_db()
+    con.execute("UPDATE sessions SET status='resetting' WHERE id=%s", (sid,))
+    con.commit()
+    try:
+        assert p1.post("/choose", json={"choice": "A"}).get_json()["duplicate"] is True
+        (n,), = con.rows("SELECT COUNT(*) FROM decisions WHERE session_id=%s", (sid,))
+        assert n == 0
+        (n,), = con.rows("SELECT COUNT(*) FROM game_events WHERE session_id=%s AND kind='choose'", (sid,))
+        assert n == 0
+    finally:
+        con.execute("UPDATE sessions SET status=NULL WHERE id=%s", (sid,))
+        con.commit()
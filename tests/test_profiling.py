@@ -0,0 +1,18 @@
+import time
+
+
+def test_sample_runs_in_the_background(app, admin):
+    assert app.app.test_client().post("/admin/profile/sample").status_code == 403
+
+    t0 = time.monotonic()
+    r = admin.post("/admin/profile/sample?seconds=0.5&interval_ms=5")
+    assert r.status_code == 202 and time.monotonic() - t0 < 0.4
+    assert admin.post("/admin/profile/sample?seconds=1").status_code == 409
+    assert admin.get("/admin/profile/sample").status_code == 202
+
+    while app.stack_sampler.running:
+        time.sleep(0.05)
+    r = admin.get("/admin/profile/sample")
+    assert r.status_code == 200
+    assert int(r.headers["X-Profile-Samples"]) > 0
+    assert r.headers["Content-Disposition"].endswith(".folded")
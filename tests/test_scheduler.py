@@ -0,0 +1,27 @@
+import datetime
+import time
+
+
+def test_only_the_scheduling_process_fires(app, mode, new_session, monkeypatch):
+    published = []
+    monkeypatch.setattr(app.bus, "publish", lambda topic, **msg: published.append((topic, msg)))
+    sid, players = new_session(group_size=2)
+    for i, p in enumerate(players):
+        p.post("/choose", json={"choice": "AB"[i]})
+    assert players[0].get(f"/reveal_status?session_id={sid}&round=1").get_json()["phase"] == "watch"
+    assert app.engines.log.flush()
+    assert app.phase_scheduler.phase(sid, 1) == "watch"
+    assert not [t for t, _ in published if t.startswith("phase.")]
+
+    # Due now: the timer thread fires it and tells the other workers once.
+    app.phase_scheduler.schedule(sid, 1, datetime.datetime.now(datetime.timezone.utc))
+    for _ in range(100):
+        if app.phase_scheduler.phase(sid, 1) is None:
+            break
+        time.sleep(0.02)
+    assert [msg for t, msg in published if t == "phase.fired"] == [{"sid": sid, "r": 1}]
+    (phase,), = app.db().rows(
+        "SELECT phase FROM round_phases WHERE session_id=%s AND round_number=1", (sid,))
+    assert phase == "done"
+    # A second process reaching the same deadline finds nothing left to do.
+    assert app.PhaseScheduler()._fire(sid, 1) is False